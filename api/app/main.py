@@ -1,4 +1,5 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from fastapi.templating import Jinja2Templates
@@ -8,7 +9,19 @@ from routes.pharmacy_route import pharmacy_route
 from routes.product_route import product_route
 from routes.inventory_route import inventory_route
 from routes.advertisement_route import advertisement_route
-from utils.database import session
+from routes.image_route import image_route
+from routes.export_route import export_route
+from routes.debug_route import debug_route, check_debug_token
+from utils.database import dispose_engine, new_session
+from utils.images import shutdown_executor, load_derivatives
+from utils.geo import load_pharmacy_index
+from utils.suggest import load_product_index
+from utils.facets import load_category_index
+from utils.stock import stock_buffer
+from utils.profiler import profiler
+from utils.etag import conditional
+from utils.instrumentation import RequestMetrics
+from utils import metrics
 from utils.settings import Settings
 
 settings = Settings()
@@ -26,13 +39,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+app.add_middleware(RequestMetrics)
 
-app.include_router(user_route, prefix='/user', tags=['Users'])
-app.include_router(pharmacy_route, prefix='/pharmacy', tags=['Pharmacies'])
-app.include_router(product_route, prefix='/product', tags=['Products'])
-app.include_router(inventory_route, prefix='/inventory', tags=['Inventories'])
-app.include_router(advertisement_route, prefix='/advertisement', tags=['Advertisements'])
+app.include_router(user_route, prefix='/user', tags=['Users'], dependencies=[Depends(conditional('user', 'user', 'user_type'))])
+app.include_router(pharmacy_route, prefix='/pharmacy', tags=['Pharmacies'], dependencies=[Depends(conditional('pharmacy', 'pharmacy', 'pharmacy_image'))])
+app.include_router(product_route, prefix='/product', tags=['Products'], dependencies=[Depends(conditional('product', 'product', 'product_image', 'category_name', 'product_category', 'inventory', 'pharmacy'))])
+app.include_router(inventory_route, prefix='/inventory', tags=['Inventories'], dependencies=[Depends(conditional('inventory', 'inventory'))])
+app.include_router(advertisement_route, prefix='/advertisement', tags=['Advertisements'], dependencies=[Depends(conditional('advertisement', 'advertisement'))])
+app.include_router(image_route, prefix='/image', tags=['Images'])
+app.include_router(export_route, prefix='/export', tags=['Exports'])
+app.include_router(debug_route, prefix='/debug', tags=['Debug'], dependencies=[Depends(check_debug_token)])
 app.mount('/static', StaticFiles(directory='static'), name='static')
 templates = Jinja2Templates(directory='templates')
 
@@ -40,9 +58,25 @@ templates = Jinja2Templates(directory='templates')
 async def home(request : Request):
     return templates.TemplateResponse('index.html', { 'request' : request })
 
+@app.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    return metrics.render()
+
+@app.on_event("startup")
+async def startup_event():
+    load_derivatives()
+    await load_pharmacy_index()
+    await load_product_index()
+    await load_category_index()
+    stock_buffer.start()
+    profiler.start(new_session)
+
 @app.on_event("shutdown")
-def shutdown_event():
-    session.close()
+async def shutdown_event():
+    await stock_buffer.stop()
+    await profiler.stop()
+    await dispose_engine()
+    shutdown_executor()
 
 if __name__ == '__main__':
     uvicorn.run(
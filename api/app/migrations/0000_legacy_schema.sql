@@ -0,0 +1,23 @@
+DO $$
+BEGIN
+  IF to_regclass('pharmaguide.pharmacy_image') IS NOT NULL THEN
+    ALTER TABLE PharmaGuide.pharmacy_image ADD COLUMN IF NOT EXISTS digest VARCHAR(32);
+    UPDATE PharmaGuide.pharmacy_image SET digest = md5(name) WHERE digest IS NULL;
+    ALTER TABLE PharmaGuide.pharmacy_image ALTER COLUMN digest SET NOT NULL;
+  END IF;
+
+  IF to_regclass('pharmaguide.product_image') IS NOT NULL THEN
+    ALTER TABLE PharmaGuide.product_image ADD COLUMN IF NOT EXISTS digest VARCHAR(32);
+    UPDATE PharmaGuide.product_image SET digest = md5(name) WHERE digest IS NULL;
+    ALTER TABLE PharmaGuide.product_image ALTER COLUMN digest SET NOT NULL;
+  END IF;
+
+  IF to_regclass('pharmaguide.product') IS NOT NULL THEN
+    ALTER TABLE PharmaGuide.product ADD COLUMN IF NOT EXISTS search TSVECTOR GENERATED ALWAYS AS (
+      setweight(to_tsvector('simple', name), 'A') ||
+      setweight(to_tsvector('simple', code), 'A') ||
+      setweight(to_tsvector('spanish', coalesce(description, '')), 'B')
+    ) STORED;
+  END IF;
+END
+$$;
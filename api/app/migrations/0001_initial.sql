@@ -1,19 +1,15 @@
-drop schema if exists Pharmaguide CASCADE;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
-CREATE SCHEMA PharmaGuide;
+CREATE SCHEMA IF NOT EXISTS PharmaGuide;
 
-drop table if exists PharmaGuide.user_type;
-
-create table PharmaGuide.user_type (
+CREATE TABLE IF NOT EXISTS PharmaGuide.user_type (
   id INT not null generated by default as identity,
   user_type VARCHAR(32),
   
   constraint pk_uty primary key (id)
 );
 
-DROP TABLE IF EXISTS PharmaGuide.user;
-
-CREATE TABLE PharmaGuide.user (
+CREATE TABLE IF NOT EXISTS PharmaGuide.user (
   user_id INT NOT NULL GENERATED BY DEFAULT AS IDENTITY,
   name VARCHAR(50),
   username VARCHAR(50),
@@ -25,9 +21,7 @@ CREATE TABLE PharmaGuide.user (
   constraint fk_ut foreign key (type) references PharmaGuide.user_type (id)
 );
 
-DROP TABLE IF EXISTS PharmaGuide.pharmacy;
-
-CREATE TABLE PharmaGuide.pharmacy (
+CREATE TABLE IF NOT EXISTS PharmaGuide.pharmacy (
   pharmacy_id INT NOT NULL GENERATED BY DEFAULT AS IDENTITY,
   name VARCHAR(50) NOT NULL,
   address VARCHAR(100),
@@ -40,20 +34,19 @@ CREATE TABLE PharmaGuide.pharmacy (
   CONSTRAINT fk_u FOREIGN KEY (owner) REFERENCES PharmaGuide.user (user_id)
 );
 
-DROP TABLE IF EXISTS PharmaGuide.pharmacy_image;
-
-CREATE TABLE PharmaGuide.pharmacy_image (
+CREATE TABLE IF NOT EXISTS PharmaGuide.pharmacy_image (
   name VARCHAR(44) NOT NULL,
+  digest VARCHAR(32) NOT NULL,
   pharmacy_id INT NOT NULL,
   
   CONSTRAINT pk_pi PRIMARY KEY (name),
   CONSTRAINT fk_ph FOREIGN KEY (pharmacy_id) REFERENCES PharmaGuide.pharmacy (pharmacy_id)
 );
 
+CREATE INDEX IF NOT EXISTS ix_pi_digest ON PharmaGuide.pharmacy_image (digest);
 
-DROP TABLE IF EXISTS PharmaGuide.category_name;
 
-CREATE TABLE PharmaGuide.category_name (
+CREATE TABLE IF NOT EXISTS PharmaGuide.category_name (
   category_id INT NOT NULL GENERATED BY DEFAULT AS IDENTITY,
   name VARCHAR(50),
   
@@ -61,21 +54,25 @@ CREATE TABLE PharmaGuide.category_name (
 );
 
 
-DROP TABLE IF EXISTS PharmaGuide.product;
-
-CREATE TABLE PharmaGuide.product (
+CREATE TABLE IF NOT EXISTS PharmaGuide.product (
   product_id INT NOT NULL GENERATED BY DEFAULT AS IDENTITY,
   name VARCHAR(60) NOT NULL,
   code VARCHAR(12) NOT NULL,
   description VARCHAR(200),  
+  search TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', name), 'A') ||
+    setweight(to_tsvector('simple', code), 'A') ||
+    setweight(to_tsvector('spanish', coalesce(description, '')), 'B')
+  ) STORED,
   
   CONSTRAINT pk_prd PRIMARY KEY (product_id)
   );
 
+CREATE INDEX IF NOT EXISTS ix_prd_search ON PharmaGuide.product USING GIN (search);
+CREATE INDEX IF NOT EXISTS ix_prd_name_trgm ON PharmaGuide.product USING GIN (name gin_trgm_ops);
 
-DROP TABLE IF EXISTS PharmaGuide.product_category;
 
-CREATE TABLE PharmaGuide.product_category (
+CREATE TABLE IF NOT EXISTS PharmaGuide.product_category (
   category_id INT NOT NULL,
   product_id INT NOT NULL,
   
@@ -84,19 +81,18 @@ CREATE TABLE PharmaGuide.product_category (
   CONSTRAINT fk_pr FOREIGN KEY (product_id) REFERENCES PharmaGuide.product (product_id)
 );
 
-DROP TABLE IF EXISTS PharmaGuide.product_image;
-
-CREATE TABLE PharmaGuide.product_image (
+CREATE TABLE IF NOT EXISTS PharmaGuide.product_image (
   name VARCHAR(44) NOT NULL,
+  digest VARCHAR(32) NOT NULL,
   product_id INT NOT NULL,
   
   CONSTRAINT pk_pig PRIMARY KEY (name),
   CONSTRAINT fk_prd FOREIGN KEY (product_id) REFERENCES PharmaGuide.product (product_id)
 );
 
-DROP TABLE IF EXISTS PharmaGuide.inventory;
+CREATE INDEX IF NOT EXISTS ix_pig_digest ON PharmaGuide.product_image (digest);
 
-CREATE TABLE PharmaGuide.inventory (
+CREATE TABLE IF NOT EXISTS PharmaGuide.inventory (
   product_id INT NOT NULL,
   pharmacy_id INT NOT NULL,
   price DECIMAL not null,
@@ -107,9 +103,7 @@ CREATE TABLE PharmaGuide.inventory (
   CONSTRAINT fk_phy FOREIGN KEY (pharmacy_id) REFERENCES PharmaGuide.pharmacy (pharmacy_id)
 );
 
-DROP TABLE IF EXISTS PharmaGuide.advertisement;
-
-CREATE TABLE PharmaGuide.advertisement (
+CREATE TABLE IF NOT EXISTS PharmaGuide.advertisement (
   advertisement_id INT NOT NULL GENERATED BY DEFAULT AS IDENTITY,
   advertisement_title varchar(25) NOT NULL,
   advertisement_description varchar(50) NOT NULL,
@@ -118,4 +112,6 @@ CREATE TABLE PharmaGuide.advertisement (
   
   CONSTRAINT pk_a PRIMARY KEY (advertisement_id),
   CONSTRAINT fk_u FOREIGN KEY (owner) REFERENCES PharmaGuide.user (user_id)
-);
\ No newline at end of file
+);
+
+CREATE INDEX IF NOT EXISTS ix_a_image ON PharmaGuide.advertisement (advertisement_image);
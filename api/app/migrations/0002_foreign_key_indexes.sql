@@ -0,0 +1,8 @@
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_u_type ON PharmaGuide.user (type);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_p_owner ON PharmaGuide.pharmacy (owner);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_pi_pharmacy ON PharmaGuide.pharmacy_image (pharmacy_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_prd_code ON PharmaGuide.product (code);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_pc_category ON PharmaGuide.product_category (category_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_pig_product ON PharmaGuide.product_image (product_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_i_pharmacy ON PharmaGuide.inventory (pharmacy_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_a_owner ON PharmaGuide.advertisement (owner);
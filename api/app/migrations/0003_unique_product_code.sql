@@ -0,0 +1,2 @@
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ux_prd_code ON PharmaGuide.product (code);
+DROP INDEX CONCURRENTLY IF EXISTS PharmaGuide.ix_prd_code;
@@ -0,0 +1,26 @@
+CREATE TABLE IF NOT EXISTS PharmaGuide.table_version (
+  name VARCHAR(63) NOT NULL,
+  shard INT NOT NULL,
+  version BIGINT NOT NULL DEFAULT 1,
+
+  CONSTRAINT pk_tv PRIMARY KEY (name, shard)
+);
+
+CREATE OR REPLACE FUNCTION PharmaGuide.bump_table_version() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO PharmaGuide.table_version (name, shard) VALUES (TG_TABLE_NAME, pg_backend_pid() % 16)
+  ON CONFLICT (name, shard) DO UPDATE SET version = PharmaGuide.table_version.version + 1;
+  RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.user_type FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.user FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.pharmacy FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.pharmacy_image FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.category_name FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.product FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.product_category FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.product_image FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.inventory FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
+CREATE OR REPLACE TRIGGER tr_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON PharmaGuide.advertisement FOR EACH STATEMENT EXECUTE FUNCTION PharmaGuide.bump_table_version();
@@ -1,67 +1,72 @@
 from fastapi import APIRouter, Depends
 from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import HTTPException
+from typing import Optional
 from utils.models import Advertisement, User
-from utils.database import session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.database import get_session
+from utils.pagination import paginate
 from schemas.advertisement import AdvertisementResponse, AdvertisementCreate, AdvertisementUpdate
 from utils.images import save_image, remove_image
 
 advertisement_route = APIRouter()
-IMAGE_PATH = 'public/advertisements'
 
-async def check_owner(id):
+async def check_owner(session, id):
     if id != None:
-        db_owner = session.get(User, id)
+        db_owner = await session.get(User, id)
         if not db_owner:
             raise HTTPException(404, 'owner does not exist')
 
-async def check_advertisement(id):
-    db_advertisement = session.get(Advertisement, id)
+async def check_advertisement(session, id):
+    db_advertisement = await session.get(Advertisement, id)
     if not db_advertisement:
         raise HTTPException(404, 'advertisement does not exist')
     return db_advertisement
 
 @advertisement_route.get('/', response_class=JSONResponse, response_model=list[AdvertisementResponse])
-async def get_advertisements(skip : int = 0, limit : int = 100):
-    return session.query(Advertisement).offset(skip).limit(limit).all()
+async def get_advertisements(response : Response, skip : int = 0, limit : int = 100, cursor : Optional[str] = None, session : AsyncSession = Depends(get_session)):
+    return await paginate(session, select(Advertisement), [Advertisement.advertisement_id], response, skip, limit, cursor)
 
 @advertisement_route.get('/{id}', response_class=JSONResponse, response_model=AdvertisementResponse  )
-async def get_advertisement(id : int):
-    return await check_advertisement(id)
+async def get_advertisement(id : int, session : AsyncSession = Depends(get_session)):
+    return await check_advertisement(session, id)
 
 @advertisement_route.post('/', response_class=JSONResponse, response_model=AdvertisementResponse)
-async def create_advertisement(advertisement : AdvertisementCreate = Depends()):
-    await check_owner(advertisement.owner)
-    filename = await save_image(advertisement.file, IMAGE_PATH)
-    new_advertisement = Advertisement(
-        advertisement_title = advertisement.advertisement_title,
-        advertisement_description = advertisement.advertisement_description,
-        advertisement_image = filename,
-        owner = advertisement.owner
-    )
-    session.add(new_advertisement)
-    session.commit()
-    session.refresh(new_advertisement)
+async def create_advertisement(advertisement : AdvertisementCreate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_owner(session, advertisement.owner)
+    async with save_image(advertisement.file) as digest:
+        new_advertisement = Advertisement(
+            advertisement_title = advertisement.advertisement_title,
+            advertisement_description = advertisement.advertisement_description,
+            advertisement_image = digest,
+            owner = advertisement.owner
+        )
+        session.add(new_advertisement)
+        await session.commit()
+    await session.refresh(new_advertisement)
     return new_advertisement
 
 @advertisement_route.put('/{id}', response_class=JSONResponse)
-async def update_advertisement(id : int, new_advertisement: AdvertisementUpdate = Depends()):
-    await check_owner(new_advertisement.owner)
-    db_advertisement = await check_advertisement(id)
-    if new_advertisement.advertisement_image != None:
-        await remove_image(db_advertisement.advertisement_image, IMAGE_PATH)
-        new_advertisement.advertisement_image = await save_image(new_advertisement.advertisement_image, IMAGE_PATH)
-    advertisement_data = new_advertisement.dict(exclude_unset=True, exclude_none=True)
+async def update_advertisement(id : int, new_advertisement: AdvertisementUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_owner(session, new_advertisement.owner)
+    db_advertisement = await check_advertisement(session, id)
+    old_image = db_advertisement.advertisement_image
+    advertisement_data = new_advertisement.dict(exclude_unset=True, exclude_none=True, exclude={'advertisement_image'})
     for key, value in advertisement_data.items():
         setattr(db_advertisement, key, value)
-    session.add(db_advertisement)
-    session.commit()
-    session.refresh(db_advertisement)
+    async with save_image(new_advertisement.advertisement_image) as digest:
+        db_advertisement.advertisement_image = digest or old_image
+        session.add(db_advertisement)
+        await session.commit()
+    if db_advertisement.advertisement_image != old_image:
+        await remove_image(session, old_image)
+    await session.refresh(db_advertisement)
     return db_advertisement
 
 @advertisement_route.delete('/{id}', status_code=204, response_class=Response)
-async def delete_advertisement(id : int):
-    db_advertisement = await check_advertisement(id)
-    await remove_image(db_advertisement.advertisement_image, IMAGE_PATH)
-    session.delete(db_advertisement)
-    session.commit()
+async def delete_advertisement(id : int, session : AsyncSession = Depends(get_session)):
+    db_advertisement = await check_advertisement(session, id)
+    await session.delete(db_advertisement)
+    await session.commit()
+    await remove_image(session, db_advertisement.advertisement_image)
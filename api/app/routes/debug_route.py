@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import JSONResponse, Response
+from fastapi.exceptions import HTTPException
+from hmac import compare_digest
+from typing import Optional
+from utils.database import new_session
+from utils.profiler import profiler
+from utils.settings import Settings
+
+settings = Settings()
+debug_route = APIRouter()
+
+async def check_debug_token(x_debug_token : Optional[str] = Header(None)):
+    if not settings.DEBUG_TOKEN:
+        raise HTTPException(404, 'Not Found')
+    if x_debug_token == None or not compare_digest(x_debug_token.encode(), settings.DEBUG_TOKEN.encode()):
+        raise HTTPException(403, 'invalid debug token')
+
+@debug_route.get('/queries', response_class=JSONResponse)
+async def get_queries(limit : int = Query(100, gt=0, le=1000), route : Optional[str] = None, min_ms : float = Query(0, ge=0)):
+    return profiler.snapshot(limit, route, min_ms)
+
+@debug_route.put('/queries', response_class=JSONResponse)
+async def update_profiler(enabled : Optional[bool] = None, threshold_ms : Optional[float] = Query(None, ge=0), size : Optional[int] = Query(None, gt=0, le=100000)):
+    profiler.configure(enabled, threshold_ms / 1000 if threshold_ms != None else None, size)
+    return profiler.snapshot(0)
+
+@debug_route.post('/queries/explain', response_class=JSONResponse)
+async def explain_queries(top : int = Query(settings.PROFILER_EXPLAIN_TOP, gt=0, le=50)):
+    explained = await profiler.explain(new_session, top)
+    return { 'explained' : explained }
+
+@debug_route.delete('/queries', status_code=204, response_class=Response)
+async def clear_queries():
+    profiler.clear()
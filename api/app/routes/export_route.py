@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Path, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from utils.export import export_response
+
+export_route = APIRouter()
+
+@export_route.get('/{table}.ndjson', response_class=StreamingResponse)
+async def export_table(table : str = Path(regex='^(product|pharmacy|inventory)$'), include : Optional[str] = Query(None, regex='^[a-z]+(,[a-z]+)*$'), gzip : bool = False):
+    return export_response(table, include.split(',') if include else (), gzip)
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from fastapi.responses import FileResponse
+from fastapi.exceptions import HTTPException
+from typing import Optional
+from utils.images import image_path
+import re
+
+image_route = APIRouter()
+DIGEST = re.compile('^[0-9a-f]{32}$')
+
+@image_route.get('/{digest}', response_class=FileResponse)
+async def get_image(digest : str, w : Optional[int] = None):
+    if not DIGEST.match(digest):
+        raise HTTPException(404, 'image does not exist')
+    if w != None and w <= 0:
+        raise HTTPException(400, 'width must be positive')
+    path = await image_path(digest, w)
+    return FileResponse(path, media_type='image/webp', headers={ 'Cache-Control' : 'public, max-age=31536000, immutable' })
@@ -1,61 +1,109 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, UploadFile
 from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import HTTPException
-from utils.database import session
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.database import get_session
+from utils.pagination import paginate
 from utils.models import Inventory, Product, Pharmacy
-from schemas.inventory import InventoryCreate, InventoryUpdate, InventoryResponse
+from schemas.inventory import InventoryCreate, InventoryUpdate, InventoryResponse, InventoryImportResponse, InventoryBatchItem, InventoryBatchResult
+from utils.cache import availability_cache, cached_get
+from utils.loading import eager
+from schemas.product import ProductResponse
+from schemas.pharmacy import PharmacyResponse
+from utils.bulk import import_inventory, apply_inventory_changes
+from utils.stock import apply_delta, stock_buffer
+from utils.serialization import FAST_SERIALIZATION, inventory_page
 
 inventory_route = APIRouter()
 
-async def check_product_and_pharmacy(product_id, pharmacy_id, collision = True):
+async def check_product_and_pharmacy(session, product_id, pharmacy_id, collision = True):
     if product_id != None:
-        db_product = session.get(Product, product_id)
+        db_product = await cached_get(session, Product, ProductResponse, product_id, eager('get_product', Product.images))
         if not db_product:
             raise HTTPException(404, 'product does not exist')
     if pharmacy_id != None:
-        db_pharmacy = session.get(Pharmacy, pharmacy_id)
+        db_pharmacy = await cached_get(session, Pharmacy, PharmacyResponse, pharmacy_id, eager('get_pharmacy', Pharmacy.images))
         if not db_pharmacy:
             raise HTTPException(404, 'pharmacy does not exist')
-    if collision and session.get(Inventory, (product_id, pharmacy_id)):
+    if collision and await session.get(Inventory, (product_id, pharmacy_id)):
         raise HTTPException(400, 'this combination of keys already exists')
         
-async def check_inventory(product_id, pharmacy_id):
-    db_inventory = session.get(Inventory, (product_id, pharmacy_id))
+async def check_inventory(session, product_id, pharmacy_id):
+    db_inventory = await session.get(Inventory, (product_id, pharmacy_id))
     if not db_inventory:
         raise HTTPException(404, 'inventory does not exist')
     return db_inventory
 
 @inventory_route.get('/', response_class=JSONResponse, response_model=list[InventoryResponse])
-async def get_inventories(skip : int = 0, limit : int = 100):
-    return session.query(Inventory).offset(skip).limit(limit).all()
+async def get_inventories(response : Response, skip : int = 0, limit : int = 100, cursor : Optional[str] = None, session : AsyncSession = Depends(get_session)):
+    if FAST_SERIALIZATION:
+        return await inventory_page(session, response, skip, limit, cursor)
+    return await paginate(session, select(Inventory), [Inventory.product_id, Inventory.pharmacy_id], response, skip, limit, cursor)
 
 @inventory_route.get('/{product_id}', response_class=JSONResponse, response_model=InventoryResponse  )
-async def get_inventory(product_id : int, pharmacy_id : int):
-    return await check_inventory(product_id, pharmacy_id)
+async def get_inventory(product_id : int, pharmacy_id : int, session : AsyncSession = Depends(get_session)):
+    return await check_inventory(session, product_id, pharmacy_id)
 
 @inventory_route.post('/', response_class=JSONResponse, response_model=InventoryResponse)
-async def create_inventory(inventory : InventoryCreate = Depends()):
-    await check_product_and_pharmacy(inventory.product_id, inventory.pharmacy_id)
+async def create_inventory(inventory : InventoryCreate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_product_and_pharmacy(session, inventory.product_id, inventory.pharmacy_id)
     new_inventory = Inventory(**inventory.dict())
     session.add(new_inventory)
-    session.commit()
-    session.refresh(new_inventory)
+    await session.commit()
+    availability_cache.invalidate(new_inventory.product_id)
+    await session.refresh(new_inventory)
     return new_inventory
 
+@inventory_route.post('/import', response_class=JSONResponse, response_model=InventoryImportResponse)
+async def import_inventories(file : UploadFile, format : Optional[str] = Query(None, regex='^(csv|ndjson)$'), session : AsyncSession = Depends(get_session)):
+    if format == None:
+        format = 'ndjson' if (file.filename or '').lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+    report = await import_inventory(session, file, format)
+    if report['inserted'] or report['updated']:
+        availability_cache.clear()
+    return report
+
+@inventory_route.patch('/batch', response_class=JSONResponse, response_model=list[InventoryBatchResult])
+async def update_inventories(changes : list[InventoryBatchItem], upsert : bool = False, session : AsyncSession = Depends(get_session)):
+    results = await apply_inventory_changes(session, changes, upsert)
+    for product_id in { result['product_id'] for result in results if result['status'] in ('updated', 'inserted') }:
+        availability_cache.invalidate(product_id)
+    return results
+
+@inventory_route.patch('/{product_id}/stock', response_class=JSONResponse, response_model=InventoryResponse)
+async def update_stock(product_id : int, pharmacy_id : int, delta : int = Query(ge=-2 ** 31, le=2 ** 31 - 1), non_negative : bool = False, buffered : bool = False, session : AsyncSession = Depends(get_session)):
+    if buffered:
+        if non_negative:
+            raise HTTPException(400, 'non_negative cannot be used with buffered updates')
+        pending = stock_buffer.add(product_id, pharmacy_id, delta)
+        return JSONResponse({ 'product_id' : product_id, 'pharmacy_id' : pharmacy_id, 'pending' : pending }, status_code=202)
+    row = (await session.execute(apply_delta(product_id, pharmacy_id, delta, non_negative))).first()
+    if not row:
+        await check_inventory(session, product_id, pharmacy_id)
+        raise HTTPException(409, 'not enough stock')
+    await session.commit()
+    availability_cache.invalidate(product_id)
+    return row
+
 @inventory_route.put('/{current_product_id}', response_class=JSONResponse)
-async def update_inventory(current_product_id : int, current_pharmacy_id : int, new_inventory: InventoryUpdate = Depends()):
-    await check_product_and_pharmacy(new_inventory.product_id, new_inventory.pharmacy_id)
-    db_inventory = await check_inventory(current_product_id, current_pharmacy_id)
+async def update_inventory(current_product_id : int, current_pharmacy_id : int, new_inventory: InventoryUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_product_and_pharmacy(session, new_inventory.product_id, new_inventory.pharmacy_id)
+    db_inventory = await check_inventory(session, current_product_id, current_pharmacy_id)
     inventory_data = new_inventory.dict(exclude_unset=True, exclude_none=True)
     for key, value in inventory_data.items():
         setattr(db_inventory, key, value)
     session.add(db_inventory)
-    session.commit()
-    session.refresh(db_inventory)
+    await session.commit()
+    availability_cache.invalidate(current_product_id)
+    availability_cache.invalidate(db_inventory.product_id)
+    await session.refresh(db_inventory)
     return db_inventory
 
 @inventory_route.delete('/{product_id}', status_code=204, response_class=Response)
-async def delete_inventory(product_id : int, pharmacy_id : int):
-    db_inventory = await check_inventory(product_id, pharmacy_id)
-    session.delete(db_inventory)
-    session.commit()
+async def delete_inventory(product_id : int, pharmacy_id : int, session : AsyncSession = Depends(get_session)):
+    db_inventory = await check_inventory(session, product_id, pharmacy_id)
+    await session.delete(db_inventory)
+    await session.commit()
+    availability_cache.invalidate(product_id)
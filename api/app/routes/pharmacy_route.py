@@ -1,112 +1,162 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import HTTPException
-from utils.database import session
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.database import get_session
+from utils.pagination import paginate
+from utils.loading import eager
 from utils.models import Pharmacy, PharmacyImage, User, Inventory
-from schemas.pharmacy import PharmacyCreate, PharmacyResponse, PharmacyUpdate, PharmacyImageCreate, PharmacyImageResponse, PharmacyImageUpdate
+from schemas.pharmacy import PharmacyCreate, PharmacyResponse, PharmacyUpdate, PharmacyImageCreate, PharmacyImageResponse, PharmacyImageUpdate, PharmacyNearbyResponse, PharmacyBatchResponse
 from utils.images import save_image, remove_image
+from utils.geo import pharmacy_index
+from utils.batch import batch_ids, batch_response, cached_load_many
+from utils.cache import availability_cache, cached_get, invalidate
+from utils.serialization import FAST_SERIALIZATION, pharmacy_page, respond
+from uuid import uuid4
 
 pharmacy_route = APIRouter()
-IMAGE_PATH = 'public/pharmacies'
 
-async def check_pharmacy(id):
+async def check_pharmacy(session, id):
     if id != None:
-        pharmacy = session.get(Pharmacy, id)
+        pharmacy = await session.get(Pharmacy, id, options=eager('get_pharmacy', Pharmacy.images))
         if not pharmacy:
             raise HTTPException(404, 'pharmacy does not exist')
         return pharmacy
 
-async def check_pharmacy_img(id):
-    image = session.get(PharmacyImage, id)
+async def check_cached_pharmacy(session, id):
+    if id != None:
+        pharmacy = await cached_get(session, Pharmacy, PharmacyResponse, id, eager('get_pharmacy', Pharmacy.images))
+        if not pharmacy:
+            raise HTTPException(404, 'pharmacy does not exist')
+        return pharmacy
+
+async def check_pharmacy_img(session, id):
+    image = await session.get(PharmacyImage, id)
     if not image:
         raise HTTPException(404, 'pharmacy image does not exist')
     return image
 
-async def check_owner(id):
+async def check_owner(session, id):
     if id != None:
-        owner = session.get(User, id)
+        owner = await session.get(User, id)
         if not owner:
             raise HTTPException(404, 'owner does not exist')
 
 @pharmacy_route.get('/image', response_class=JSONResponse, response_model=list[PharmacyImageResponse])
-async def get_pharmacie_images(skip : int = 0, limit : int = 100):
-    return session.query(PharmacyImage).offset(skip).limit(limit).all()
+async def get_pharmacie_images(response : Response, skip : int = 0, limit : int = 100, cursor : Optional[str] = None, session : AsyncSession = Depends(get_session)):
+    return await paginate(session, select(PharmacyImage), [PharmacyImage.name], response, skip, limit, cursor)
 
 @pharmacy_route.get('/image/{id}', response_class=JSONResponse, response_model=PharmacyImageResponse)
-async def get_pharmacy_image(id : str):
-    return await check_pharmacy_img(id)
+async def get_pharmacy_image(id : str, session : AsyncSession = Depends(get_session)):
+    return await check_pharmacy_img(session, id)
 
 @pharmacy_route.post('/image', response_class=JSONResponse, response_model=PharmacyImageResponse)
-async def create_pharmacy_image(pharmacy_image : PharmacyImageCreate = Depends()):
-    await check_pharmacy(pharmacy_image.pharmacy_id)
-    filename = await save_image(pharmacy_image.name, dest=IMAGE_PATH)
-    new_image = PharmacyImage(name = filename, pharmacy_id = pharmacy_image.pharmacy_id)
-    session.add(new_image)
-    session.commit()
-    session.refresh(new_image)
+async def create_pharmacy_image(pharmacy_image : PharmacyImageCreate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_cached_pharmacy(session, pharmacy_image.pharmacy_id)
+    async with save_image(pharmacy_image.name) as digest:
+        new_image = PharmacyImage(name = str(uuid4()) + '.webp', digest = digest, pharmacy_id = pharmacy_image.pharmacy_id)
+        session.add(new_image)
+        await session.commit()
+    await invalidate(Pharmacy, new_image.pharmacy_id)
+    await session.refresh(new_image)
     return new_image
 
 @pharmacy_route.put('/image/{id}', response_class=JSONResponse)
-async def update_pharmacy_image(id : str, new_image: PharmacyImageUpdate = Depends()):
-    await check_pharmacy(new_image.pharmacy_id)
-    db_image = await check_pharmacy_img(id)
-    if new_image.name != None:
-        await remove_image(db_image.name, IMAGE_PATH)
-        new_image.name = await save_image(new_image.name, IMAGE_PATH)
-    image_data = new_image.dict(exclude_unset=True, exclude_none=True)
+async def update_pharmacy_image(id : str, new_image: PharmacyImageUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_cached_pharmacy(session, new_image.pharmacy_id)
+    db_image = await check_pharmacy_img(session, id)
+    old_digest, old_pharmacy_id = db_image.digest, db_image.pharmacy_id
+    image_data = new_image.dict(exclude_unset=True, exclude_none=True, exclude={'name'})
     for key, value in image_data.items():
         setattr(db_image, key, value)
-    session.add(db_image)
-    session.commit()
-    session.refresh(db_image)
+    async with save_image(new_image.name) as digest:
+        db_image.digest = digest or old_digest
+        session.add(db_image)
+        await session.commit()
+    await invalidate(Pharmacy, old_pharmacy_id, db_image.pharmacy_id)
+    if db_image.digest != old_digest:
+        await remove_image(session, old_digest)
+    await session.refresh(db_image)
     return db_image
 
 @pharmacy_route.delete('/image/{id}', status_code=204, response_class=Response)
-async def delete_pharmacy_image(id : str):
-    db_image = await check_pharmacy_img(id)
-    await remove_image(id, IMAGE_PATH)
-    session.delete(db_image)
-    session.commit()
+async def delete_pharmacy_image(id : str, session : AsyncSession = Depends(get_session)):
+    db_image = await check_pharmacy_img(session, id)
+    await session.delete(db_image)
+    await session.commit()
+    await invalidate(Pharmacy, db_image.pharmacy_id)
+    await remove_image(session, db_image.digest)
+
+@pharmacy_route.get('/nearby', response_class=JSONResponse, response_model=list[PharmacyNearbyResponse])
+async def get_nearby_pharmacies(lat : float = Query(ge=-90, le=90), lng : float = Query(ge=-180, le=180), radius : float = Query(5, gt=0, le=500), k : int = Query(10, gt=0, le=100), session : AsyncSession = Depends(get_session)):
+    hits = pharmacy_index.nearest(lat, lng, k, radius)
+    if not hits:
+        return []
+    statement = select(Pharmacy).where(Pharmacy.pharmacy_id.in_([id for _, id in hits])).options(*eager('get_nearby_pharmacies', Pharmacy.images))
+    pharmacies = { pharmacy.pharmacy_id : pharmacy for pharmacy in (await session.scalars(statement)).unique().all() }
+    return [
+        PharmacyNearbyResponse(**PharmacyResponse.from_orm(pharmacies[id]).dict(), distance=distance)
+        for distance, id in hits if id in pharmacies
+    ]
 
 @pharmacy_route.get('/', response_class=JSONResponse, response_model=list[PharmacyResponse])
-async def get_pharmacies(skip : int = 0, limit : int = 100):
-    return session.query(Pharmacy).offset(skip).limit(limit).all()
+async def get_pharmacies(response : Response, skip : int = 0, limit : int = 100, cursor : Optional[str] = None, session : AsyncSession = Depends(get_session)):
+    if FAST_SERIALIZATION:
+        return await pharmacy_page(session, response, skip, limit, cursor)
+    return await paginate(session, select(Pharmacy).options(*eager('get_pharmacies', Pharmacy.images)), [Pharmacy.pharmacy_id], response, skip, limit, cursor)
+
+@pharmacy_route.get('/batch', response_class=JSONResponse, response_model=PharmacyBatchResponse)
+async def get_pharmacy_batch(response : Response, ids : list[int] = Query(), session : AsyncSession = Depends(get_session)):
+    ids = batch_ids(ids)
+    batch = batch_response('pharmacies', ids, await cached_load_many(session, Pharmacy, PharmacyResponse, ids, eager('get_pharmacy', Pharmacy.images)))
+    if FAST_SERIALIZATION:
+        return respond(response, batch)
+    return batch
 
 @pharmacy_route.get('/{id}', response_class=JSONResponse, response_model=PharmacyResponse)
-async def get_pharmacy(id : int):
-    return await check_pharmacy(id)
+async def get_pharmacy(id : int, session : AsyncSession = Depends(get_session)):
+    return await check_cached_pharmacy(session, id)
 
 @pharmacy_route.post('/', response_class=JSONResponse, response_model=PharmacyResponse)
-async def create_pharmacy(pharmacy : PharmacyCreate = Depends()):
-    await check_owner(pharmacy.owner)
+async def create_pharmacy(pharmacy : PharmacyCreate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_owner(session, pharmacy.owner)
     new_pharmacy = Pharmacy(**pharmacy.dict())
     session.add(new_pharmacy)
-    session.commit()
-    session.refresh(new_pharmacy)
+    await session.commit()
+    await session.refresh(new_pharmacy)
+    pharmacy_index.add(new_pharmacy.pharmacy_id, new_pharmacy.lat, new_pharmacy.lng)
     return new_pharmacy
 
 @pharmacy_route.put('/{id}', response_class=JSONResponse)
-async def update_pharmacy(id : int, new_pharmacy: PharmacyUpdate = Depends()):
-    await check_owner(new_pharmacy.owner)
-    db_pharmacy = await check_pharmacy(id)
+async def update_pharmacy(id : int, new_pharmacy: PharmacyUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_owner(session, new_pharmacy.owner)
+    db_pharmacy = await check_pharmacy(session, id)
     pharmacy_data = new_pharmacy.dict(exclude_unset=True, exclude_none=True)
     for key, value in pharmacy_data.items():
         setattr(db_pharmacy, key, value)
     session.add(db_pharmacy)
-    session.commit()
-    session.refresh(db_pharmacy)
+    await session.commit()
+    await session.refresh(db_pharmacy)
+    pharmacy_index.add(db_pharmacy.pharmacy_id, db_pharmacy.lat, db_pharmacy.lng)
+    availability_cache.clear()
+    await invalidate(Pharmacy, id)
     return db_pharmacy
 
 @pharmacy_route.delete('/{id}', status_code=204, response_class=Response)
-async def delete_pharmacy(id : int):
-    db_pharmacy = await check_pharmacy(id)
-    inventory = session.query(Inventory).filter(Inventory.pharmacy_id == id).first()
+async def delete_pharmacy(id : int, session : AsyncSession = Depends(get_session)):
+    db_pharmacy = await check_pharmacy(session, id)
+    inventory = await session.scalar(select(Inventory).where(Inventory.pharmacy_id == id).limit(1))
     if inventory:
         raise HTTPException(400, 'cannot delete because this pharmacy has inventories')
-    imgs = session.query(PharmacyImage).filter(PharmacyImage.pharmacy_id == id).all()
+    imgs = (await session.scalars(select(PharmacyImage).where(PharmacyImage.pharmacy_id == id))).all()
+    for img in imgs:
+        await session.delete(img)
+    await session.delete(db_pharmacy)
+    await session.commit()
+    pharmacy_index.remove(id)
+    availability_cache.clear()
+    await invalidate(Pharmacy, id)
     for img in imgs:
-        await remove_image(img.name, IMAGE_PATH)
-        session.delete(img)
-        session.commit()
-    session.delete(db_pharmacy)
-    session.commit()
+        await remove_image(session, img.digest)
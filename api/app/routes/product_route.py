@@ -1,195 +1,330 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends, Query
 from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import HTTPException
-from utils.database import session
-from utils.models import Product, ProductImage, ProductCategory, Category, Inventory
-from schemas.product import ProductImageResponse, ProductImageCreate, ProductImageUpdate, ProductCreate, ProductUpdate, ProductResponse, CategoryCreate, CategoryResponse, CategoryUpdate, ProductCategoryCreate, ProductCategoryUpdate, ProductCategoryResponse
+from typing import Optional
+from sqlalchemy import select, null
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.database import get_session
+from utils.pagination import paginate
+from utils.loading import eager
+from utils.models import Product, ProductImage, ProductCategory, Category, Inventory, Pharmacy
+from schemas.product import ProductImageResponse, ProductImageCreate, ProductImageUpdate, ProductCreate, ProductUpdate, ProductResponse, CategoryCreate, CategoryResponse, CategoryUpdate, ProductCategoryCreate, ProductCategoryUpdate, ProductCategoryResponse, ProductAvailabilityResponse, ProductSearchResponse, ProductCodeLookupResponse, ProductSuggestion, ProductBatchResponse, ProductFacetsResponse
 from utils.images import save_image, remove_image
+from utils.geo import haversine_sql
+from utils.search import category_filter, product_search
+from utils.facets import category_index
+from utils.cache import availability_cache, cached_get, invalidate
+from utils.batch import batch_ids, batch_response, cached_load_many
+from utils.codes import find_by_code, forget_codes
+from utils.suggest import index_product, product_suggestions, unindex_product
+from utils.serialization import FAST_SERIALIZATION, product_page, respond
+from utils.settings import Settings
+from uuid import uuid4
 
+settings = Settings()
 product_route = APIRouter()
-IMAGE_PATH = 'public/products'
 
-async def check_product_and_category(p_id, c_id, collision = True):
-    if collision and session.get(ProductCategory, (p_id, c_id)):
+async def check_product_and_category(session, p_id, c_id, collision = True):
+    if collision and await session.get(ProductCategory, (p_id, c_id)):
         raise HTTPException(400, 'this combination of keys already exists')
 
-async def check_product_category(product_id, category_id):
-    category = session.get(ProductCategory, (product_id, category_id))
+async def check_product_category(session, product_id, category_id):
+    category = await session.get(ProductCategory, (product_id, category_id))
     if not category:
         raise HTTPException(404, 'product_category does not exist')
     return category
 
-async def check_product(id):
+async def check_product(session, id):
     if id != None:
-        product = session.get(Product, id)
+        product = await session.get(Product, id, options=eager('get_product', Product.images))
         if not product:
             raise HTTPException(404, 'product does not exist')
         return product
 
-async def check_category(id):
+async def check_cached_product(session, id):
     if id != None:
-        category = session.get(Category, id)
+        product = await cached_get(session, Product, ProductResponse, id, eager('get_product', Product.images))
+        if not product:
+            raise HTTPException(404, 'product does not exist')
+        return product
+
+async def check_code(session, code, id = None):
+    if code != None:
+        existing = await session.scalar(select(Product.product_id).where(Product.code == code))
+        if existing != None and existing != id:
+            raise HTTPException(400, 'a product with this code already exists')
+
+async def check_category(session, id):
+    if id != None:
+        category = await session.get(Category, id)
         if not category:
             raise HTTPException(404, 'category does not exist')
         return category
 
-async def check_img(id):
-    product_image = session.get(ProductImage, id)
+async def check_cached_category(session, id):
+    if id != None:
+        category = await cached_get(session, Category, CategoryResponse, id)
+        if not category:
+            raise HTTPException(404, 'category does not exist')
+        return category
+
+async def check_img(session, id):
+    product_image = await session.get(ProductImage, id)
     if not product_image:
         raise HTTPException(404, 'image does not exist')
     return product_image
 
 @product_route.get('/product_category', response_class=JSONResponse, response_model=list[ProductCategoryResponse])
-async def get_product_categories(skip : int = 0, limit : int = 100):
-    return session.query(ProductCategory).offset(skip).limit(limit).all()
+async def get_product_categories(response : Response, skip : int = 0, limit : int = 100, cursor : Optional[str] = None, session : AsyncSession = Depends(get_session)):
+    return await paginate(session, select(ProductCategory), [ProductCategory.product_id, ProductCategory.category_id], response, skip, limit, cursor)
 
 @product_route.get('/product_category/{product_id}', response_class=JSONResponse, response_model=ProductCategoryResponse  )
-async def get_product_category(product_id : int, category_id):
-   return await check_product_category(product_id, category_id)
+async def get_product_category(product_id : int, category_id, session : AsyncSession = Depends(get_session)):
+   return await check_product_category(session, product_id, category_id)
 
 @product_route.post('/product_category', response_class=JSONResponse, response_model=ProductCategoryResponse)
-async def create_product_category(product_category : ProductCategoryCreate = Depends()):
-    await check_product_and_category(product_category.product_id, product_category.category_id)
-    await check_category(product_category.category_id)
-    await check_product(product_category.product_id)
+async def create_product_category(product_category : ProductCategoryCreate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_product_and_category(session, product_category.product_id, product_category.category_id)
+    await check_cached_category(session, product_category.category_id)
+    await check_cached_product(session, product_category.product_id)
     new_product_category = ProductCategory(**product_category.dict())
     session.add(new_product_category)
-    session.commit()
-    session.refresh(new_product_category)
+    await session.commit()
+    category_index.add(new_product_category.category_id, new_product_category.product_id)
+    await session.refresh(new_product_category)
     return new_product_category
 
 @product_route.put('/product_category/{current_product_id}', response_class=JSONResponse)
-async def update_product_category(current_product_id : int, current_category_id : int, new_product_category: ProductCategoryUpdate = Depends()):
-    db_product_category = await check_product_category(current_product_id, current_category_id)
-    await check_product_and_category(new_product_category.product_id, new_product_category.category_id)
-    await check_category(new_product_category.category_id)
-    await check_product(new_product_category.product_id)
+async def update_product_category(current_product_id : int, current_category_id : int, new_product_category: ProductCategoryUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    db_product_category = await check_product_category(session, current_product_id, current_category_id)
+    await check_product_and_category(session, new_product_category.product_id, new_product_category.category_id)
+    await check_cached_category(session, new_product_category.category_id)
+    await check_cached_product(session, new_product_category.product_id)
     product_category_data = new_product_category.dict(exclude_unset=True, exclude_none=True)
     for key, value in product_category_data.items():
         setattr(db_product_category, key, value)
     session.add(db_product_category)
-    session.commit()
-    session.refresh(db_product_category)
+    await session.commit()
+    category_index.remove(current_category_id, current_product_id)
+    category_index.add(db_product_category.category_id, db_product_category.product_id)
+    await session.refresh(db_product_category)
     return db_product_category
 
 @product_route.delete('/product_category/{product_id}', status_code=204, response_class=Response)
-async def delete_product_category(product_id : int, category_id : int):
-    db_product_category = await check_product_category(product_id, category_id)
-    session.delete(db_product_category)
-    session.commit()
+async def delete_product_category(product_id : int, category_id : int, session : AsyncSession = Depends(get_session)):
+    db_product_category = await check_product_category(session, product_id, category_id)
+    await session.delete(db_product_category)
+    await session.commit()
+    category_index.remove(category_id, product_id)
 
 @product_route.get('/category', response_class=JSONResponse, response_model=list[CategoryResponse])
-async def get_categories(skip : int = 0, limit : int = 100):
-    return session.query(Category).offset(skip).limit(limit).all()
+async def get_categories(response : Response, skip : int = 0, limit : int = 100, cursor : Optional[str] = None, session : AsyncSession = Depends(get_session)):
+    return await paginate(session, select(Category), [Category.category_id], response, skip, limit, cursor)
 
 @product_route.get('/category/{id}', response_class=JSONResponse, response_model=CategoryResponse  )
-async def get_category(id : int):
-    return await check_category(id)
+async def get_category(id : int, session : AsyncSession = Depends(get_session)):
+    return await check_cached_category(session, id)
 
 @product_route.post('/category', response_class=JSONResponse, response_model=CategoryResponse)
-async def create_category(category : CategoryCreate = Depends()):
+async def create_category(category : CategoryCreate = Depends(), session : AsyncSession = Depends(get_session)):
     new_category = Category(**category.dict())
     session.add(new_category)
-    session.commit()
-    session.refresh(new_category)
+    await session.commit()
+    await session.refresh(new_category)
     return new_category
 
 @product_route.put('/category/{id}', response_class=JSONResponse)
-async def update_category(id : int, new_category: CategoryUpdate = Depends()):
-    db_category = await check_category(id)
+async def update_category(id : int, new_category: CategoryUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    db_category = await check_category(session, id)
     category_data = new_category.dict(exclude_unset=True, exclude_none=True)
     for key, value in category_data.items():
         setattr(db_category, key, value)
     session.add(db_category)
-    session.commit()
-    session.refresh(db_category)
+    await session.commit()
+    await invalidate(Category, id)
+    await session.refresh(db_category)
     return db_category
 
 @product_route.delete('/category/{id}', status_code=204, response_class=Response)
-async def delete_category(id : int):
-    if session.query(ProductCategory).filter(ProductCategory.category_id == id).first():
+async def delete_category(id : int, session : AsyncSession = Depends(get_session)):
+    if await session.scalar(select(ProductCategory).where(ProductCategory.category_id == id).limit(1)):
         raise HTTPException(400, 'cannot delete because it has relationship in product_category table')
-    db_category = await check_category(id)
-    session.delete(db_category)
-    session.commit()
+    db_category = await check_category(session, id)
+    await session.delete(db_category)
+    await session.commit()
+    await invalidate(Category, id)
 
 @product_route.get('/image', response_class=JSONResponse, response_model=list[ProductImageResponse])
-async def get_product_images(skip : int = 0, limit : int = 100):
-    return session.query(ProductImage).offset(skip).limit(limit).all()
+async def get_product_images(response : Response, skip : int = 0, limit : int = 100, cursor : Optional[str] = None, session : AsyncSession = Depends(get_session)):
+    return await paginate(session, select(ProductImage), [ProductImage.name], response, skip, limit, cursor)
 
 @product_route.get('/image/{id}', response_class=JSONResponse, response_model=ProductImageResponse)
-async def get_product_image(id : str):
-    return await check_img(id)
+async def get_product_image(id : str, session : AsyncSession = Depends(get_session)):
+    return await check_img(session, id)
 
 @product_route.post('/image', response_class=JSONResponse, response_model=ProductImageResponse)
-async def create_product_image(product_image : ProductImageCreate = Depends()):
-    await check_product(product_image.product_id)
-    filename = await save_image(product_image.name, dest=IMAGE_PATH)
-    new_image = ProductImage(name = filename, product_id = product_image.product_id)
-    session.add(new_image)
-    session.commit()
-    session.refresh(new_image)
+async def create_product_image(product_image : ProductImageCreate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_cached_product(session, product_image.product_id)
+    async with save_image(product_image.name) as digest:
+        new_image = ProductImage(name = str(uuid4()) + '.webp', digest = digest, product_id = product_image.product_id)
+        session.add(new_image)
+        await session.commit()
+    await invalidate(Product, new_image.product_id)
+    await session.refresh(new_image)
     return new_image
 
 @product_route.put('/image/{id}', response_class=JSONResponse)
-async def update_product_image(id : str, new_image: ProductImageUpdate = Depends()):
-    db_image = await check_img(id)
-    if new_image.name != None:
-        await remove_image(db_image.name, IMAGE_PATH)
-        new_image.name = await save_image(new_image.name, IMAGE_PATH)
-    image_data = new_image.dict(exclude_unset=True, exclude_none=True)
+async def update_product_image(id : str, new_image: ProductImageUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    db_image = await check_img(session, id)
+    old_digest, old_product_id = db_image.digest, db_image.product_id
+    image_data = new_image.dict(exclude_unset=True, exclude_none=True, exclude={'name'})
     for key, value in image_data.items():
         setattr(db_image, key, value)
-    session.add(db_image)
-    session.commit()
-    session.refresh(db_image)
+    async with save_image(new_image.name) as digest:
+        db_image.digest = digest or old_digest
+        session.add(db_image)
+        await session.commit()
+    await invalidate(Product, old_product_id, db_image.product_id)
+    if db_image.digest != old_digest:
+        await remove_image(session, old_digest)
+    await session.refresh(db_image)
     return db_image
 
 @product_route.delete('/image/{id}', status_code=204, response_class=Response)
-async def delete_product_image(id : str):
-    db_image = await check_img(id)
-    await remove_image(id, IMAGE_PATH)
-    session.delete(db_image)
-    session.commit()
+async def delete_product_image(id : str, session : AsyncSession = Depends(get_session)):
+    db_image = await check_img(session, id)
+    await session.delete(db_image)
+    await session.commit()
+    await invalidate(Product, db_image.product_id)
+    await remove_image(session, db_image.digest)
 
 @product_route.get('/', response_class=JSONResponse, response_model=list[ProductResponse])
-async def get_products(skip : int = 0, limit : int = 100):
-    return session.query(Product).offset(skip).limit(limit).all()
+async def get_products(response : Response, skip : int = 0, limit : int = 100, cursor : Optional[str] = None, category : Optional[list[int]] = Query(None), match : str = Query('any', regex='^(all|any)$'), session : AsyncSession = Depends(get_session)):
+    filters = [category_filter(category, match)] if category else []
+    if FAST_SERIALIZATION:
+        return await product_page(session, response, skip, limit, cursor, filters)
+    return await paginate(session, select(Product).where(*filters).options(*eager('get_products', Product.images)), [Product.product_id], response, skip, limit, cursor)
+
+@product_route.get('/facets', response_class=JSONResponse, response_model=ProductFacetsResponse)
+async def get_product_facets(response : Response, category : Optional[list[int]] = Query(None), match : str = Query('any', regex='^(all|any)$')):
+    facets = category_index.facets(category, match)
+    if FAST_SERIALIZATION:
+        return respond(response, facets)
+    return facets
+
+@product_route.get('/search', response_class=JSONResponse, response_model=list[ProductSearchResponse])
+async def search_products(q : str = Query(min_length=1, max_length=100), category : Optional[list[int]] = Query(None), limit : int = Query(20, gt=0, le=100), session : AsyncSession = Depends(get_session)):
+    statement = product_search(q, category, limit, eager('search_products', Product.images))
+    return [
+        ProductSearchResponse(**ProductResponse.from_orm(product).dict(), rank=rank)
+        for product, rank in (await session.execute(statement)).unique().all()
+    ]
+
+@product_route.get('/suggest', response_class=JSONResponse, response_model=list[ProductSuggestion])
+async def suggest_products(response : Response, prefix : str = Query(min_length=1, max_length=60), limit : int = Query(10, gt=0, le=50)):
+    suggestions = await product_suggestions(prefix, limit)
+    if FAST_SERIALIZATION:
+        return respond(response, suggestions)
+    return suggestions
+
+@product_route.get('/by-code/{code}', response_class=JSONResponse, response_model=ProductResponse)
+async def get_product_by_code(code : str, session : AsyncSession = Depends(get_session)):
+    products = await find_by_code(session, [code], ProductResponse, eager('get_product', Product.images))
+    if code not in products:
+        raise HTTPException(404, 'product does not exist')
+    return products[code]
+
+@product_route.post('/by-code', response_class=JSONResponse, response_model=ProductCodeLookupResponse)
+async def get_products_by_code(response : Response, codes : list[str] = Body(), session : AsyncSession = Depends(get_session)):
+    if len(codes) > settings.CODE_BATCH_MAX:
+        raise HTTPException(400, f'a batch can have at most {settings.CODE_BATCH_MAX} codes')
+    codes = list(dict.fromkeys(codes))
+    products = await find_by_code(session, codes, ProductResponse, eager('get_products', Product.images))
+    lookup = batch_response('products', codes, products)
+    if FAST_SERIALIZATION:
+        return respond(response, lookup)
+    return lookup
+
+@product_route.get('/batch', response_class=JSONResponse, response_model=ProductBatchResponse)
+async def get_product_batch(response : Response, ids : list[int] = Query(), session : AsyncSession = Depends(get_session)):
+    ids = batch_ids(ids)
+    batch = batch_response('products', ids, await cached_load_many(session, Product, ProductResponse, ids, eager('get_product', Product.images)))
+    if FAST_SERIALIZATION:
+        return respond(response, batch)
+    return batch
 
 @product_route.get('/{id}', response_class=JSONResponse, response_model=ProductResponse)
-async def get_product(id : int):
-    return await check_product(id)
+async def get_product(id : int, session : AsyncSession = Depends(get_session)):
+    return await check_cached_product(session, id)
+
+@product_route.get('/{id}/availability', response_class=JSONResponse, response_model=list[ProductAvailabilityResponse])
+async def get_product_availability(id : int, lat : Optional[float] = Query(None, ge=-90, le=90), lng : Optional[float] = Query(None, ge=-180, le=180), sort : str = Query('price', regex='^(price|distance)$'), limit : int = Query(50, gt=0, le=500), session : AsyncSession = Depends(get_session)):
+    if (lat == None) != (lng == None):
+        raise HTTPException(400, 'lat and lng must be sent together')
+    if sort == 'distance' and lat == None:
+        raise HTTPException(400, 'sorting by distance requires lat and lng')
+    params = (lat, lng, sort, limit)
+    availability = availability_cache.get(id, params)
+    if availability != None:
+        return availability
+    distance = haversine_sql(Pharmacy.lat, Pharmacy.lng, lat, lng) if lat != None else null()
+    order = [Inventory.price, distance] if sort == 'price' else [distance, Inventory.price]
+    statement = (
+        select(Pharmacy.pharmacy_id, Pharmacy.name, Pharmacy.address, Pharmacy.lat, Pharmacy.lng, Pharmacy.contact, Inventory.price, Inventory.stock, distance.label('distance'))
+        .join(Inventory, Inventory.pharmacy_id == Pharmacy.pharmacy_id)
+        .where(Inventory.product_id == id, Inventory.stock > 0)
+        .order_by(*(order if lat != None else order[:1]), Pharmacy.pharmacy_id)
+        .limit(limit)
+    )
+    availability = [dict(row._mapping) for row in await session.execute(statement)]
+    if not availability:
+        await check_cached_product(session, id)
+    availability_cache.set(id, params, availability)
+    return availability
 
 @product_route.post('/', response_class=JSONResponse, response_model=ProductResponse)
-async def create_product(product : ProductCreate = Depends()):
+async def create_product(product : ProductCreate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_code(session, product.code)
     new_product = Product(**product.dict())
     session.add(new_product)
-    session.commit()
-    session.refresh(new_product)
+    await session.commit()
+    forget_codes(new_product.code)
+    index_product(new_product)
+    category_index.add_product(new_product.product_id)
+    await session.refresh(new_product)
     return new_product
 
 @product_route.put('/{id}', response_class=JSONResponse)
-async def update_product(id : int, new_product: ProductUpdate = Depends()):
-    db_product = await check_product(id)
+async def update_product(id : int, new_product: ProductUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    db_product = await check_product(session, id)
+    await check_code(session, new_product.code, id)
+    old_code = db_product.code
     product_data = new_product.dict(exclude_unset=True, exclude_none=True)
     for key, value in product_data.items():
         setattr(db_product, key, value)
     session.add(db_product)
-    session.commit()
-    session.refresh(db_product)
+    await session.commit()
+    await invalidate(Product, id)
+    forget_codes(old_code, db_product.code)
+    index_product(db_product)
+    await session.refresh(db_product)
     return db_product
 
 @product_route.delete('/{id}', status_code=204, response_class=Response)
-async def delete_product(id : int):
-    db_product = await check_product(id)
-    if session.query(Inventory).filter(Inventory.product_id == id).first():
+async def delete_product(id : int, session : AsyncSession = Depends(get_session)):
+    db_product = await check_product(session, id)
+    if await session.scalar(select(Inventory).where(Inventory.product_id == id).limit(1)):
         raise HTTPException(400, 'cannot delete because this product is in inventories')
-    if session.query(ProductCategory).filter(ProductCategory.product_id == id).first():
+    if await session.scalar(select(ProductCategory).where(ProductCategory.product_id == id).limit(1)):
         raise HTTPException(400, 'cannot delete because this product is in product_category')
-    imgs = session.query(ProductImage).filter(ProductImage.product_id == id).all()
+    imgs = (await session.scalars(select(ProductImage).where(ProductImage.product_id == id))).all()
+    for img in imgs:
+        await session.delete(img)
+    await session.delete(db_product)
+    await session.commit()
+    await invalidate(Product, id)
+    forget_codes(db_product.code)
+    unindex_product(id)
+    category_index.remove_product(id)
     for img in imgs:
-        await remove_image(img.name, IMAGE_PATH)
-        session.delete(img)
-        session.commit()
-    session.delete(db_product)
-    session.commit()
+        await remove_image(session, img.digest)
@@ -1,95 +1,116 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import HTTPException
-from utils.database import session
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.database import get_session
+from utils.pagination import paginate
+from utils.loading import eager
 from utils.models import User, UserType, Advertisement, Pharmacy
-from schemas.user import UserCreate, UserResponse, UserTypeResponse, UserTypeCreate, UserTypeUpdate, UserUpdate
+from schemas.user import UserCreate, UserResponse, UserTypeResponse, UserTypeCreate, UserTypeUpdate, UserUpdate, UserBatchResponse
+from utils.batch import batch_ids, batch_response, load_many
+from utils.cache import cached_get, invalidate
 
 user_route = APIRouter()
 
-async def check_type(id):
+async def check_type(session, id):
     if id != None:
-        type = session.get(UserType, id)
+        type = await session.get(UserType, id)
         if not type:
             raise HTTPException(404, 'could not find type')
         return type
 
-async def check_user(id):
-    user = session.get(User, id)
+async def check_cached_type(session, id):
+    if id != None:
+        type = await cached_get(session, UserType, UserTypeResponse, id)
+        if not type:
+            raise HTTPException(404, 'could not find type')
+        return type
+
+async def check_user(session, id):
+    user = await session.get(User, id, options=eager('get_user', User.user_type))
     if not user:
         raise HTTPException(404, 'user not found')
     return user
 
 @user_route.get('/type', response_class=JSONResponse, response_model=list[UserTypeResponse])
-async def get_user_types(skip : int = 0, limit : int = 100):
-    return session.query(UserType).offset(skip).limit(limit).all()
+async def get_user_types(response : Response, skip : int = 0, limit : int = 100, cursor : Optional[str] = None, session : AsyncSession = Depends(get_session)):
+    return await paginate(session, select(UserType), [UserType.id], response, skip, limit, cursor)
 
 @user_route.get('/type/{id}', response_class=JSONResponse, response_model=UserTypeResponse  )
-async def get_user_type(id : int):
-    return await check_type(id)
+async def get_user_type(id : int, session : AsyncSession = Depends(get_session)):
+    return await check_cached_type(session, id)
 
 @user_route.post('/type', response_class=JSONResponse, response_model=UserTypeResponse)
-async def create_user_type(type : UserTypeCreate = Depends()):
+async def create_user_type(type : UserTypeCreate = Depends(), session : AsyncSession = Depends(get_session)):
     new_type = UserType(**type.dict())
     session.add(new_type)
-    session.commit()
-    session.refresh(new_type)
+    await session.commit()
+    await session.refresh(new_type)
     return new_type
 
 @user_route.put('/type/{id}', response_class=JSONResponse)
-async def update_user_type(id : int, new_type: UserTypeUpdate = Depends()):
-    db_type = await check_type(id)
+async def update_user_type(id : int, new_type: UserTypeUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    db_type = await check_type(session, id)
     type_data = new_type.dict(exclude_unset=True, exclude_none=True)
     for key, value in type_data.items():
         setattr(db_type, key, value)
     session.add(db_type)
-    session.commit()
-    session.refresh(db_type)
+    await session.commit()
+    await invalidate(UserType, id)
+    await session.refresh(db_type)
     return db_type
 
 @user_route.delete('/type/{id}', status_code=204, response_class=Response)
-async def delete_user_type(id : int):
-    db_user_type = check_type(id)
-    if session.query(User).filter(User.type == id).first():
+async def delete_user_type(id : int, session : AsyncSession = Depends(get_session)):
+    db_user_type = await check_type(session, id)
+    if await session.scalar(select(User).where(User.type == id).limit(1)):
         raise HTTPException(400, 'cannot remove because it still has relationship with users')
-    session.delete(db_user_type)
-    session.commit()
+    await session.delete(db_user_type)
+    await session.commit()
+    await invalidate(UserType, id)
 
 @user_route.get('/', response_class=JSONResponse, response_model=list[UserResponse])
-async def get_users(skip: int = 0, limit : int = 100): 
-    return session.query(User).offset(skip).limit(limit).all()
+async def get_users(response : Response, skip: int = 0, limit : int = 100, cursor : Optional[str] = None, session : AsyncSession = Depends(get_session)): 
+    return await paginate(session, select(User).options(*eager('get_users', User.user_type)), [User.user_id], response, skip, limit, cursor)
+
+@user_route.get('/batch', response_class=JSONResponse, response_model=UserBatchResponse)
+async def get_user_batch(ids : list[int] = Query(), session : AsyncSession = Depends(get_session)):
+    ids = batch_ids(ids)
+    return batch_response('users', ids, await load_many(session, User, UserResponse, ids, eager('get_user', User.user_type)))
 
 @user_route.get('/{id}', response_class=JSONResponse, response_model=UserResponse)
-async def get_user(id : int): 
-    return await check_user(id)
+async def get_user(id : int, session : AsyncSession = Depends(get_session)): 
+    return await check_user(session, id)
 
 @user_route.post('/', response_class=JSONResponse, response_model=UserResponse)
-async def create_user(user : UserCreate = Depends()):
-    await check_type(user.type)
+async def create_user(user : UserCreate = Depends(), session : AsyncSession = Depends(get_session)):
+    await check_cached_type(session, user.type)
     new_user = User(**user.dict())
     session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    await session.commit()
+    await session.refresh(new_user)
     return new_user
 
 @user_route.put('/{id}', response_class=JSONResponse)
-async def update_user(id : int, new_user : UserUpdate = Depends()):
-    db_user = await check_user(id)
-    await check_type(new_user.type)
+async def update_user(id : int, new_user : UserUpdate = Depends(), session : AsyncSession = Depends(get_session)):
+    db_user = await check_user(session, id)
+    await check_cached_type(session, new_user.type)
     user_data = new_user.dict(exclude_unset=True, exclude_none=True)
     for key, value in user_data.items():
         setattr(db_user, key, value)
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    await session.refresh(db_user)
     return db_user
 
 @user_route.delete('/{id}', response_class=Response, status_code=204)
-async def delete_user(id : int):
-    db_user = await check_user(id)
-    if session.query(Advertisement).filter(Advertisement.owner == id).first():
+async def delete_user(id : int, session : AsyncSession = Depends(get_session)):
+    db_user = await check_user(session, id)
+    if await session.scalar(select(Advertisement).where(Advertisement.owner == id).limit(1)):
         raise HTTPException(400, 'cannot delete user because it has advertisements')
-    if session.query(Pharmacy).filter(Pharmacy.owner == id).first():
+    if await session.scalar(select(Pharmacy).where(Pharmacy.owner == id).limit(1)):
         raise HTTPException(400, 'cannot delete user because it has pharmacies')
-    session.delete(db_user)
-    session.commit()
+    await session.delete(db_user)
+    await session.commit()
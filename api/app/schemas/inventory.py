@@ -25,3 +25,30 @@ class InventoryResponse(InventoryBase):
     class Config:
         orm_mode = True
 
+
+class InventoryBatchItem(BaseModel):
+    product_id : int
+    pharmacy_id : int
+    price : Optional[float] = None
+    stock : Optional[int] = None
+
+
+class InventoryBatchResult(BaseModel):
+    product_id : int
+    pharmacy_id : int
+    status : str
+    price : Optional[float] = None
+    stock : Optional[int] = None
+
+
+class InventoryImportError(BaseModel):
+    line : int
+    error : str
+
+
+class InventoryImportResponse(BaseModel):
+    received : int
+    inserted : int
+    updated : int
+    rejected : int
+    errors : list[InventoryImportError]
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from fastapi import UploadFile
 from typing import Optional
+from utils.images import image_variants
 
 class PharmacyImageBase(BaseModel):
     pass
@@ -19,6 +20,12 @@ class PharmacyImageUpdate(PharmacyImageBase):
 class PharmacyImageResponse(PharmacyImageBase):
     pharmacy_id : int
     name : str
+    digest : str
+    variants : dict[str, str] = {}
+
+    @validator('variants', always=True)
+    def build_variants(cls, value, values):
+        return image_variants(values.get('digest', ''))
 
     class Config:
         orm_mode = True
@@ -52,3 +59,12 @@ class PharmacyResponse(PharmacyBase):
 
     class Config:
         orm_mode = True
+
+
+class PharmacyNearbyResponse(PharmacyResponse):
+    distance : float
+
+
+class PharmacyBatchResponse(BaseModel):
+    pharmacies : list[PharmacyResponse]
+    missing : list[int]
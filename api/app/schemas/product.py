@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 from fastapi import UploadFile
 from typing import Optional
+from utils.images import image_variants
 
 class CategoryBase(BaseModel):
     name : str
@@ -26,7 +27,7 @@ class ProductImageBase(BaseModel):
 
 
 class ProductImageCreate(ProductImageBase):
-    product_id : str
+    product_id : int
     name : UploadFile
 
 
@@ -38,6 +39,12 @@ class ProductImageUpdate(ProductImageBase):
 class ProductImageResponse(ProductImageBase):
     product_id : int
     name : str
+    digest : str
+    variants : dict[str, str] = {}
+
+    @validator('variants', always=True)
+    def build_variants(cls, value, values):
+        return image_variants(values.get('digest', ''))
 
     class Config:
         orm_mode = True
@@ -67,6 +74,36 @@ class ProductResponse(ProductBase):
         orm_mode = True
 
 
+class ProductSearchResponse(ProductResponse):
+    rank : float
+
+
+class CategoryFacet(BaseModel):
+    category_id : int
+    count : int
+
+
+class ProductFacetsResponse(BaseModel):
+    total : int
+    categories : list[CategoryFacet]
+
+
+class ProductSuggestion(BaseModel):
+    product_id : int
+    name : str
+    code : str
+
+
+class ProductCodeLookupResponse(BaseModel):
+    products : list[ProductResponse]
+    missing : list[str]
+
+
+class ProductBatchResponse(BaseModel):
+    products : list[ProductResponse]
+    missing : list[int]
+
+
 class ProductCategoryBase(BaseModel):
     category_id : int
     product_id : int
@@ -87,3 +124,15 @@ class ProductCategoryResponse(ProductCategoryBase):
     class Config:
         orm_mode = True
 
+
+
+class ProductAvailabilityResponse(BaseModel):
+    pharmacy_id : int
+    name : str
+    address : Optional[str] = None
+    lat : Optional[float] = None
+    lng : Optional[float] = None
+    contact : Optional[str] = None
+    price : float
+    stock : int
+    distance : Optional[float] = None
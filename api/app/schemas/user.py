@@ -40,6 +40,11 @@ class UserResponse(UserBase):
         orm_mode = True
 
 
+class UserBatchResponse(BaseModel):
+    users : list[UserResponse]
+    missing : list[int]
+
+
 class UserUpdate(BaseModel):
     name : Optional[str] = None
     username : Optional[str] = None
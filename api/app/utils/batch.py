@@ -0,0 +1,41 @@
+from fastapi.exceptions import HTTPException
+from sqlalchemy import Integer, any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from utils.cache import entity_cache
+from utils.settings import Settings
+
+settings = Settings()
+
+def batch_ids(ids):
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > settings.BATCH_MAX_IDS:
+        raise HTTPException(400, f'a batch can have at most {settings.BATCH_MAX_IDS} ids')
+    return ids
+
+async def load_many(session, model, schema, ids, options = ()):
+    if not ids:
+        return {}
+    key = model.__mapper__.primary_key[0]
+    statement = select(model).where(key == any_(bindparam('ids', ids, type_=ARRAY(Integer)))).options(*options)
+    return { getattr(instance, key.key) : schema.from_orm(instance).dict() for instance in (await session.scalars(statement)).unique() }
+
+async def cached_load_many(session, model, schema, ids, options = ()):
+    group = model.__tablename__
+    found, missing = {}, []
+    for id in ids:
+        value = await entity_cache.get(group, id)
+        if value is None:
+            missing.append(id)
+        else:
+            found[id] = value
+    if not missing:
+        return found
+    token = await entity_cache.token()
+    loaded = await load_many(session, model, schema, missing, options)
+    for id, value in loaded.items():
+        await entity_cache.fill(group, id, value, token)
+    found.update(loaded)
+    return found
+
+def batch_response(name, ids, found):
+    return { name : [found[id] for id in ids if id in found], 'missing' : [id for id in ids if id not in found] }
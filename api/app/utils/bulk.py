@@ -0,0 +1,259 @@
+import asyncio
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from fastapi import UploadFile
+from fastapi.exceptions import HTTPException
+from sqlalchemy import Integer, Numeric, bindparam, cast, exists, func, literal, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from starlette.concurrency import run_in_threadpool
+from utils.settings import Settings
+from utils.models import Inventory, Pharmacy, Product
+from utils.etag import touch
+
+settings = Settings()
+INVENTORY_COLUMNS = ('product_id', 'pharmacy_id', 'price', 'stock')
+STAGING_COLUMNS = ('line',) + INVENTORY_COLUMNS
+INT_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+CREATE_STAGING = text('''
+CREATE TEMP TABLE inventory_import (
+  line INT NOT NULL,
+  product_id INT NOT NULL,
+  pharmacy_id INT NOT NULL,
+  price NUMERIC NOT NULL,
+  stock INT NOT NULL
+) ON COMMIT DROP
+''')
+
+CHECK_STAGING = text('''
+WITH checked AS (
+  SELECT s.line, p.product_id IS NULL AS missing_product, f.pharmacy_id IS NULL AS missing_pharmacy,
+    max(s.line) OVER (PARTITION BY s.product_id, s.pharmacy_id) AS last_line
+  FROM inventory_import s
+  LEFT JOIN pharmaguide.product p ON p.product_id = s.product_id
+  LEFT JOIN pharmaguide.pharmacy f ON f.pharmacy_id = s.pharmacy_id
+)
+SELECT line, missing_product, missing_pharmacy, last_line, count(*) OVER () AS total
+FROM checked
+WHERE missing_product OR missing_pharmacy OR line <> last_line
+ORDER BY line
+LIMIT :limit
+''')
+
+UPSERT_STAGING = text('''
+WITH upserted AS (
+  INSERT INTO pharmaguide.inventory (product_id, pharmacy_id, price, stock)
+  SELECT DISTINCT ON (s.product_id, s.pharmacy_id) s.product_id, s.pharmacy_id, s.price, s.stock
+  FROM inventory_import s
+  JOIN pharmaguide.product p ON p.product_id = s.product_id
+  JOIN pharmaguide.pharmacy f ON f.pharmacy_id = s.pharmacy_id
+  ORDER BY s.product_id, s.pharmacy_id, s.line DESC
+  ON CONFLICT (product_id, pharmacy_id) DO UPDATE SET price = EXCLUDED.price, stock = EXCLUDED.stock
+  RETURNING xmax = 0 AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+''')
+
+
+def to_int(value):
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValueError
+    number = int(value)
+    if not INT_RANGE[0] <= number <= INT_RANGE[1]:
+        raise ValueError
+    return number
+
+def to_price(value):
+    price = Decimal(value.strip() if isinstance(value, str) else str(value))
+    if not price.is_finite():
+        raise ValueError
+    return price
+
+CONVERTERS = { 'product_id' : to_int, 'pharmacy_id' : to_int, 'price' : to_price, 'stock' : to_int }
+
+def describe(values):
+    for column, value in zip(INVENTORY_COLUMNS, values):
+        if value is None or value == '':
+            return f'{column} is required'
+        try:
+            CONVERTERS[column](value)
+        except (ValueError, TypeError, InvalidOperation):
+            return f'{column} is not a valid number'
+
+def convert(line, values):
+    try:
+        return line, (line, to_int(values[0]), to_int(values[1]), to_price(values[2]), to_int(values[3]))
+    except (ValueError, TypeError, InvalidOperation):
+        return line, describe(values)
+
+def parse_csv(file):
+    reader = csv.reader(file)
+    header = [column.strip() for column in next(reader, [])]
+    missing = [column for column in INVENTORY_COLUMNS if column not in header]
+    if missing:
+        raise HTTPException(400, 'missing columns: ' + ', '.join(missing))
+    positions = [header.index(column) for column in INVENTORY_COLUMNS]
+    width = max(positions) + 1
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < width:
+            row = row + [None] * (width - len(row))
+        yield convert(reader.line_num, [row[position] for position in positions])
+
+def parse_ndjson(file):
+    for line, content in enumerate(file, 1):
+        if not content.strip():
+            continue
+        try:
+            values = json.loads(content)
+        except ValueError:
+            yield line, 'invalid json'
+            continue
+        if not isinstance(values, dict):
+            yield line, 'expected a json object'
+            continue
+        yield convert(line, [values.get(column) for column in INVENTORY_COLUMNS])
+
+def read_batch(rows, size):
+    try:
+        return list(islice(rows, size))
+    except UnicodeDecodeError:
+        raise HTTPException(400, 'file is not valid utf-8')
+
+def copy_text(session, table, columns, records):
+    buffer = io.StringIO(''.join('\t'.join(map(str, record)) + '\n' for record in records))
+    with session.connection().connection.driver_connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN', buffer)
+
+async def copy_records(session, table, columns, records):
+    if settings.ASYNC_DB:
+        connection = await (await session.connection()).get_raw_connection()
+        await connection.driver_connection.copy_records_to_table(table, records=records, columns=columns)
+    else:
+        await session.run_sync(copy_text, table, columns, records)
+
+async def import_inventory(session, upload : UploadFile, format):
+    await session.execute(text("SELECT set_config('work_mem', :work_mem, true)"), { 'work_mem' : settings.IMPORT_WORK_MEM })
+    await session.execute(CREATE_STAGING)
+    file = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    rows = parse_csv(file) if format == 'csv' else parse_ndjson(file)
+    received, errors, rejected = 0, [], 0
+    upcoming = asyncio.ensure_future(run_in_threadpool(read_batch, rows, settings.IMPORT_BATCH_ROWS))
+    try:
+        while batch := await upcoming:
+            upcoming = asyncio.ensure_future(run_in_threadpool(read_batch, rows, settings.IMPORT_BATCH_ROWS))
+            received += len(batch)
+            records = []
+            for line, record in batch:
+                if isinstance(record, tuple):
+                    records.append(record)
+                else:
+                    rejected += 1
+                    if len(errors) < settings.IMPORT_MAX_ERRORS:
+                        errors.append({ 'line' : line, 'error' : record })
+            if records:
+                await copy_records(session, 'inventory_import', STAGING_COLUMNS, records)
+    finally:
+        await asyncio.gather(upcoming, return_exceptions=True)
+        file.detach()
+    await session.execute(text('ANALYZE inventory_import'))
+    checked = (await session.execute(CHECK_STAGING, { 'limit' : settings.IMPORT_MAX_ERRORS })).all()
+    if checked:
+        rejected += checked[0].total
+    for line, missing_product, missing_pharmacy, last_line, _ in checked:
+        if missing_product:
+            errors.append({ 'line' : line, 'error' : 'product does not exist' })
+        elif missing_pharmacy:
+            errors.append({ 'line' : line, 'error' : 'pharmacy does not exist' })
+        else:
+            errors.append({ 'line' : line, 'error' : f'superseded by line {last_line}' })
+    inserted, updated = (await session.execute(UPSERT_STAGING)).one()
+    touch(session, 'inventory')
+    await session.commit()
+    errors.sort(key=lambda error: error['line'])
+    return {
+        'received' : received,
+        'inserted' : inserted,
+        'updated' : updated,
+        'rejected' : rejected,
+        'errors' : errors[:settings.IMPORT_MAX_ERRORS],
+    }
+
+def inventory_changes(upsert = False):
+    inventory = Inventory.__table__
+    rows = select(func.unnest(
+        cast(bindparam('product_ids'), ARRAY(Integer)),
+        cast(bindparam('pharmacy_ids'), ARRAY(Integer)),
+        cast(bindparam('prices'), ARRAY(Numeric)),
+        cast(bindparam('stocks'), ARRAY(Integer))
+    ).table_valued('product_id', 'pharmacy_id', 'price', 'stock').render_derived()).cte('changes')
+    same_key = (inventory.c.product_id == rows.c.product_id) & (inventory.c.pharmacy_id == rows.c.pharmacy_id)
+    returned = (inventory.c.product_id, inventory.c.pharmacy_id, inventory.c.price, inventory.c.stock)
+    updated = (
+        update(inventory)
+        .where(same_key)
+        .values(price=func.coalesce(rows.c.price, inventory.c.price), stock=func.coalesce(rows.c.stock, inventory.c.stock))
+        .returning(*returned, literal('updated').label('status'))
+        .cte('updated')
+    )
+    if not upsert:
+        return select(updated)
+    inserted = (
+        insert(inventory)
+        .from_select(
+            ['product_id', 'pharmacy_id', 'price', 'stock'],
+            select(rows.c.product_id, rows.c.pharmacy_id, rows.c.price, rows.c.stock).where(
+                rows.c.price.is_not(None),
+                ~exists().where(same_key),
+                exists().where(Product.product_id == rows.c.product_id),
+                exists().where(Pharmacy.pharmacy_id == rows.c.pharmacy_id)
+            )
+        )
+        .on_conflict_do_nothing()
+        .returning(*returned, literal('inserted').label('status'))
+        .cte('inserted')
+    )
+    return select(updated).union_all(select(inserted))
+
+INVENTORY_CHANGES = { False : inventory_changes(False), True : inventory_changes(True) }
+
+async def apply_inventory_changes(session, items, upsert = False):
+    if len(items) > settings.INVENTORY_BATCH_MAX:
+        raise HTTPException(400, f'a batch can have at most {settings.INVENTORY_BATCH_MAX} changes')
+    invalid, merged = set(), {}
+    for position, item in enumerate(items):
+        key = (item.product_id, item.pharmacy_id)
+        if item.price is None and item.stock is None:
+            invalid.add(position)
+        elif not all(INT_RANGE[0] <= value <= INT_RANGE[1] for value in (*key, item.stock or 0)):
+            invalid.add(position)
+        else:
+            price, stock = merged.get(key, (None, None))
+            merged[key] = (item.price if item.price is not None else price, item.stock if item.stock is not None else stock)
+    affected = {}
+    if merged:
+        parameters = {
+            'product_ids' : [product_id for product_id, _ in merged],
+            'pharmacy_ids' : [pharmacy_id for _, pharmacy_id in merged],
+            'prices' : [price for price, _ in merged.values()],
+            'stocks' : [stock for _, stock in merged.values()],
+        }
+        for row in await session.execute(INVENTORY_CHANGES[upsert], parameters):
+            affected[(row.product_id, row.pharmacy_id)] = row
+        touch(session, 'inventory')
+        await session.commit()
+    results = []
+    for position, item in enumerate(items):
+        row = None if position in invalid else affected.get((item.product_id, item.pharmacy_id))
+        results.append({
+            'product_id' : item.product_id,
+            'pharmacy_id' : item.pharmacy_id,
+            'status' : row.status if row else 'invalid' if position in invalid else 'not_found',
+            'price' : row.price if row else None,
+            'stock' : row.stock if row else None,
+        })
+    return results
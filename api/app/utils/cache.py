@@ -0,0 +1,194 @@
+import json
+from collections import OrderedDict
+from time import monotonic
+from utils import metrics
+from utils.settings import Settings
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+settings = Settings()
+
+FILL = '''
+local invalidated = redis.call('get', KEYS[2])
+if invalidated and tonumber(invalidated) > tonumber(ARGV[2]) then
+  return 0
+end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+'''
+
+DELETE = '''
+local clock = redis.call('incr', KEYS[3])
+redis.call('set', KEYS[2], clock, 'EX', ARGV[1])
+redis.call('del', KEYS[1])
+return clock
+'''
+
+cache_hits = metrics.counter('cache_hits_total', 'Cache lookups that found a fresh entry.')
+cache_misses = metrics.counter('cache_misses_total', 'Cache lookups that found nothing or an expired entry.')
+cache_evictions = metrics.counter('cache_evictions_total', 'Entries dropped to stay under the cache size limit.')
+
+
+class TTLCache:
+    def __init__(self, ttl, maxsize = 10000, name = 'default'):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.name = name
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.clock = 0
+        self.floor = 0
+        self.invalidated = OrderedDict()
+
+    def key(self, group, key):
+        return group, self.generations.get(group, 0), key
+
+    def get(self, group, key):
+        full_key = self.key(group, key)
+        entry = self.entries.get(full_key)
+        if entry is None:
+            cache_misses.inc(cache=self.name)
+            return None
+        expires, value = entry
+        if expires < monotonic():
+            del self.entries[full_key]
+            cache_misses.inc(cache=self.name)
+            return None
+        self.entries.move_to_end(full_key)
+        cache_hits.inc(cache=self.name)
+        return value
+
+    def set(self, group, key, value):
+        full_key = self.key(group, key)
+        self.entries[full_key] = (monotonic() + self.ttl, value)
+        self.entries.move_to_end(full_key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            cache_evictions.inc(cache=self.name)
+
+    def token(self):
+        return self.clock
+
+    def fill(self, group, key, value, token):
+        if token < self.floor or self.invalidated.get((group, key), 0) > token or self.invalidated.get((group,), 0) > token:
+            return
+        self.set(group, key, value)
+
+    def record(self, name):
+        self.clock += 1
+        self.invalidated[name] = self.clock
+        self.invalidated.move_to_end(name)
+        while len(self.invalidated) > self.maxsize:
+            self.floor = self.invalidated.popitem(last=False)[1]
+
+    def delete(self, group, key):
+        self.entries.pop(self.key(group, key), None)
+        self.record((group, key))
+
+    def invalidate(self, group):
+        self.generations[group] = self.generations.get(group, 0) + 1
+        self.record((group,))
+
+    def clear(self):
+        self.entries.clear()
+        self.generations.clear()
+        self.invalidated.clear()
+        self.clock += 1
+        self.floor = self.clock
+
+
+class MemoryCache:
+    def __init__(self, name, ttl, maxsize):
+        self.entries = TTLCache(ttl, maxsize, name)
+
+    async def get(self, group, key):
+        return self.entries.get(group, key)
+
+    async def set(self, group, key, value):
+        self.entries.set(group, key, value)
+
+    async def token(self):
+        return self.entries.token()
+
+    async def fill(self, group, key, value, token):
+        self.entries.fill(group, key, value, token)
+
+    async def delete(self, group, key):
+        self.entries.delete(group, key)
+
+    async def clear(self):
+        self.entries.clear()
+
+
+class RedisCache:
+    def __init__(self, name, ttl, url):
+        if redis is None:
+            raise RuntimeError('CACHE_BACKEND=redis requires the redis package')
+        self.name = name
+        self.ttl = ttl
+        self.client = redis.from_url(url)
+        self.fill_script = self.client.register_script(FILL)
+        self.delete_script = self.client.register_script(DELETE)
+        self.clock = f'pharmaguide:{self.name}:clock'
+
+    def key(self, group, key):
+        return f'pharmaguide:{self.name}:{group}:{key}'
+
+    def invalidation_key(self, group, key):
+        return f'pharmaguide:{self.name}:invalidated:{group}:{key}'
+
+    async def get(self, group, key):
+        value = await self.client.get(self.key(group, key))
+        if value is None:
+            cache_misses.inc(cache=self.name)
+            return None
+        cache_hits.inc(cache=self.name)
+        return json.loads(value)
+
+    async def set(self, group, key, value):
+        await self.client.set(self.key(group, key), json.dumps(value, default=str), ex=max(1, int(self.ttl)))
+
+    async def token(self):
+        return int(await self.client.get(self.clock) or 0)
+
+    async def fill(self, group, key, value, token):
+        await self.fill_script(keys=[self.key(group, key), self.invalidation_key(group, key)], args=[json.dumps(value, default=str), token, max(1, int(self.ttl))])
+
+    async def delete(self, group, key):
+        await self.delete_script(keys=[self.key(group, key), self.invalidation_key(group, key), self.clock], args=[max(1, int(self.ttl))])
+
+    async def clear(self):
+        async for key in self.client.scan_iter(f'pharmaguide:{self.name}:*'):
+            await self.client.delete(key)
+
+
+def build_cache(name, ttl):
+    if settings.CACHE_BACKEND == 'redis':
+        return RedisCache(name, ttl, settings.CACHE_URL)
+    if settings.CACHE_BACKEND != 'memory':
+        raise ValueError(f'unknown cache backend {settings.CACHE_BACKEND!r}')
+    return MemoryCache(name, ttl, settings.CACHE_MAX_ENTRIES)
+
+
+availability_cache = TTLCache(settings.AVAILABILITY_TTL, name='availability')
+entity_cache = build_cache('entities', settings.CACHE_TTL)
+
+async def cached_get(session, model, schema, id, options = ()):
+    group = model.__tablename__
+    value = await entity_cache.get(group, id)
+    if value is None:
+        token = await entity_cache.token()
+        instance = await session.get(model, id, options=options)
+        if instance is None:
+            return None
+        value = schema.from_orm(instance).dict()
+        await entity_cache.fill(group, id, value, token)
+    return value
+
+async def invalidate(model, *ids):
+    for id in set(ids):
+        if id != None:
+            await entity_cache.delete(model.__tablename__, id)
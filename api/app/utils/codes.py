@@ -0,0 +1,43 @@
+from sqlalchemy import select
+from utils.cache import TTLCache, entity_cache
+from utils.models import Product
+from utils.settings import Settings
+
+settings = Settings()
+NOT_FOUND = 0
+GROUP = Product.__tablename__
+
+code_cache = TTLCache(settings.CODE_CACHE_TTL, settings.CACHE_MAX_ENTRIES, name='product_code')
+
+async def cached_by_code(code):
+    id = code_cache.get(GROUP, code)
+    if id == None or id == NOT_FOUND:
+        return id
+    product = await entity_cache.get(GROUP, id)
+    if product == None or product['code'] != code:
+        return None
+    return product
+
+async def find_by_code(session, codes, schema, options = ()):
+    products, unknown = {}, []
+    for code in codes:
+        product = await cached_by_code(code)
+        if product == None:
+            unknown.append(code)
+        elif product != NOT_FOUND:
+            products[code] = product
+    if unknown:
+        token, code_token = await entity_cache.token(), code_cache.token()
+        statement = select(Product).where(Product.code.in_(unknown)).options(*options)
+        for product in (await session.scalars(statement)).unique():
+            value = schema.from_orm(product).dict()
+            products[product.code] = value
+            await entity_cache.fill(GROUP, product.product_id, value, token)
+        for code in unknown:
+            code_cache.fill(GROUP, code, products[code]['product_id'] if code in products else NOT_FOUND, code_token)
+    return products
+
+def forget_codes(*codes):
+    for code in set(codes):
+        if code != None:
+            code_cache.delete(GROUP, code)
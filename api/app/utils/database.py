@@ -1,8 +1,12 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine import URL
+from starlette.concurrency import run_in_threadpool
 from utils.settings import Settings
+from utils.instrumentation import TimedAsyncPool, TimedQueuePool, instrument
+from utils.profiler import profiler
 
 settings = Settings()
 
@@ -15,8 +19,100 @@ url = URL.create(
     port=settings.POSTGRES_PORT
 )
 
-engine = create_engine(url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-session = SessionLocal()
+def observe(engine):
+    instrument(engine)
+    event.listen(engine, 'after_cursor_execute', profiler.record)
+    return engine
+
+def build_engine(url, pool_size = settings.POOL_SIZE, max_overflow = settings.POOL_MAX_OVERFLOW, asynchronous = False):
+    options = dict(
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.POOL_TIMEOUT,
+        pool_recycle=settings.POOL_RECYCLE,
+        pool_pre_ping=settings.POOL_PRE_PING
+    )
+    if asynchronous:
+        engine = create_async_engine(url.set(drivername='postgresql+asyncpg'), poolclass=TimedAsyncPool, **options)
+        observe(engine.sync_engine)
+        return engine
+    return observe(create_engine(url, poolclass=TimedQueuePool, **options))
+
+
+def prebuffered(kwargs):
+    kwargs['execution_options'] = { **kwargs.get('execution_options', {}), 'prebuffer_rows' : True }
+    return kwargs
+
+
+class ThreadedSession:
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def get(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, *args, **kwargs)
+
+    async def execute(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, *args, **prebuffered(kwargs))
+
+    async def scalar(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, *args, **prebuffered(kwargs))
+
+    async def scalars(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, *args, **prebuffered(kwargs))
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, *args, **kwargs):
+        await run_in_threadpool(self.sync_session.refresh, *args, **kwargs)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+engine = build_engine(url, asynchronous=settings.ASYNC_DB)
+if settings.ASYNC_DB:
+    SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+else:
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+def new_session():
+    if settings.ASYNC_DB:
+        return SessionLocal()
+    return ThreadedSession(SessionLocal())
+
+async def get_session():
+    session = new_session()
+    try:
+        yield session
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+async def dispose_engine():
+    if settings.ASYNC_DB:
+        await engine.dispose()
+    else:
+        await run_in_threadpool(engine.dispose)
 
 Base = declarative_base()
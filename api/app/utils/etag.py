@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import time
+from itertools import chain
+from fastapi import Request, Response
+from fastapi.exceptions import HTTPException
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from utils.database import new_session
+from utils.settings import Settings
+
+settings = Settings()
+DEFAULT_CACHE_CONTROL = 'no-cache'
+VERSIONS = 'SELECT name, sum(version) FROM pharmaguide.table_version GROUP BY name'
+
+
+class TableVersions:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.values = {}
+        self.expires = 0.0
+        self.generation = 0
+        self.lock = None
+
+    def expire(self):
+        self.generation += 1
+        self.expires = 0.0
+
+    async def load(self):
+        session = new_session()
+        try:
+            return dict((await session.execute(text(VERSIONS))).all())
+        finally:
+            await session.close()
+
+    async def get(self):
+        if time.monotonic() < self.expires:
+            return self.values
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if time.monotonic() >= self.expires:
+                generation, started = self.generation, time.monotonic()
+                self.values = await self.load()
+                if generation == self.generation:
+                    self.expires = started + self.ttl
+        return self.values
+
+
+versions = TableVersions(settings.ETAG_VERSION_TTL)
+
+def touch(session, *tables):
+    session = getattr(session, 'sync_session', session)
+    session.info.setdefault('touched_tables', set()).update(tables)
+
+@event.listens_for(Session, 'after_flush')
+def track_flush(session, context):
+    touch(session, *{ instance.__table__.name for instance in chain(session.new, session.dirty, session.deleted) })
+
+@event.listens_for(Session, 'do_orm_execute')
+def track_execute(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        touch(state.session, state.statement.table.name)
+
+@event.listens_for(Session, 'after_commit')
+def expire_versions(session):
+    if session.info.pop('touched_tables', None):
+        versions.expire()
+
+@event.listens_for(Session, 'after_rollback')
+def forget_versions(session):
+    session.info.pop('touched_tables', None)
+
+def etag(values, tables, path, query):
+    state = ','.join(str(values.get(table, 0)) for table in tables)
+    return '"' + hashlib.blake2b(f'{state}|{path}?{query}'.encode(), digest_size=12).hexdigest() + '"'
+
+def matches(header, tag):
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(',')]
+    return '*' in candidates or tag in candidates or 'W/' + tag in candidates
+
+def conditional(router, *tables):
+    async def check(request : Request, response : Response):
+        if request.method != 'GET':
+            return
+        tag = etag(await versions.get(), tables, request.url.path, request.url.query)
+        headers = { 'ETag' : tag, 'Cache-Control' : settings.CACHE_CONTROL.get(router, DEFAULT_CACHE_CONTROL) }
+        if matches(request.headers.get('if-none-match'), tag):
+            raise HTTPException(304, headers=headers)
+        response.headers.update(headers)
+    return check
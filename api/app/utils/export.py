@@ -0,0 +1,133 @@
+import zlib
+import orjson
+from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from utils import metrics
+from utils.database import new_session
+from utils.images import image_variants
+from utils.models import Category, Inventory, Pharmacy, PharmacyImage, Product, ProductCategory, ProductImage
+from utils.serialization import INVENTORY_COLUMNS, PHARMACY_COLUMNS, PRODUCT_COLUMNS
+from utils.settings import Settings
+
+settings = Settings()
+active = 0
+
+exported_rows = metrics.counter('export_rows_total', 'Rows written by the NDJSON export endpoints.')
+active_exports = metrics.gauge('export_active', 'NDJSON exports currently streaming.')
+rejected_exports = metrics.counter('export_rejected_total', 'Exports refused because too many were already streaming.')
+
+def json_list(owner, order_by, *columns, name):
+    entry = func.json_build_object(*[part for column in columns for part in (column.key, column)])
+    return select(owner, func.json_agg(aggregate_order_by(entry, order_by), type_=JSON).label(name)).group_by(owner)
+
+PRODUCT_IMAGES = json_list(ProductImage.product_id, ProductImage.name, ProductImage.product_id, ProductImage.name, ProductImage.digest, name='images').subquery()
+PHARMACY_IMAGES = json_list(PharmacyImage.pharmacy_id, PharmacyImage.name, PharmacyImage.pharmacy_id, PharmacyImage.name, PharmacyImage.digest, name='images').subquery()
+PRODUCT_CATEGORIES = (
+    json_list(ProductCategory.product_id, Category.category_id, Category.category_id, Category.name, name='categories')
+    .join(Category, Category.category_id == ProductCategory.category_id)
+    .subquery()
+)
+
+EXPORTS = {
+    'product' : (PRODUCT_COLUMNS, [Product.product_id], { 'images' : PRODUCT_IMAGES, 'categories' : PRODUCT_CATEGORIES }),
+    'pharmacy' : (PHARMACY_COLUMNS, [Pharmacy.pharmacy_id], { 'images' : PHARMACY_IMAGES }),
+    'inventory' : (INVENTORY_COLUMNS, [Inventory.product_id, Inventory.pharmacy_id], {}),
+}
+
+def export_statement(table, include = ()):
+    columns, keys, joins = EXPORTS[table]
+    unknown = sorted(set(include) - set(joins))
+    if unknown:
+        raise HTTPException(400, f'unknown include for {table}: {", ".join(unknown)}')
+    statement = select(*columns).order_by(*keys)
+    owner = keys[0]
+    for name in include:
+        joined = joins[name]
+        statement = statement.add_columns(joined.c[name]).outerjoin(joined, joined.c[owner.key] == owner)
+    return statement
+
+async def partitions(session, statement, size):
+    statement = statement.execution_options(yield_per=size)
+    if settings.ASYNC_DB:
+        result = await session.stream(statement)
+        async for partition in result.partitions():
+            yield partition
+        return
+    connection = await run_in_threadpool(session.sync_session.connection)
+    result = await run_in_threadpool(connection.execute, statement)
+    while True:
+        partition = await run_in_threadpool(result.fetchmany, size)
+        if not partition:
+            return
+        yield partition
+
+def encode(rows, fields):
+    lines = []
+    for row in rows:
+        record = dict(zip(fields, row))
+        if 'images' in record:
+            images = record['images'] or []
+            for image in images:
+                image['variants'] = image_variants(image['digest'])
+            record['images'] = images
+        if 'categories' in record:
+            record['categories'] = record['categories'] or []
+        lines.append(orjson.dumps(record))
+    lines.append(b'')
+    return b'\n'.join(lines)
+
+
+class ExportSlot:
+    def __init__(self):
+        global active
+        if active >= settings.EXPORT_MAX_ACTIVE:
+            rejected_exports.inc()
+            raise HTTPException(503, 'too many exports in progress, try again later', headers={ 'Retry-After' : '5' })
+        active += 1
+        active_exports.set(active)
+        self.held = True
+
+    def release(self):
+        global active
+        if self.held:
+            self.held = False
+            active -= 1
+            active_exports.set(active)
+
+
+async def stream_rows(table, statement, compress, slot):
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    session = new_session()
+    try:
+        async for rows in partitions(session, statement, settings.EXPORT_BATCH_ROWS):
+            chunk = encode(rows, rows[0]._fields)
+            exported_rows.inc(len(rows), table=table)
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor:
+            yield compressor.flush()
+    finally:
+        await session.close()
+        slot.release()
+
+def export_response(table, include = (), compress = False):
+    statement = export_statement(table, include)
+    slot = ExportSlot()
+    body = stream_rows(table, statement, compress, slot)
+
+    async def finish():
+        try:
+            await body.aclose()
+        finally:
+            slot.release()
+
+    headers = { 'Content-Disposition' : f'attachment; filename="{table}.ndjson"' }
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(body, media_type='application/x-ndjson', headers=headers, background=BackgroundTask(finish))
@@ -0,0 +1,93 @@
+from sqlalchemy import select
+from utils.database import new_session
+from utils.models import Product, ProductCategory
+
+POPCOUNT_TABLE = bytes(bin(byte).count('1') for byte in range(256))
+
+def popcount(bitmap):
+    return sum(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little').translate(POPCOUNT_TABLE))
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+
+def bitmap_of(ids):
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for id in ids:
+        buffer[id >> 3] |= 1 << (id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class CategoryBitmaps:
+    def __init__(self):
+        self.products = 0
+        self.bitmaps = {}
+        self.sizes = {}
+
+    def build(self, product_ids, memberships):
+        members = {}
+        for category_id, product_id in memberships:
+            members.setdefault(category_id, []).append(product_id)
+        self.products = bitmap_of(product_ids)
+        self.bitmaps = { category_id : bitmap_of(ids) for category_id, ids in members.items() }
+        self.sizes = { category_id : popcount(bitmap) for category_id, bitmap in self.bitmaps.items() }
+
+    def add_product(self, product_id):
+        self.products |= 1 << product_id
+
+    def remove_product(self, product_id):
+        self.products &= ~(1 << product_id)
+        for category_id in list(self.bitmaps):
+            self.remove(category_id, product_id)
+
+    def add(self, category_id, product_id):
+        bit = 1 << product_id
+        bitmap = self.bitmaps.get(category_id, 0)
+        if not bitmap & bit:
+            self.bitmaps[category_id] = bitmap | bit
+            self.sizes[category_id] = self.sizes.get(category_id, 0) + 1
+
+    def remove(self, category_id, product_id):
+        bit = 1 << product_id
+        bitmap = self.bitmaps.get(category_id, 0)
+        if bitmap & bit:
+            bitmap &= ~bit
+            if bitmap:
+                self.bitmaps[category_id] = bitmap
+                self.sizes[category_id] -= 1
+            else:
+                del self.bitmaps[category_id]
+                del self.sizes[category_id]
+
+    def matching(self, categories, match = 'any'):
+        if not categories:
+            return self.products
+        bitmaps = [self.bitmaps.get(category_id, 0) for category_id in categories]
+        result = bitmaps[0]
+        for bitmap in bitmaps[1:]:
+            result = result & bitmap if match == 'all' else result | bitmap
+        return result & self.products
+
+    def facets(self, categories = None, match = 'any'):
+        if not categories:
+            counts, total = self.sizes.items(), popcount(self.products)
+        else:
+            result = self.matching(categories, match)
+            counts, total = ((category_id, popcount(bitmap & result)) for category_id, bitmap in self.bitmaps.items()), popcount(result)
+        return {
+            'total' : total,
+            'categories' : [{ 'category_id' : category_id, 'count' : count } for category_id, count in sorted(counts, key=lambda item: (-item[1], item[0])) if count],
+        }
+
+
+category_index = CategoryBitmaps()
+
+async def load_category_index():
+    session = new_session()
+    try:
+        product_ids = (await session.scalars(select(Product.product_id))).all()
+        memberships = (await session.execute(select(ProductCategory.category_id, ProductCategory.product_id))).all()
+    finally:
+        await session.close()
+    category_index.build(product_ids, memberships)
@@ -0,0 +1,108 @@
+from heapq import heappush, heappushpop
+from math import asin, ceil, cos, floor, radians, sin, sqrt
+from sqlalchemy import Float, cast, func, select
+from utils.database import new_session
+from utils.models import Pharmacy
+from utils.settings import Settings
+
+settings = Settings()
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * radians(1)
+
+def haversine(lat1, lng1, lat2, lng2):
+    dlat = radians(lat2 - lat1)
+    dlng = radians(lng2 - lng1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+class GridIndex:
+    def __init__(self, cell_degrees):
+        self.cell = cell_degrees
+        self.rows = int(floor(180 / cell_degrees)) + 1
+        self.columns = int(ceil(360 / cell_degrees))
+        self.column_width = 360 / self.columns
+        self.cells = {}
+        self.points = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell_of(self, lat, lng):
+        return int(floor((lat + 90) / self.cell)), int(floor((lng + 180) / self.column_width)) % self.columns
+
+    def add(self, id, lat, lng):
+        self.remove(id)
+        if lat is None or lng is None:
+            return
+        lat, lng = float(lat), float(lng)
+        key = self.cell_of(lat, lng)
+        self.cells.setdefault(key, {})[id] = (lat, lng)
+        self.points[id] = key
+
+    def remove(self, id):
+        key = self.points.pop(id, None)
+        if key is not None:
+            cell = self.cells[key]
+            del cell[id]
+            if not cell:
+                del self.cells[key]
+
+    def ring(self, row, column, size, row_span, column_span):
+        for r in range(max(0, row - min(size, row_span)), min(self.rows, row + min(size, row_span) + 1)):
+            if abs(r - row) == size:
+                offsets = range(-min(size, column_span), min(size, column_span) + 1)
+            elif size <= column_span:
+                offsets = (-size, size)
+            else:
+                continue
+            for offset in offsets:
+                yield r, (column + offset) % self.columns
+
+    def collect(self, best, lat, lng, k, radius, cell):
+        for id, (plat, plng) in cell.items():
+            distance = haversine(lat, lng, plat, plng)
+            if distance > radius:
+                continue
+            if len(best) < k:
+                heappush(best, (-distance, id))
+            elif distance < -best[0][0]:
+                heappushpop(best, (-distance, id))
+
+    def nearest(self, lat, lng, k, radius):
+        row, column = self.cell_of(lat, lng)
+        shrink = cos(radians(min(89.9, abs(lat) + radius / KM_PER_DEGREE)))
+        row_span = int(radius / (self.cell * KM_PER_DEGREE)) + 1
+        column_span = min((self.columns - 1) // 2, int(radius / (self.column_width * KM_PER_DEGREE * shrink)) + 1)
+        best = []
+        if (2 * row_span + 1) * (2 * column_span + 1) > len(self.cells):
+            for (r, _), cell in self.cells.items():
+                if abs(r - row) <= row_span:
+                    self.collect(best, lat, lng, k, radius, cell)
+            return sorted((-distance, id) for distance, id in best)
+        for size in range(max(row_span, column_span) + 1):
+            for key in self.ring(row, column, size, row_span, column_span):
+                self.collect(best, lat, lng, k, radius, self.cells.get(key, {}))
+            bound = size * self.column_width * KM_PER_DEGREE * shrink
+            if len(best) == k and bound >= -best[0][0]:
+                break
+        return sorted((-distance, id) for distance, id in best)
+
+pharmacy_index = GridIndex(settings.GEO_CELL_DEGREES)
+
+async def load_pharmacy_index():
+    session = new_session()
+    try:
+        rows = (await session.execute(select(Pharmacy.pharmacy_id, Pharmacy.lat, Pharmacy.lng))).all()
+    finally:
+        await session.close()
+    for id, lat, lng in rows:
+        pharmacy_index.add(id, lat, lng)
+
+def haversine_sql(lat_column, lng_column, lat, lng):
+    lat1 = func.radians(lat)
+    lat2 = func.radians(cast(lat_column, Float))
+    dlat = lat2 - lat1
+    dlng = func.radians(cast(lng_column, Float)) - func.radians(lng)
+    a = func.power(func.sin(dlat / 2), 2) + func.cos(lat1) * func.cos(lat2) * func.power(func.sin(dlng / 2), 2)
+    return 2 * EARTH_RADIUS_KM * func.asin(func.least(1.0, func.sqrt(a)))
@@ -1,17 +1,236 @@
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
 from io import BytesIO
-from uuid import uuid4
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from weakref import WeakValueDictionary
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import hashlib
+import multiprocessing
+import shutil
+import time
 import os
+from typing import Optional
 from fastapi import UploadFile
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select, func
+from utils.settings import Settings
+from utils.models import ProductImage, PharmacyImage, Advertisement
+from utils import metrics
 
-async def save_image(img : UploadFile, dest : str):
-    if not os.path.exists(dest):
-        os.makedirs(dest)
-    file = Image.open(BytesIO(await img.read()))
-    name = str(uuid4()) + '.webp'
-    file.save(os.path.join(dest, name), format='WEBP')
-    return name
-
-async def remove_image(img, dest):
-    path = os.path.join(dest, img)
-    os.remove(path)
+settings = Settings()
+CHUNK_SIZE = 64 * 1024
+PUBLIC_PATH = 'public'
+IMAGE_PATH = os.path.join(PUBLIC_PATH, 'images')
+VARIANTS = { 'thumb' : 160, 'card' : 480 }
+FULL = 'full.webp'
+WIDTHS = sorted(set(settings.IMAGE_WIDTHS) | set(VARIANTS.values()))
+
+encode_seconds = metrics.histogram('image_encode_seconds', 'Time spent decoding and encoding an image in a worker process.')
+queue_wait_seconds = metrics.histogram('image_queue_wait_seconds', 'Time an image waited for a free worker process.')
+rejected_images = metrics.counter('image_rejected_total', 'Images rejected before or during encoding.')
+pending_images = metrics.gauge('image_pending', 'Images queued or being encoded.')
+stored_images = metrics.counter('image_uploads_total', 'Accepted uploads by whether the encoded image already existed.')
+derivative_requests = metrics.counter('image_derivative_requests_total', 'Derivative lookups by cache result.')
+derivative_evictions = metrics.counter('image_derivative_evictions_total', 'Derivatives evicted from the disk cache.')
+derivative_bytes = metrics.gauge('image_derivative_bytes', 'Bytes used by cached derivatives.')
+
+executor = None
+pending = 0
+locks = WeakValueDictionary()
+
+
+class ImageRejected(Exception):
+    pass
+
+
+class DerivativeCache:
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.size = 0
+        self.building = {}
+
+    def load(self, root):
+        found = []
+        for directory, _, files in os.walk(root):
+            for file in files:
+                if file != FULL:
+                    stat = os.stat(os.path.join(directory, file))
+                    found.append((stat.st_atime, os.path.join(directory, file), stat.st_size))
+        for _, path, size in sorted(found):
+            self.add(path, size)
+
+    def get(self, path):
+        if path in self.entries:
+            self.entries.move_to_end(path)
+            return True
+        return False
+
+    def add(self, path, size):
+        self.size += size - self.entries.pop(path, 0)
+        self.entries[path] = size
+        while self.size > self.budget and len(self.entries) > 1:
+            old_path, old_size = self.entries.popitem(last=False)
+            self.size -= old_size
+            derivative_evictions.inc()
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+        derivative_bytes.set(self.size)
+
+    def discard(self, directory):
+        prefix = os.path.join(directory, '')
+        for path in [path for path in self.entries if path.startswith(prefix)]:
+            self.size -= self.entries.pop(path)
+        derivative_bytes.set(self.size)
+
+
+derivatives = DerivativeCache(settings.IMAGE_CACHE_BYTES)
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return executor
+
+def shutdown_executor():
+    global executor
+    if executor is not None:
+        executor.shutdown()
+        executor = None
+
+def load_derivatives():
+    derivatives.load(IMAGE_PATH)
+
+def resize(file, width, path):
+    copy = file.copy()
+    copy.thumbnail((width, copy.height))
+    copy.save(path, format='WEBP')
+    return path, os.path.getsize(path)
+
+def encode(data, directory, max_pixels, widths, submitted):
+    started = time.time()
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        with Image.open(BytesIO(data)) as file:
+            if file.width * file.height > max_pixels:
+                raise ImageRejected('image exceeds the pixel limit')
+            os.makedirs(directory, exist_ok=True)
+            file.save(os.path.join(directory, FULL), format='WEBP')
+            created = [resize(file, width, os.path.join(directory, f'{width}.webp')) for width in widths]
+    except UnidentifiedImageError:
+        raise ImageRejected('unsupported image format')
+    except Image.DecompressionBombError:
+        raise ImageRejected('image exceeds the pixel limit')
+    return started - submitted, time.time() - started, created
+
+def derive(directory, width, submitted):
+    started = time.time()
+    with Image.open(os.path.join(directory, FULL)) as file:
+        created = [resize(file, width, os.path.join(directory, f'{width}.webp'))]
+    return started - submitted, time.time() - started, created
+
+async def read_upload(img : UploadFile):
+    data = bytearray()
+    digest = hashlib.blake2b(digest_size=16)
+    while chunk := await img.read(CHUNK_SIZE):
+        data += chunk
+        digest.update(chunk)
+        if len(data) > settings.IMAGE_MAX_BYTES:
+            rejected_images.inc(reason='size')
+            raise HTTPException(413, 'image is too large')
+    return bytes(data), digest.hexdigest()
+
+async def run_encoder(fn, *args):
+    global pending
+    if pending >= settings.IMAGE_WORKERS + settings.IMAGE_QUEUE_DEPTH:
+        rejected_images.inc(reason='saturated')
+        raise HTTPException(503, 'image workers are busy, try again later', headers={ 'Retry-After' : '1' })
+    pending += 1
+    pending_images.set(pending)
+    try:
+        loop = asyncio.get_running_loop()
+        wait, elapsed, created = await loop.run_in_executor(get_executor(), fn, *args, time.time())
+    except ImageRejected as error:
+        rejected_images.inc(reason='invalid')
+        raise HTTPException(400, f'invalid image: {error}')
+    finally:
+        pending -= 1
+        pending_images.set(pending)
+    queue_wait_seconds.observe(max(wait, 0))
+    encode_seconds.observe(elapsed)
+    for path, size in created:
+        derivatives.add(path, size)
+
+def image_lock(digest):
+    lock = locks.get(digest)
+    if lock is None:
+        lock = locks[digest] = asyncio.Lock()
+    return lock
+
+@asynccontextmanager
+async def save_image(img : Optional[UploadFile]):
+    if img is None:
+        yield None
+        return
+    data, digest = await read_upload(img)
+    directory = os.path.join(IMAGE_PATH, digest)
+    async with image_lock(digest):
+        if os.path.exists(os.path.join(directory, FULL)):
+            stored_images.inc(result='reused')
+        else:
+            await run_encoder(encode, data, directory, settings.IMAGE_MAX_PIXELS, sorted(VARIANTS.values()))
+            stored_images.inc(result='encoded')
+        yield digest
+
+async def image_references(session, digest):
+    counts = [
+        select(func.count()).select_from(ProductImage).where(ProductImage.digest == digest).scalar_subquery(),
+        select(func.count()).select_from(PharmacyImage).where(PharmacyImage.digest == digest).scalar_subquery(),
+        select(func.count()).select_from(Advertisement).where(Advertisement.advertisement_image == digest).scalar_subquery()
+    ]
+    return await session.scalar(select(counts[0] + counts[1] + counts[2]))
+
+async def remove_image(session, digest):
+    async with image_lock(digest):
+        if await image_references(session, digest):
+            return
+        directory = os.path.join(IMAGE_PATH, digest)
+        derivatives.discard(directory)
+        shutil.rmtree(directory, ignore_errors=True)
+
+def snap_width(width):
+    index = bisect_left(WIDTHS, width)
+    if index == len(WIDTHS):
+        return None
+    return WIDTHS[index]
+
+async def image_path(digest, width = None):
+    directory = os.path.join(IMAGE_PATH, digest)
+    if not os.path.exists(os.path.join(directory, FULL)):
+        raise HTTPException(404, 'image does not exist')
+    width = snap_width(width) if width else None
+    if width is None:
+        return os.path.join(directory, FULL)
+    path = os.path.join(directory, f'{width}.webp')
+    if derivatives.get(path):
+        derivative_requests.inc(result='hit')
+        return path
+    derivative_requests.inc(result='miss')
+    if path not in derivatives.building:
+        derivatives.building[path] = asyncio.ensure_future(run_encoder(derive, directory, width))
+    task = derivatives.building[path]
+    try:
+        await asyncio.shield(task)
+    finally:
+        derivatives.building.pop(path, None)
+    return path
+
+def image_variants(digest):
+    url = f'/image/{digest}'
+    variants = { name : f'{url}?w={width}' for name, width in VARIANTS.items() }
+    variants['full'] = url
+    return variants
@@ -0,0 +1,99 @@
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from utils import metrics
+
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED = 'unmatched'
+
+request_seconds = metrics.histogram('http_request_duration_seconds', 'Time from receiving a request to sending its last byte, by route.')
+requests_total = metrics.counter('http_requests_total', 'Requests by route and response status.')
+request_db_seconds = metrics.histogram('http_request_db_seconds', 'Time a request spent executing database statements, by route.')
+request_statements = metrics.histogram('http_request_db_statements', 'Database statements executed per request, by route.', STATEMENT_BUCKETS)
+statements_total = metrics.counter('db_statements_total', 'Database statements executed, inside or outside a request.')
+checkout_seconds = metrics.histogram('db_pool_checkout_seconds', 'Time spent waiting for a connection from the pool.')
+
+current_request = ContextVar('current_request', default=None)
+routes = {}
+
+
+class RequestStats:
+    __slots__ = ('scope', 'db_seconds', 'statements')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.db_seconds = 0.0
+        self.statements = 0
+
+
+def timed_checkout(pool_class):
+    class TimedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                checkout_seconds.observe(time.perf_counter() - start)
+    TimedPool.__name__ = 'Timed' + pool_class.__name__
+    return TimedPool
+
+TimedQueuePool = timed_checkout(QueuePool)
+TimedAsyncPool = timed_checkout(AsyncAdaptedQueuePool)
+
+def start_statement(connection, cursor, statement, parameters, context, executemany):
+    context.instrumented_at = time.perf_counter()
+
+def finish_statement(connection, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.instrumented_at
+    statements_total.inc()
+    stats = current_request.get()
+    if stats is not None:
+        stats.db_seconds += elapsed
+        stats.statements += 1
+
+def route_of(scope):
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return UNMATCHED
+    path = routes.get(endpoint)
+    if path is None:
+        path = next((route.path for route in scope['app'].routes if getattr(route, 'endpoint', None) is endpoint or getattr(route, 'app', None) is endpoint), UNMATCHED)
+        routes[endpoint] = path
+    return path
+
+def instrument(engine):
+    event.listen(engine, 'before_cursor_execute', start_statement)
+    event.listen(engine, 'after_cursor_execute', finish_statement)
+    return engine
+
+
+class RequestMetrics:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            route, method = route_of(scope), scope['method']
+            request_seconds.observe(elapsed, method=method, route=route)
+            requests_total.inc(method=method, route=route, status=status)
+            request_db_seconds.observe(stats.db_seconds, method=method, route=route)
+            request_statements.observe(stats.statements, method=method, route=route)
@@ -0,0 +1,41 @@
+import hashlib
+import os
+import time
+from utils.images import FULL, IMAGE_PATH, PUBLIC_PATH, VARIANTS, ImageRejected, encode
+from utils.settings import Settings
+
+settings = Settings()
+SCHEMA = 'pharmaguide'
+
+LEGACY_IMAGES = [
+    ('product_image', 'name', 'digest', 'digest = md5(name)', os.path.join(PUBLIC_PATH, 'products')),
+    ('pharmacy_image', 'name', 'digest', 'digest = md5(name)', os.path.join(PUBLIC_PATH, 'pharmacies')),
+    ('advertisement', 'advertisement_image', 'advertisement_image', "advertisement_image !~ '^[0-9a-f]{32}$'", os.path.join(PUBLIC_PATH, 'advertisements')),
+]
+
+def store(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    directory = os.path.join(IMAGE_PATH, digest)
+    if not os.path.exists(os.path.join(directory, FULL)):
+        encode(data, directory, settings.IMAGE_MAX_PIXELS, sorted(VARIANTS.values()), time.time())
+    return digest
+
+def backfill(cursor):
+    results = []
+    for table, name_column, digest_column, legacy, directory in LEGACY_IMAGES:
+        cursor.execute(f'SELECT DISTINCT {name_column} FROM {SCHEMA}.{table} WHERE {legacy}')
+        for name, in cursor.fetchall():
+            path = os.path.join(directory, os.path.basename(name))
+            if not os.path.exists(path):
+                results.append((table, name, 'missing'))
+                continue
+            try:
+                digest = store(path)
+            except (ImageRejected, OSError) as error:
+                results.append((table, name, f'rejected: {error}'))
+                continue
+            cursor.execute(f'UPDATE {SCHEMA}.{table} SET {digest_column} = %s WHERE {name_column} = %s AND {legacy}', (digest, name))
+            results.append((table, name, 'moved'))
+    return results
@@ -0,0 +1,14 @@
+from sqlalchemy.orm import selectinload, joinedload, subqueryload
+from utils.settings import Settings
+
+settings = Settings()
+STRATEGIES = { 'selectin' : selectinload, 'joined' : joinedload, 'subquery' : subqueryload }
+DEFAULT_STRATEGY = 'selectin'
+
+for endpoint, strategy in settings.LOAD_STRATEGIES.items():
+    if strategy not in STRATEGIES:
+        raise ValueError(f'unknown loading strategy {strategy!r} for {endpoint}')
+
+def eager(endpoint, *relationships):
+    loader = STRATEGIES[settings.LOAD_STRATEGIES.get(endpoint, DEFAULT_STRATEGY)]
+    return [loader(relationship) for relationship in relationships]
@@ -0,0 +1,89 @@
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+registry = []
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def format_labels(key, extra = ()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+
+    def inc(self, amount = 1, **labels):
+        key = label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self.values[label_key(labels)] = value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        for key, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                yield self.name + '_bucket', key + (('le', bound),), cumulative
+            yield self.name + '_sum', key, total
+            yield self.name + '_count', key, count
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+def counter(name, description):
+    return register(Counter(name, description))
+
+def gauge(name, description):
+    return register(Gauge(name, description))
+
+def histogram(name, description, buckets = DEFAULT_BUCKETS):
+    return register(Histogram(name, description, buckets))
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, key, value in metric.samples():
+            lines.append(f'{name}{format_labels(key)} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+from utils.database import url
+from utils.legacy_images import backfill
+from utils.models import Base
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+LOCK_ID = 7403211
+SCHEMA = 'pharmaguide'
+
+TRACKING = f'''
+CREATE SCHEMA IF NOT EXISTS {SCHEMA};
+CREATE TABLE IF NOT EXISTS {SCHEMA}.schema_migrations (
+  version INT NOT NULL,
+  name VARCHAR(100) NOT NULL,
+  checksum VARCHAR(32) NOT NULL,
+  applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+  CONSTRAINT pk_sm PRIMARY KEY (version)
+)
+'''
+
+INVALID_INDEXES = '''
+SELECT c.relname FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE NOT i.indisvalid AND n.nspname = %s
+'''
+
+
+class Migration:
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.version = int(self.name.split('_', 1)[0])
+        with open(path, encoding='utf-8') as file:
+            self.script = file.read()
+        self.checksum = hashlib.md5(self.script.encode()).hexdigest()
+        self.concurrent = re.search(r'\bCONCURRENTLY\b', self.script, re.I) != None
+        self.indexes = { name.lower() for name in re.findall(r'\bINDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', self.script, re.I) }
+
+    def statements(self):
+        return [statement.strip() for statement in re.split(r';\s*$', self.script, flags=re.M) if statement.strip()]
+
+
+def migrations(directory = MIGRATIONS):
+    found = sorted((Migration(os.path.join(directory, name)) for name in os.listdir(directory) if re.match(r'^\d+_\w+\.sql$', name)), key=lambda migration: migration.version)
+    versions = [migration.version for migration in found]
+    if len(versions) != len(set(versions)):
+        raise SystemExit('duplicate migration version in ' + directory)
+    return found
+
+def connect(engine, wait):
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            return engine.raw_connection()
+        except OperationalError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(1)
+
+def applied(cursor):
+    cursor.execute(f'SELECT version, checksum FROM {SCHEMA}.schema_migrations')
+    return dict(cursor.fetchall())
+
+def drop_invalid_indexes(cursor, names):
+    cursor.execute(INVALID_INDEXES, (SCHEMA,))
+    for index, in cursor.fetchall():
+        if index in names:
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.{index}')
+
+def record(cursor, migration):
+    cursor.execute(f'INSERT INTO {SCHEMA}.schema_migrations (version, name, checksum) VALUES (%s, %s, %s)', (migration.version, migration.name, migration.checksum))
+
+def apply(connection, migration):
+    cursor = connection.cursor()
+    if not migration.concurrent:
+        connection.autocommit = False
+        try:
+            cursor.execute(migration.script)
+            record(cursor, migration)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.autocommit = True
+        return
+    drop_invalid_indexes(cursor, migration.indexes)
+    for statement in migration.statements():
+        cursor.execute(statement)
+    record(cursor, migration)
+
+def migrate(wait = 0):
+    engine = create_engine(url, poolclass=NullPool)
+    proxy = connect(engine, wait)
+    connection = proxy.driver_connection
+    done = []
+    try:
+        connection.autocommit = True
+        cursor = connection.cursor()
+        cursor.execute('SELECT pg_advisory_lock(%s)', (LOCK_ID,))
+        cursor.execute(TRACKING)
+        versions = applied(cursor)
+        for migration in migrations():
+            if migration.version in versions:
+                if versions[migration.version] != migration.checksum:
+                    raise SystemExit(f'{migration.name} was modified after being applied')
+                continue
+            start = time.perf_counter()
+            apply(connection, migration)
+            done.append(migration)
+            print(f'applied {migration.name} in {time.perf_counter() - start:.2f}s')
+        for table, name, result in backfill(cursor):
+            print(f'legacy image {table} {name}: {result}')
+        cursor.execute('SELECT pg_advisory_unlock(%s)', (LOCK_ID,))
+    finally:
+        proxy.close()
+        engine.dispose()
+    return done
+
+def covered(columns, indexes):
+    return any(index[:len(columns)] == columns for index in indexes)
+
+def check(wait = 0):
+    engine = create_engine(url, poolclass=NullPool)
+    connect(engine, wait).close()
+    problems = []
+    try:
+        inspector = inspect(engine)
+        live = set(inspector.get_table_names(schema=SCHEMA))
+        for table in Base.metadata.sorted_tables:
+            if table.name not in live:
+                problems.append(f'{table.fullname}: table missing')
+                continue
+            columns = { column['name'] for column in inspector.get_columns(table.name, schema=SCHEMA) }
+            for column in table.columns:
+                if column.name not in columns:
+                    problems.append(f'{table.fullname}.{column.name}: column missing')
+            indexes = [inspector.get_pk_constraint(table.name, schema=SCHEMA)['constrained_columns']]
+            indexes += [index['column_names'] for index in inspector.get_indexes(table.name, schema=SCHEMA)]
+            indexes += [constraint['column_names'] for constraint in inspector.get_unique_constraints(table.name, schema=SCHEMA)]
+            required = {}
+            for constraint in table.foreign_key_constraints:
+                required.setdefault(tuple(column.name for column in constraint.columns), 'unindexed foreign key')
+            for index in table.indexes:
+                required.setdefault(tuple(column.name for column in index.columns), 'unindexed filter column')
+            for names, problem in required.items():
+                if not covered(list(names), indexes):
+                    problems.append(f'{table.fullname}({", ".join(names)}): {problem}')
+        with engine.connect() as connection:
+            for index, in connection.exec_driver_sql(INVALID_INDEXES, (SCHEMA,)).all():
+                problems.append(f'{SCHEMA}.{index}: invalid index, rerun the migration that creates it')
+    finally:
+        engine.dispose()
+    return problems
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply pending migrations from app/migrations, or check the live schema against utils/models.py.')
+    parser.add_argument('--check', action='store_true', help='report unindexed foreign keys and filter columns instead of migrating')
+    parser.add_argument('--wait', type=float, default=0, help='seconds to wait for the database to accept connections')
+    args = parser.parse_args()
+    if args.check:
+        problems = check(args.wait)
+        for problem in problems:
+            print(problem)
+        sys.exit(1 if problems else 0)
+    if not migrate(args.wait):
+        print('schema is up to date')
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, DECIMAL
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, ForeignKey, Integer, String, DECIMAL
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from utils.database import Base
 
 class UserType(Base):
@@ -20,8 +21,8 @@ class User(Base):
     username = Column(String(50))
     password = Column(String(25))
     email = Column(String(52))
-    type = Column(Integer, ForeignKey("pharmaguide.user_type.id"))
-    user_type = relationship("UserType", back_populates="users")
+    type = Column(Integer, ForeignKey("pharmaguide.user_type.id"), index=True)
+    user_type = relationship("UserType", back_populates="users", lazy="selectin")
 
     pharmacy = relationship("Pharmacy", back_populates="user")
 
@@ -36,9 +37,9 @@ class Pharmacy(Base):
     lat = Column(DECIMAL)
     lng = Column(DECIMAL)
     contact = Column(String(50))
-    owner = Column(Integer, ForeignKey('pharmaguide.user.user_id'))
+    owner = Column(Integer, ForeignKey('pharmaguide.user.user_id'), index=True)
 
-    images = relationship("PharmacyImage", back_populates="pharmacy")
+    images = relationship("PharmacyImage", back_populates="pharmacy", lazy="selectin")
     user = relationship("User", back_populates="pharmacy")
 
 
@@ -47,7 +48,8 @@ class PharmacyImage(Base):
     __table_args__ = { 'schema' : 'pharmaguide' }
 
     name = Column(String(44), primary_key=True)
-    pharmacy_id = Column(Integer, ForeignKey('pharmaguide.pharmacy.pharmacy_id'))
+    digest = Column(String(32), nullable=False, index=True)
+    pharmacy_id = Column(Integer, ForeignKey('pharmaguide.pharmacy.pharmacy_id'), index=True)
 
     pharmacy = relationship("Pharmacy", back_populates="images")
     
@@ -66,9 +68,15 @@ class Product(Base):
 
     product_id = Column(Integer, primary_key=True, index=True)
     name = Column(String(60), nullable=False)
-    code = Column(String(12), nullable=False)
+    code = Column(String(12), nullable=False, index=True, unique=True)
     description = Column(String(200))
-    images = relationship("ProductImage", back_populates="product")
+    search = deferred(Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('simple', name), 'A') || "
+        "setweight(to_tsvector('simple', code), 'A') || "
+        "setweight(to_tsvector('spanish', coalesce(description, '')), 'B')",
+        persisted=True
+    )))
+    images = relationship("ProductImage", back_populates="product", lazy="selectin")
 
 
 
@@ -77,7 +85,7 @@ class ProductCategory(Base):
     __table_args__ = { 'schema' : 'pharmaguide' }
 
     product_id = Column(Integer, ForeignKey('pharmaguide.product.product_id'), primary_key=True)
-    category_id = Column(Integer, ForeignKey('pharmaguide.category_name.category_id'), primary_key=True)
+    category_id = Column(Integer, ForeignKey('pharmaguide.category_name.category_id'), primary_key=True, index=True)
 
 
 class ProductImage(Base):
@@ -85,7 +93,8 @@ class ProductImage(Base):
     __table_args__ = { 'schema' : 'pharmaguide' }
 
     name = Column(String(44), primary_key=True)
-    product_id = Column(Integer, ForeignKey('pharmaguide.product.product_id'))
+    digest = Column(String(32), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey('pharmaguide.product.product_id'), index=True)
     product = relationship("Product", back_populates="images")
 
 
@@ -94,7 +103,7 @@ class Inventory(Base):
     __table_args__ = { 'schema' : 'pharmaguide' }
 
     product_id = Column(Integer, ForeignKey('pharmaguide.product.product_id'), primary_key=True)
-    pharmacy_id = Column(Integer, ForeignKey('pharmaguide.pharmacy.pharmacy_id'), primary_key=True)
+    pharmacy_id = Column(Integer, ForeignKey('pharmaguide.pharmacy.pharmacy_id'), primary_key=True, index=True)
     price = Column(DECIMAL, nullable=False)
     stock = Column(Integer)
 
@@ -106,5 +115,5 @@ class Advertisement(Base):
     advertisement_id = Column(Integer, nullable=False, primary_key=True, index=True)
     advertisement_title = Column(String(25), nullable=False)
     advertisement_description = Column(String(50), nullable=False)
-    advertisement_image = Column(String(50), nullable=False)
-    owner = Column(Integer, ForeignKey('pharmaguide.user.user_id'))
+    advertisement_image = Column(String(50), nullable=False, index=True)
+    owner = Column(Integer, ForeignKey('pharmaguide.user.user_id'), index=True)
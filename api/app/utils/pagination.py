@@ -0,0 +1,49 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from fastapi import Response
+from fastapi.exceptions import HTTPException
+from sqlalchemy import Integer, tuple_
+import json
+
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+def encode_cursor(values):
+    return urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def valid_value(key, value):
+    if isinstance(key.type, Integer):
+        return isinstance(value, int) and not isinstance(value, bool) and INT_MIN <= value <= INT_MAX
+    return isinstance(value, key.type.python_type)
+
+def decode_cursor(token, keys):
+    try:
+        values = json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise HTTPException(400, 'invalid cursor')
+    if not isinstance(values, list) or len(values) != len(keys) or not all(valid_value(key, value) for key, value in zip(keys, values)):
+        raise HTTPException(400, 'invalid cursor')
+    return values
+
+def after(keys, values):
+    if len(keys) == 1:
+        return keys[0] > values[0]
+    return tuple_(*keys) > tuple_(*values)
+
+def page(statement, keys, skip = 0, limit = 100, cursor = None):
+    statement = statement.order_by(*keys).limit(limit)
+    if cursor != None:
+        return statement.where(after(keys, decode_cursor(cursor, keys)))
+    return statement.offset(skip)
+
+def set_next_cursor(response : Response, rows, keys, limit):
+    if rows and len(rows) == limit:
+        response.headers['X-Next-Cursor'] = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+
+async def paginate(session, statement, keys, response : Response, skip = 0, limit = 100, cursor = None):
+    rows = (await session.scalars(page(statement, keys, skip, limit, cursor))).unique().all()
+    set_next_cursor(response, rows, keys, limit)
+    return rows
+
+async def paginate_rows(session, statement, keys, response : Response, skip = 0, limit = 100, cursor = None):
+    rows = (await session.execute(page(statement, keys, skip, limit, cursor))).all()
+    set_next_cursor(response, rows, keys, limit)
+    return rows
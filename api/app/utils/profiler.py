@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from utils import metrics
+from utils.instrumentation import current_request, route_of
+from utils.settings import Settings
+
+settings = Settings()
+logger = logging.getLogger(__name__)
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+MAX_STATEMENT_LENGTH = 4000
+
+slow_queries = metrics.counter('db_slow_queries_total', 'Statements slower than the profiler threshold, by route.')
+
+def shape(parameters):
+    if isinstance(parameters, dict):
+        return { key : type(value).__name__ for key, value in parameters.items() }
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+def explain_plan(session, statement, parameters):
+    plan = session.connection().exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+class SlowQuery:
+    __slots__ = ('at', 'duration', 'statement', 'parameters', 'executemany', 'method', 'route', 'position')
+
+    def __init__(self, statement, parameters, executemany, duration):
+        self.at = time.time()
+        self.duration = duration
+        self.statement = statement
+        self.parameters = parameters
+        self.executemany = executemany
+        stats = current_request.get()
+        if stats is None:
+            self.method, self.route, self.position = None, None, None
+        else:
+            self.method, self.route, self.position = stats.scope['method'], route_of(stats.scope), stats.statements
+
+    def explain_parameters(self):
+        if self.executemany:
+            return self.parameters[0] if self.parameters else ()
+        return self.parameters
+
+    def describe(self, plan = None):
+        return {
+            'at' : self.at,
+            'duration_ms' : self.duration * 1000,
+            'statement' : self.statement[:MAX_STATEMENT_LENGTH],
+            'parameters' : shape(self.explain_parameters()),
+            'executemany' : len(self.parameters) if self.executemany else None,
+            'method' : self.method,
+            'route' : self.route,
+            'position' : self.position,
+            'plan' : plan,
+        }
+
+
+class QueryProfiler:
+    def __init__(self, enabled, threshold, size):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.entries = deque(maxlen=size)
+        self.plans = {}
+        self.stopping = None
+        self.task = None
+
+    def record(self, connection, cursor, statement, parameters, context, executemany):
+        if not self.enabled:
+            return
+        duration = time.perf_counter() - context.instrumented_at
+        if duration < self.threshold or statement.startswith('EXPLAIN'):
+            return
+        entry = SlowQuery(statement, parameters, executemany, duration)
+        self.entries.append(entry)
+        slow_queries.inc(route=entry.route or 'none')
+
+    def configure(self, enabled = None, threshold = None, size = None):
+        if enabled != None:
+            self.enabled = enabled
+        if threshold != None:
+            self.threshold = threshold
+        if size != None and size != self.entries.maxlen:
+            self.entries = deque(self.entries, maxlen=size)
+
+    def clear(self):
+        self.entries.clear()
+        self.plans.clear()
+
+    def worst(self, count):
+        worst = {}
+        for entry in list(self.entries):
+            if entry.statement in self.plans or not entry.statement.lstrip().upper().startswith(EXPLAINABLE):
+                continue
+            if entry.statement not in worst or entry.duration > worst[entry.statement].duration:
+                worst[entry.statement] = entry
+        return sorted(worst.values(), key=lambda entry: entry.duration, reverse=True)[:count]
+
+    async def explain(self, new_session, count):
+        live = { entry.statement for entry in self.entries }
+        for statement in [statement for statement in self.plans if statement not in live]:
+            del self.plans[statement]
+        explained = 0
+        for entry in self.worst(count):
+            session = new_session()
+            try:
+                self.plans[entry.statement] = await session.run_sync(explain_plan, entry.statement, entry.explain_parameters())
+            except Exception as error:
+                self.plans[entry.statement] = { 'error' : str(error).splitlines()[0] }
+            finally:
+                await session.rollback()
+                await session.close()
+            explained += 1
+        return explained
+
+    def snapshot(self, limit = 100, route = None, min_ms = 0):
+        entries = [entry for entry in reversed(self.entries) if (route == None or entry.route == route) and entry.duration * 1000 >= min_ms]
+        return {
+            'enabled' : self.enabled,
+            'threshold_ms' : self.threshold * 1000,
+            'size' : self.entries.maxlen,
+            'entries' : [entry.describe(self.plans.get(entry.statement)) for entry in entries[:limit]],
+        }
+
+    async def run(self, new_session, interval, count):
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            if not self.enabled:
+                continue
+            try:
+                await self.explain(new_session, count)
+            except Exception:
+                logger.exception('could not explain slow queries')
+
+    def start(self, new_session):
+        self.stopping = asyncio.Event()
+        self.task = asyncio.create_task(self.run(new_session, settings.PROFILER_EXPLAIN_INTERVAL, settings.PROFILER_EXPLAIN_TOP))
+
+    async def stop(self):
+        if self.task:
+            self.stopping.set()
+            await self.task
+            self.task = None
+
+
+profiler = QueryProfiler(settings.PROFILER_ENABLED, settings.PROFILER_THRESHOLD_MS / 1000, settings.PROFILER_MAX_ENTRIES)
@@ -0,0 +1,24 @@
+from sqlalchemy import and_, exists, func, or_, select
+from utils.models import Product, ProductCategory
+
+def search_query(q):
+    return func.websearch_to_tsquery('simple', q).op('||')(func.websearch_to_tsquery('spanish', q))
+
+def category_filter(categories, match = 'any'):
+    if match == 'all':
+        return and_(*(exists().where(ProductCategory.product_id == Product.product_id, ProductCategory.category_id == category_id) for category_id in categories))
+    return exists().where(ProductCategory.product_id == Product.product_id, ProductCategory.category_id.in_(categories))
+
+def product_search(q, categories = None, limit = 20, options = ()):
+    query = search_query(q)
+    rank = func.ts_rank_cd(Product.search, query) + func.word_similarity(q, Product.name)
+    statement = (
+        select(Product, rank.label('rank'))
+        .where(or_(Product.search.bool_op('@@')(query), Product.name.bool_op('%>')(q)))
+        .order_by(rank.desc(), Product.product_id)
+        .limit(limit)
+        .options(*options)
+    )
+    if categories:
+        statement = statement.where(category_filter(categories))
+    return statement
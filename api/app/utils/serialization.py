@@ -0,0 +1,65 @@
+from collections import defaultdict
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import Float, cast, select
+from utils.images import image_variants
+from utils.models import Inventory, Pharmacy, PharmacyImage, Product, ProductImage
+from utils.pagination import paginate_rows
+from utils.settings import Settings
+
+settings = Settings()
+FAST_SERIALIZATION = settings.FAST_SERIALIZATION
+
+PRODUCT_COLUMNS = (Product.name, Product.code, Product.description, Product.product_id)
+PHARMACY_COLUMNS = (
+    Pharmacy.name,
+    Pharmacy.address,
+    cast(Pharmacy.lat, Float).label('lat'),
+    cast(Pharmacy.lng, Float).label('lng'),
+    Pharmacy.contact,
+    Pharmacy.owner,
+    Pharmacy.pharmacy_id,
+)
+INVENTORY_COLUMNS = (Inventory.product_id, Inventory.pharmacy_id, Inventory.stock, cast(Inventory.price, Float).label('price'))
+
+def records(rows):
+    if not rows:
+        return []
+    fields = rows[0]._fields
+    return [dict(zip(fields, row)) for row in rows]
+
+def image_records(column, rows):
+    images = defaultdict(list)
+    key = column.key
+    for owner, name, digest in rows:
+        images[owner].append({ key : owner, 'name' : name, 'digest' : digest, 'variants' : image_variants(digest) })
+    return images
+
+async def load_images(session, column, ids):
+    if not ids:
+        return {}
+    model = column.class_
+    statement = select(column, model.name, model.digest).where(column.in_(ids)).order_by(column, model.name)
+    return image_records(column, (await session.execute(statement)).all())
+
+def attach_images(entities, key, images):
+    for entity in entities:
+        entity['images'] = images.get(entity[key], [])
+    return entities
+
+def respond(response : Response, content):
+    return ORJSONResponse(content, headers=dict(response.headers))
+
+async def product_page(session, response : Response, skip = 0, limit = 100, cursor = None, filters = ()):
+    products = records(await paginate_rows(session, select(*PRODUCT_COLUMNS).where(*filters), [Product.product_id], response, skip, limit, cursor))
+    images = await load_images(session, ProductImage.product_id, [product['product_id'] for product in products])
+    return respond(response, attach_images(products, 'product_id', images))
+
+async def pharmacy_page(session, response : Response, skip = 0, limit = 100, cursor = None):
+    pharmacies = records(await paginate_rows(session, select(*PHARMACY_COLUMNS), [Pharmacy.pharmacy_id], response, skip, limit, cursor))
+    images = await load_images(session, PharmacyImage.pharmacy_id, [pharmacy['pharmacy_id'] for pharmacy in pharmacies])
+    return respond(response, attach_images(pharmacies, 'pharmacy_id', images))
+
+async def inventory_page(session, response : Response, skip = 0, limit = 100, cursor = None):
+    inventories = records(await paginate_rows(session, select(*INVENTORY_COLUMNS), [Inventory.product_id, Inventory.pharmacy_id], response, skip, limit, cursor))
+    return respond(response, inventories)
@@ -11,3 +11,42 @@ class Settings(BaseSettings):
     POSTGRES_DATABASE : str = environ['POSTGRES_DATABASE']
     POSTGRES_SCHEMA : str = environ['POSTGRES_SCHEMA']
     POSTGRES_PORT : int = environ['POSTGRES_PORT']
+    POOL_SIZE : int = environ.get('POOL_SIZE', 10)
+    POOL_MAX_OVERFLOW : int = environ.get('POOL_MAX_OVERFLOW', 20)
+    POOL_TIMEOUT : float = environ.get('POOL_TIMEOUT', 30)
+    POOL_RECYCLE : int = environ.get('POOL_RECYCLE', 1800)
+    POOL_PRE_PING : bool = environ.get('POOL_PRE_PING', True)
+    ASYNC_DB : bool = environ.get('ASYNC_DB', True)
+    IMAGE_WORKERS : int = environ.get('IMAGE_WORKERS', 2)
+    IMAGE_QUEUE_DEPTH : int = environ.get('IMAGE_QUEUE_DEPTH', 8)
+    IMAGE_MAX_BYTES : int = environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+    IMAGE_MAX_PIXELS : int = environ.get('IMAGE_MAX_PIXELS', 40_000_000)
+    IMAGE_WIDTHS : list[int] = environ.get('IMAGE_WIDTHS', [160, 320, 480, 800, 1200])
+    IMAGE_CACHE_BYTES : int = environ.get('IMAGE_CACHE_BYTES', 512 * 1024 * 1024)
+    LOAD_STRATEGIES : dict[str, str] = environ.get('LOAD_STRATEGIES', {})
+    GEO_CELL_DEGREES : float = environ.get('GEO_CELL_DEGREES', 0.05)
+    AVAILABILITY_TTL : float = environ.get('AVAILABILITY_TTL', 30)
+    IMPORT_BATCH_ROWS : int = environ.get('IMPORT_BATCH_ROWS', 10000)
+    IMPORT_MAX_ERRORS : int = environ.get('IMPORT_MAX_ERRORS', 1000)
+    IMPORT_WORK_MEM : str = environ.get('IMPORT_WORK_MEM', '64MB')
+    INVENTORY_BATCH_MAX : int = environ.get('INVENTORY_BATCH_MAX', 1000)
+    STOCK_FLUSH_INTERVAL : float = environ.get('STOCK_FLUSH_INTERVAL', 0.5)
+    CACHE_BACKEND : str = environ.get('CACHE_BACKEND', 'memory')
+    CACHE_URL : str = environ.get('CACHE_URL', 'redis://localhost:6379/0')
+    CACHE_TTL : float = environ.get('CACHE_TTL', 300)
+    CACHE_MAX_ENTRIES : int = environ.get('CACHE_MAX_ENTRIES', 10000)
+    CODE_CACHE_TTL : float = environ.get('CODE_CACHE_TTL', 60)
+    CODE_BATCH_MAX : int = environ.get('CODE_BATCH_MAX', 500)
+    SUGGEST_INDEX : bool = environ.get('SUGGEST_INDEX', True)
+    BATCH_MAX_IDS : int = environ.get('BATCH_MAX_IDS', 500)
+    EXPORT_BATCH_ROWS : int = environ.get('EXPORT_BATCH_ROWS', 1000)
+    EXPORT_MAX_ACTIVE : int = environ.get('EXPORT_MAX_ACTIVE', 4)
+    PROFILER_ENABLED : bool = environ.get('PROFILER_ENABLED', False)
+    PROFILER_THRESHOLD_MS : float = environ.get('PROFILER_THRESHOLD_MS', 100)
+    PROFILER_MAX_ENTRIES : int = environ.get('PROFILER_MAX_ENTRIES', 500)
+    PROFILER_EXPLAIN_INTERVAL : float = environ.get('PROFILER_EXPLAIN_INTERVAL', 60)
+    PROFILER_EXPLAIN_TOP : int = environ.get('PROFILER_EXPLAIN_TOP', 5)
+    DEBUG_TOKEN : str = environ.get('DEBUG_TOKEN', '')
+    FAST_SERIALIZATION : bool = environ.get('FAST_SERIALIZATION', True)
+    CACHE_CONTROL : dict[str, str] = environ.get('CACHE_CONTROL', {})
+    ETAG_VERSION_TTL : float = environ.get('ETAG_VERSION_TTL', 1)
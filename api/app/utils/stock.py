@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+from fastapi.exceptions import HTTPException
+from sqlalchemy import Integer, bindparam, cast, func, select, update
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.dialects.postgresql import ARRAY
+from utils import metrics
+from utils.cache import availability_cache
+from utils.database import new_session
+from utils.models import Inventory
+from utils.settings import Settings
+
+settings = Settings()
+logger = logging.getLogger(__name__)
+inventory = Inventory.__table__
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+
+flush_seconds = metrics.histogram('stock_flush_seconds', 'Time spent writing a batch of buffered stock deltas.')
+flushed_deltas = metrics.counter('stock_flushed_total', 'Buffered stock deltas by flush result.')
+failed_flushes = metrics.counter('stock_flush_failures_total', 'Flushes of buffered stock deltas that failed and were retried later.')
+pending_deltas = metrics.gauge('stock_pending', 'Inventory rows with a buffered stock delta.')
+
+def apply_delta(product_id, pharmacy_id, delta, non_negative = False):
+    stock = func.coalesce(inventory.c.stock, 0) + delta
+    statement = (
+        update(inventory)
+        .where(inventory.c.product_id == product_id, inventory.c.pharmacy_id == pharmacy_id)
+        .values(stock=stock)
+        .returning(inventory.c.product_id, inventory.c.pharmacy_id, inventory.c.price, inventory.c.stock)
+    )
+    if non_negative:
+        statement = statement.where(stock >= 0)
+    return statement
+
+deltas = select(func.unnest(
+    cast(bindparam('product_ids'), ARRAY(Integer)),
+    cast(bindparam('pharmacy_ids'), ARRAY(Integer)),
+    cast(bindparam('deltas'), ARRAY(Integer))
+).table_valued('product_id', 'pharmacy_id', 'delta').render_derived()).cte('deltas')
+
+APPLY_DELTAS = (
+    update(inventory)
+    .where(inventory.c.product_id == deltas.c.product_id, inventory.c.pharmacy_id == deltas.c.pharmacy_id)
+    .values(stock=func.coalesce(inventory.c.stock, 0) + deltas.c.delta)
+    .returning(inventory.c.product_id, inventory.c.pharmacy_id)
+)
+
+
+class StockBuffer:
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}
+        self.stopping = None
+        self.task = None
+
+    def add(self, product_id, pharmacy_id, delta):
+        key = (product_id, pharmacy_id)
+        total = self.pending.get(key, 0) + delta
+        if not INT_MIN <= total <= INT_MAX:
+            raise HTTPException(409, 'buffered stock delta out of range')
+        self.pending[key] = total
+        pending_deltas.set(len(self.pending))
+        return self.pending[key]
+
+    def restore(self, batch):
+        for key, delta in batch.items():
+            self.pending[key] = self.pending.get(key, 0) + delta
+        pending_deltas.set(len(self.pending))
+
+    async def write(self, batch):
+        parameters = {
+            'product_ids' : [product_id for product_id, _ in batch],
+            'pharmacy_ids' : [pharmacy_id for _, pharmacy_id in batch],
+            'deltas' : list(batch.values()),
+        }
+        session = new_session()
+        try:
+            applied = { (row.product_id, row.pharmacy_id) for row in await session.execute(APPLY_DELTAS, parameters) }
+            await session.commit()
+        finally:
+            await session.close()
+        return applied
+
+    async def write_isolated(self, batch, done):
+        try:
+            applied = await self.write(batch)
+        except DBAPIError as error:
+            if error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError)):
+                raise
+            if len(batch) == 1:
+                (key, delta), = batch.items()
+                logger.error('dropped buffered stock delta %s for %s: %s', delta, key, error.orig)
+                flushed_deltas.inc(result='rejected')
+                done.update(batch)
+                return set()
+            keys = list(batch)
+            middle = len(keys) // 2
+            applied = await self.write_isolated({ key : batch[key] for key in keys[:middle] }, done)
+            return applied | await self.write_isolated({ key : batch[key] for key in keys[middle:] }, done)
+        done.update(batch)
+        flushed_deltas.inc(len(applied), result='applied')
+        flushed_deltas.inc(len(batch) - len(applied), result='missing')
+        for product_id in { product_id for product_id, _ in applied }:
+            availability_cache.invalidate(product_id)
+        return applied
+
+    async def flush(self):
+        batch = { key : delta for key, delta in self.pending.items() if delta }
+        self.pending = {}
+        pending_deltas.set(0)
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        done = set()
+        try:
+            applied = await self.write_isolated(batch, done)
+        except BaseException:
+            self.restore({ key : delta for key, delta in batch.items() if key not in done })
+            raise
+        flush_seconds.observe(time.perf_counter() - start)
+        return len(applied)
+
+    async def run(self):
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                failed_flushes.inc()
+                logger.exception('could not flush buffered stock deltas')
+
+    def start(self):
+        self.stopping = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.stopping.set()
+            await self.task
+            self.task = None
+        while self.pending:
+            try:
+                await self.flush()
+            except Exception:
+                failed_flushes.inc()
+                logger.exception('could not flush buffered stock deltas at shutdown, lost: %s', self.pending)
+                return
+
+
+stock_buffer = StockBuffer(settings.STOCK_FLUSH_INTERVAL)
@@ -0,0 +1,138 @@
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from sqlalchemy import case, func, select
+from utils.database import new_session
+from utils.models import Product
+from utils.settings import Settings
+
+settings = Settings()
+LAST_CHARACTER = chr(0x10ffff)
+
+def normalize(text):
+    if text.isascii():
+        return ' '.join(text.lower().split())
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(''.join(character for character in decomposed if not unicodedata.combining(character)).split())
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.buckets = {}
+        self.lengths = []
+        self.products = {}
+
+    def __len__(self):
+        return len(self.products)
+
+    def keys_of(self, name, code, normalized = None):
+        keys = set()
+        for value in (name, code):
+            if value:
+                key = normalized.get(value) if normalized != None else None
+                if key == None:
+                    key = normalize(value)
+                    key = value if key == value else key
+                    if normalized != None:
+                        normalized[value] = key
+                keys.add(key)
+        return keys
+
+    def bucket(self, length):
+        bucket = self.buckets.get(length)
+        if bucket is None:
+            bucket = self.buckets[length] = ([], array('i'))
+            insort(self.lengths, length)
+        return bucket
+
+    def build(self, rows):
+        entries, normalized = {}, {}
+        self.products.clear()
+        for id, name, code in rows:
+            self.products[id] = (name, code)
+            for key in self.keys_of(name, code, normalized):
+                entries.setdefault(len(key), []).append((key, id))
+        self.buckets = {}
+        self.lengths = sorted(entries)
+        for length, pairs in entries.items():
+            pairs.sort()
+            self.buckets[length] = ([key for key, _ in pairs], array('i', (id for _, id in pairs)))
+
+    def add(self, id, name, code):
+        self.remove(id)
+        self.products[id] = (name, code)
+        for key in self.keys_of(name, code):
+            keys, ids = self.bucket(len(key))
+            position = bisect_left(keys, key)
+            while position < len(keys) and keys[position] == key and ids[position] < id:
+                position += 1
+            keys.insert(position, key)
+            ids.insert(position, id)
+
+    def remove(self, id):
+        product = self.products.pop(id, None)
+        if product is None:
+            return
+        for key in self.keys_of(*product):
+            keys, ids = self.buckets[len(key)]
+            position = bisect_left(keys, key)
+            while keys[position] == key and ids[position] != id:
+                position += 1
+            del keys[position]
+            del ids[position]
+
+    def suggest(self, prefix, k):
+        prefix = normalize(prefix)
+        upper = prefix + LAST_CHARACTER
+        found, seen = [], set()
+        for length in self.lengths[bisect_left(self.lengths, len(prefix)):]:
+            keys, ids = self.buckets[length]
+            start = bisect_left(keys, prefix)
+            for position in range(start, bisect_left(keys, upper, start)):
+                id = ids[position]
+                if id not in seen:
+                    seen.add(id)
+                    name, code = self.products[id]
+                    found.append({ 'product_id' : id, 'name' : name, 'code' : code })
+                    if len(found) == k:
+                        return found
+        return found
+
+
+product_index = PrefixIndex()
+
+async def load_product_index():
+    if not settings.SUGGEST_INDEX:
+        return
+    session = new_session()
+    try:
+        rows = (await session.execute(select(Product.product_id, Product.name, Product.code))).all()
+    finally:
+        await session.close()
+    product_index.build(rows)
+
+def index_product(product):
+    if settings.SUGGEST_INDEX:
+        product_index.add(product.product_id, product.name, product.code)
+
+def unindex_product(id):
+    if settings.SUGGEST_INDEX:
+        product_index.remove(id)
+
+async def product_suggestions(prefix, k):
+    if settings.SUGGEST_INDEX:
+        return product_index.suggest(prefix, k)
+    pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    name_matches, code_matches = Product.name.ilike(pattern), Product.code.ilike(pattern)
+    length = func.least(case((name_matches, func.length(Product.name))), case((code_matches, func.length(Product.code))))
+    statement = (
+        select(Product.product_id, Product.name, Product.code)
+        .where(name_matches | code_matches)
+        .order_by(length, func.lower(Product.name), Product.product_id)
+        .limit(k)
+    )
+    session = new_session()
+    try:
+        return [dict(row._mapping) for row in await session.execute(statement)]
+    finally:
+        await session.close()
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+CWD = os.getcwd()
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(samples):
+    return {
+        'count' : len(samples),
+        'p50_ms' : percentile(samples, 50) * 1000,
+        'p95_ms' : percentile(samples, 95) * 1000,
+        'p99_ms' : percentile(samples, 99) * 1000,
+    }
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def report(name, rows, output = None):
+    print(name)
+    for row in rows:
+        print('  ' + '  '.join(f'{key}={value:.3f}' if isinstance(value, float) else f'{key}={value}' for key, value in row.items()))
+    if output:
+        with open(os.path.join(CWD, output), 'w') as file:
+            json.dump({ 'benchmark' : name, 'results' : rows }, file, indent=2)
+
+class AppClient:
+    def __init__(self, app):
+        self.app = app
+
+    async def __aenter__(self):
+        import httpx
+        await self.app.router.startup()
+        self.client = httpx.AsyncClient(app=self.app, base_url='http://bench')
+        return self.client
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        await self.app.router.shutdown()
+
+class LiveServer:
+    def __init__(self, app, port = 8765):
+        self.app = app
+        self.port = port
+
+    async def __aenter__(self):
+        import asyncio
+        import httpx
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host='127.0.0.1', port=self.port, log_level='warning'))
+        self.task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            if self.task.done():
+                self.task.result()
+            await asyncio.sleep(0.05)
+        self.client = httpx.AsyncClient(base_url=f'http://127.0.0.1:{self.port}', timeout=None)
+        return self.client
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        self.server.should_exit = True
+        await self.task
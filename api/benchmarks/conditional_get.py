@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import time
+import common
+from sqlalchemy import text
+from main import app
+from utils.database import new_session
+
+SEED = '''
+INSERT INTO pharmaguide.product (product_id, name, code, description)
+SELECT p, 'Product ' || p, lpad(p::text, 12, '0'), repeat('description ', 10) FROM generate_series(1000000, 1000000 + :products - 1) p;
+INSERT INTO pharmaguide.user_type (id, user_type) VALUES (1000000, 'bench');
+INSERT INTO pharmaguide.user (user_id, name, username, password, email, type) VALUES (1000000, 'bench', 'bench', 'bench', 'bench@example.com', 1000000);
+INSERT INTO pharmaguide.pharmacy (pharmacy_id, name, address, lat, lng, contact, owner)
+SELECT f, 'Pharmacy ' || f, 'Address ' || f, 13.7, -89.2, '2222-0000', 1000000 FROM generate_series(1000000, 1000000 + :products - 1) f
+'''
+
+CLEANUP = '''
+DELETE FROM pharmaguide.pharmacy WHERE pharmacy_id >= 1000000;
+DELETE FROM pharmaguide.user WHERE user_id = 1000000;
+DELETE FROM pharmaguide.user_type WHERE id = 1000000;
+DELETE FROM pharmaguide.product WHERE product_id >= 1000000
+'''
+
+PATHS = ['/product/', '/pharmacy/', '/advertisement/']
+
+async def execute(script, parameters = {}):
+    session = new_session()
+    try:
+        for statement in script.strip().split(';\n'):
+            await session.execute(text(statement), parameters)
+        await session.commit()
+    finally:
+        await session.close()
+
+async def poll(client, path, params, polls, conditional):
+    latencies, transferred, tag = [], 0, None
+    for _ in range(polls):
+        headers = { 'If-None-Match' : tag } if conditional and tag else {}
+        start = time.perf_counter()
+        response = await client.get(path, params=params, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        transferred += len(response.content)
+        tag = response.headers.get('etag', tag)
+    return latencies, transferred
+
+async def run(products, limit, polls):
+    await execute(SEED, { 'products' : products })
+    results = []
+    try:
+        async with common.AppClient(app) as client:
+            for path in PATHS:
+                params = { 'limit' : limit }
+                for conditional in (False, True):
+                    latencies, transferred = await poll(client, path, params, polls, conditional)
+                    results.append({
+                        'path' : path,
+                        'mode' : 'if_none_match' if conditional else 'plain',
+                        'bytes_per_poll' : transferred / polls,
+                        **common.summarize(latencies),
+                    })
+    finally:
+        await execute(CLEANUP)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bytes and latency of repeated list polls with and without If-None-Match.')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--polls', type=int, default=200)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('conditional_get', asyncio.run(run(args.products, args.limit, args.polls)), args.output)
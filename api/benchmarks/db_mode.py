@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import common
+
+async def measure(path, concurrency, requests):
+    from main import app
+    samples = []
+    async with common.AppClient(app) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def hit():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path)
+                samples.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        await asyncio.gather(*(hit() for _ in range(concurrency)))
+        samples.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(hit() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+    return { 'req_per_s' : requests / elapsed, **common.summarize(samples) }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the sync (threadpool) and async (asyncpg) database modes.')
+    parser.add_argument('--path', default='/product/?limit=50')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--mode', choices=['sync', 'async'])
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    if args.mode:
+        result = asyncio.run(measure(args.path, args.concurrency, args.requests))
+        print(json.dumps({ 'mode' : args.mode, **result }))
+    else:
+        rows = []
+        for mode in ('sync', 'async'):
+            env = dict(os.environ, ASYNC_DB=str(mode == 'async'))
+            command = [sys.executable, __file__, '--mode', mode, '--path', args.path, '--concurrency', str(args.concurrency), '--requests', str(args.requests)]
+            output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+            rows.append(json.loads(output.strip().splitlines()[-1]))
+        common.report('db_mode', rows, args.output)
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import resource
+import time
+import common
+from sqlalchemy import text
+from main import app
+from utils.database import new_session
+
+SEED = '''
+INSERT INTO pharmaguide.product (product_id, name, code, description)
+SELECT p, 'Product ' || p, lpad(p::text, 12, '0'), repeat('description ', 10) FROM generate_series(1000000, 1000000 + :products - 1) p;
+INSERT INTO pharmaguide.product_image (name, digest, product_id)
+SELECT 'bench-' || p || '.webp', md5(p::text), p FROM generate_series(1000000, 1000000 + :products - 1, 2) p
+'''
+
+CLEANUP = '''
+DELETE FROM pharmaguide.product_image WHERE product_id >= 1000000;
+DELETE FROM pharmaguide.product WHERE product_id >= 1000000
+'''
+
+async def execute(script, parameters = {}):
+    session = new_session()
+    try:
+        for statement in script.strip().split(';\n'):
+            await session.execute(text(statement), parameters)
+        await session.commit()
+    finally:
+        await session.close()
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def download(client, params):
+    start = time.perf_counter()
+    first_byte, transferred, lines = None, 0, 0
+    async with client.stream('GET', '/export/product.ndjson', params=params) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            transferred += len(chunk)
+            if 'gzip' not in params:
+                lines += chunk.count(b'\n')
+    return time.perf_counter() - start, first_byte, transferred, lines
+
+async def poll(client, done, latencies):
+    while not done.is_set():
+        start = time.perf_counter()
+        response = await client.get('/product/', params={ 'limit' : 10 })
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        await asyncio.sleep(0.01)
+
+async def run(products, variants, port):
+    await execute(SEED, { 'products' : products })
+    results = []
+    try:
+        async with common.LiveServer(app, port) as client:
+            for name, params in variants:
+                done, latencies = asyncio.Event(), []
+                poller = asyncio.create_task(poll(client, done, latencies))
+                rss = peak_rss_mb()
+                elapsed, first_byte, transferred, lines = await download(client, params)
+                done.set()
+                await poller
+                results.append({
+                    'variant' : name,
+                    'rows_per_s' : (lines or products) / elapsed,
+                    'first_byte_ms' : first_byte * 1000,
+                    'mb' : transferred / 2 ** 20,
+                    'peak_rss_growth_mb' : peak_rss_mb() - rss,
+                    **{ 'concurrent_' + key : value for key, value in common.summarize(latencies).items() },
+                })
+    finally:
+        await execute(CLEANUP)
+    return results
+
+VARIANTS = [
+    ('plain', {}),
+    ('include', { 'include' : 'images,categories' }),
+    ('gzip', { 'gzip' : 'true' }),
+]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput, memory and impact on concurrent requests of the product NDJSON export.')
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('export', asyncio.run(run(args.products, VARIANTS, args.port)), args.output)
@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import random
+import time
+import common
+from sqlalchemy import func, select, text
+from utils.database import new_session
+from utils.facets import CategoryBitmaps
+from utils.models import Product, ProductCategory
+from utils.search import category_filter
+
+FIRST_IDS = 'SELECT coalesce(max(product_id), 0) + 1, coalesce(max(category_id), 0) + 1 FROM pharmaguide.product, pharmaguide.category_name'
+
+SEED = '''
+INSERT INTO pharmaguide.category_name (category_id, name)
+SELECT c, 'Category ' || c FROM generate_series(CAST(:first_category AS int), :last_category) c;
+INSERT INTO pharmaguide.product (product_id, name, code, description)
+SELECT p, 'Producto ' || p, 'F' || lpad(p::text, 11, '0'), 'Producto sintetico'
+FROM generate_series(CAST(:first_product AS int), :last_product) p;
+INSERT INTO pharmaguide.product_category (product_id, category_id)
+SELECT DISTINCT p, CAST(:first_category AS int) + floor(power(random(), 2) * :categories)::int
+FROM generate_series(CAST(:first_product AS int), :last_product) p, generate_series(1, 1 + p % 3);
+ANALYZE pharmaguide.product;
+ANALYZE pharmaguide.product_category
+'''
+
+def sql_facets(categories, match):
+    matching = select(Product.product_id).where(category_filter(categories, match)) if categories else select(Product.product_id)
+    return (
+        select(ProductCategory.category_id, func.count())
+        .where(ProductCategory.product_id.in_(matching.scalar_subquery()))
+        .group_by(ProductCategory.category_id)
+    )
+
+def workload(first_category, categories, queries):
+    work = []
+    for _ in range(queries):
+        count = random.choice([0, 1, 1, 2, 3])
+        match = random.choice(['any', 'all'])
+        work.append((f'{match}_{count}', [first_category + int(random.random() ** 2 * categories) for _ in range(count)], match))
+    return work
+
+async def run(products, categories, queries):
+    random.seed(7)
+    session = new_session()
+    timings = {}
+    try:
+        first_product, first_category = (await session.execute(text(FIRST_IDS))).one()
+        parameters = {
+            'first_product' : first_product, 'last_product' : first_product + products - 1,
+            'first_category' : first_category, 'last_category' : first_category + categories - 1, 'categories' : categories,
+        }
+        start = time.perf_counter()
+        for statement in SEED.strip().split(';\n'):
+            await session.execute(text(statement), parameters)
+        seed = time.perf_counter() - start
+        start = time.perf_counter()
+        index = CategoryBitmaps()
+        index.build(
+            (await session.scalars(select(Product.product_id))).all(),
+            (await session.execute(select(ProductCategory.category_id, ProductCategory.product_id))).all(),
+        )
+        build = time.perf_counter() - start
+        for number, (kind, filtered, match) in enumerate(workload(first_category, categories, queries)):
+            start = time.perf_counter()
+            counts = dict((await session.execute(sql_facets(filtered, match))).all())
+            timings.setdefault(f'sql_{kind}', []).append(time.perf_counter() - start)
+            elapsed, result = common.timed(index.facets, filtered, match)
+            timings.setdefault(f'bitmap_{kind}', []).append(elapsed)
+            if number < 20:
+                assert { row['category_id'] : row['count'] for row in result['categories'] } == counts, (filtered, match)
+    finally:
+        await session.rollback()
+        await session.close()
+    print(f'seeded {products} products in {seed:.1f}s, built bitmaps in {build:.1f}s')
+    return [{ 'query' : kind, 'products' : products, **common.summarize(samples) } for kind, samples in sorted(timings.items())]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Facet counts from in-memory category bitmaps against a SQL GROUP BY.')
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--categories', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('facets', asyncio.run(run(args.products, args.categories, args.queries)), args.output)
@@ -0,0 +1,140 @@
+import argparse
+import csv
+import io
+import random
+import time
+import uuid
+import common
+from sqlalchemy import create_engine
+from utils.database import url
+
+TABLES = ['advertisement', 'inventory', 'product_image', 'product_category', 'product', 'category_name', 'pharmacy_image', 'pharmacy', 'user', 'user_type']
+IDENTITIES = [('user_type', 'id'), ('user', 'user_id'), ('pharmacy', 'pharmacy_id'), ('category_name', 'category_id'), ('product', 'product_id'), ('advertisement', 'advertisement_id')]
+USER_TYPES = ['admin', 'owner', 'customer']
+CATEGORIES = ['Analgésicos', 'Antibióticos', 'Antialérgicos', 'Antigripales', 'Antiácidos', 'Vitaminas', 'Dermatología', 'Oftalmología', 'Cardiología', 'Diabetes', 'Pediatría', 'Higiene', 'Primeros auxilios', 'Suplementos', 'Respiratorio', 'Digestivo', 'Hormonas', 'Neurología', 'Cuidado bucal', 'Bebés']
+DRUGS = ['Paracetamol', 'Ibuprofeno', 'Amoxicilina', 'Loratadina', 'Omeprazol', 'Metformina', 'Losartán', 'Diclofenaco', 'Naproxeno', 'Cetirizina', 'Azitromicina', 'Ciprofloxacina', 'Salbutamol', 'Ranitidina', 'Atorvastatina', 'Enalapril', 'Clorfenamina', 'Dexametasona', 'Ketorolaco', 'Fluconazol', 'Aciclovir', 'Metronidazol', 'Ácido fólico', 'Vitamina C', 'Complejo B', 'Hierro', 'Calcio', 'Zinc', 'Melatonina', 'Glucosamina']
+FORMS = ['tabletas', 'cápsulas', 'jarabe', 'suspensión', 'gotas', 'crema', 'gel', 'ampollas', 'sobres', 'spray']
+STRENGTHS = ['5 mg', '10 mg', '20 mg', '50 mg', '100 mg', '250 mg', '400 mg', '500 mg', '1 g']
+BRANDS = ['Genfar', 'Bayer', 'Pfizer', 'Sanofi', 'Medipharm', 'Laboratorios López', 'Vijosa', 'Ancalmo', 'Teramed', 'Gamma']
+WORDS = ['alivio', 'rápido', 'dolor', 'fiebre', 'infección', 'alergia', 'uso', 'adulto', 'niños', 'cada', 'horas', 'tomar', 'con', 'agua', 'después', 'comidas', 'tratamiento', 'prescripción', 'médica', 'conservar', 'lugar', 'fresco', 'seco']
+CITIES = [('San Salvador', 13.6929, -89.2182), ('Santa Ana', 13.9942, -89.5597), ('San Miguel', 13.4833, -88.1833), ('Soyapango', 13.7102, -89.1399), ('Santa Tecla', 13.6769, -89.2797), ('Apopa', 13.8072, -89.1792), ('Ahuachapán', 13.9214, -89.8450), ('Sonsonate', 13.7189, -89.7242), ('Usulután', 13.3500, -88.4500), ('La Unión', 13.3369, -87.8439)]
+STREETS = ['Calle', 'Avenida', 'Boulevard', 'Pasaje', 'Colonia']
+CHUNK_ROWS = 50000
+
+def scaled(value, scale):
+    return max(1, int(value * scale))
+
+def image_name(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4)) + '.webp'
+
+def digest(rng):
+    return f'{rng.getrandbits(128):032x}'
+
+def users(rng, count):
+    for id in range(1, count + 1):
+        yield id, f'Usuario {id}', f'user{id}', f'secret{id}', f'user{id}@example.com', rng.choices([1, 2, 3], [1, 10, 89])[0]
+
+def pharmacies(rng, count, users):
+    for id in range(1, count + 1):
+        city, lat, lng = rng.choice(CITIES)
+        address = f'{rng.choice(STREETS)} {rng.randint(1, 99)} #{rng.randint(1, 500)}, {city}'
+        yield id, f'Farmacia {rng.choice(BRANDS)} {id}', address, round(lat + rng.gauss(0, 0.05), 6), round(lng + rng.gauss(0, 0.05), 6), f'2{rng.randint(100, 999)}-{rng.randint(1000, 9999)}', rng.randint(1, users)
+
+def products(rng, count):
+    for id in range(1, count + 1):
+        name = f'{rng.choice(DRUGS)} {rng.choice(STRENGTHS)} {rng.choice(FORMS)} {rng.choice(BRANDS)}'[:60]
+        description = ' '.join(rng.choices(WORDS, k=rng.randint(6, 20)))[:200]
+        yield id, name, f'{id:012d}', description
+
+def product_categories(rng, products, categories):
+    for product_id in range(1, products + 1):
+        for category_id in sorted(rng.sample(range(1, categories + 1), rng.randint(1, 3))):
+            yield category_id, product_id
+
+def images(rng, owners, share):
+    for owner in range(1, owners + 1):
+        if rng.random() < share:
+            yield image_name(rng), digest(rng), owner
+
+def inventories(rng, pharmacies, products, per_pharmacy):
+    per_pharmacy = min(per_pharmacy, products)
+    for pharmacy_id in range(1, pharmacies + 1):
+        for product_id in sorted(rng.sample(range(1, products + 1), per_pharmacy)):
+            yield product_id, pharmacy_id, round(rng.uniform(0.5, 60), 2), rng.randint(0, 200)
+
+def advertisements(rng, count, users):
+    for id in range(1, count + 1):
+        yield id, f'Oferta {id}', f'{rng.choice(DRUGS)} a precio especial'[:50], digest(rng), rng.randint(1, users)
+
+def copy(cursor, table, columns, rows):
+    total = 0
+    while True:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            if count == CHUNK_ROWS:
+                break
+        if not count:
+            return total
+        buffer.seek(0)
+        cursor.copy_expert(f'COPY pharmaguide.{table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+        total += count
+        if count < CHUNK_ROWS:
+            return total
+
+def generate(scale, seed, per_pharmacy, reset):
+    rng = random.Random(seed)
+    sizes = {
+        'users' : scaled(2000, scale),
+        'pharmacies' : scaled(500, scale),
+        'products' : scaled(20000, scale),
+        'advertisements' : scaled(200, scale),
+    }
+    plan = [
+        ('user_type', ('id', 'user_type'), enumerate(USER_TYPES, 1)),
+        ('user', ('user_id', 'name', 'username', 'password', 'email', 'type'), users(rng, sizes['users'])),
+        ('pharmacy', ('pharmacy_id', 'name', 'address', 'lat', 'lng', 'contact', 'owner'), pharmacies(rng, sizes['pharmacies'], sizes['users'])),
+        ('pharmacy_image', ('name', 'digest', 'pharmacy_id'), images(rng, sizes['pharmacies'], 0.8)),
+        ('category_name', ('category_id', 'name'), enumerate(CATEGORIES, 1)),
+        ('product', ('product_id', 'name', 'code', 'description'), products(rng, sizes['products'])),
+        ('product_category', ('category_id', 'product_id'), product_categories(rng, sizes['products'], len(CATEGORIES))),
+        ('product_image', ('name', 'digest', 'product_id'), images(rng, sizes['products'], 0.6)),
+        ('inventory', ('product_id', 'pharmacy_id', 'price', 'stock'), inventories(rng, sizes['pharmacies'], sizes['products'], per_pharmacy)),
+        ('advertisement', ('advertisement_id', 'advertisement_title', 'advertisement_description', 'advertisement_image', 'owner'), advertisements(rng, sizes['advertisements'], sizes['users'])),
+    ]
+    engine = create_engine(url)
+    connection = engine.raw_connection()
+    results = []
+    try:
+        cursor = connection.cursor()
+        if reset:
+            cursor.execute('TRUNCATE ' + ', '.join(f'pharmaguide.{table}' for table in TABLES) + ' RESTART IDENTITY')
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM pharmaguide.user) OR EXISTS (SELECT 1 FROM pharmaguide.product)')
+        if cursor.fetchone()[0]:
+            raise SystemExit('the pharmaguide schema already has data, use --reset to replace it')
+        for table, columns, rows in plan:
+            start = time.perf_counter()
+            count = copy(cursor, table, columns, rows)
+            results.append({ 'table' : table, 'rows' : count, 'seconds' : time.perf_counter() - start })
+        for table, column in IDENTITIES:
+            cursor.execute(f"SELECT setval(pg_get_serial_sequence('pharmaguide.{table}', '{column}'), coalesce(max({column}), 0) + 1, false) FROM pharmaguide.{table}")
+        connection.commit()
+        cursor.execute('ANALYZE')
+        connection.commit()
+    finally:
+        connection.close()
+        engine.dispose()
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill the pharmaguide schema with reproducible synthetic data using COPY.')
+    parser.add_argument('--scale', type=float, default=1, help='1 = 2000 users, 500 pharmacies, 20000 products')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--products-per-pharmacy', type=int, default=400)
+    parser.add_argument('--reset', action='store_true', help='truncate every pharmaguide table first')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('generate_data', generate(args.scale, args.seed, args.products_per_pharmacy, args.reset), args.output)
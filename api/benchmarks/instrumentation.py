@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import time
+import common
+from sqlalchemy import create_engine, text
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from utils.database import url
+from utils.instrumentation import RequestMetrics, TimedQueuePool, instrument
+from utils.settings import Settings
+
+settings = Settings()
+
+async def ping(request):
+    return PlainTextResponse('ok')
+
+async def call(app, requests):
+    scope = { 'type' : 'http', 'method' : 'GET', 'path' : '/ping/1', 'raw_path' : b'/ping/1', 'root_path' : '', 'scheme' : 'http', 'query_string' : b'', 'headers' : [], 'server' : ('bench', 80) }
+
+    async def receive():
+        return { 'type' : 'http.request', 'body' : b'', 'more_body' : False }
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+def middleware(requests):
+    plain = Starlette(routes=[Route('/ping/{id}', ping)])
+    instrumented = RequestMetrics(Starlette(routes=[Route('/ping/{id}', ping)]))
+    asyncio.run(call(plain, requests // 10))
+    asyncio.run(call(instrumented, requests // 10))
+    baseline = asyncio.run(call(plain, requests))
+    measured = asyncio.run(call(instrumented, requests))
+    return { 'hook' : 'request', 'samples' : requests, 'baseline_us' : baseline * 1e6, 'instrumented_us' : measured * 1e6, 'overhead_us' : (measured - baseline) * 1e6 }
+
+def execute(engine, statements):
+    statement = text('SELECT 1')
+    with engine.connect() as connection:
+        connection.execute(statement)
+        start = time.perf_counter()
+        for _ in range(statements):
+            connection.execute(statement)
+        return (time.perf_counter() - start) / statements
+
+def checkout(engine, checkouts):
+    engine.connect().close()
+    start = time.perf_counter()
+    for _ in range(checkouts):
+        engine.connect().close()
+    return (time.perf_counter() - start) / checkouts
+
+def database(samples):
+    options = dict(pool_size=1, max_overflow=0, pool_pre_ping=settings.POOL_PRE_PING)
+    plain = create_engine(url, **options)
+    instrumented = instrument(create_engine(url, poolclass=TimedQueuePool, **options))
+    rows = []
+    try:
+        for hook, measure in (('statement', execute), ('checkout', checkout)):
+            rounds = [(measure(plain, samples), measure(instrumented, samples)) for _ in range(5)]
+            baseline, measured = min(plain for plain, _ in rounds), min(timed for _, timed in rounds)
+            rows.append({ 'hook' : hook, 'samples' : samples, 'baseline_us' : baseline * 1e6, 'instrumented_us' : measured * 1e6, 'overhead_us' : (measured - baseline) * 1e6 })
+    finally:
+        plain.dispose()
+        instrumented.dispose()
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-request and per-statement cost of the metrics middleware and engine hooks.')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--statements', type=int, default=5000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('instrumentation', [middleware(args.requests), *database(args.statements)], args.output)
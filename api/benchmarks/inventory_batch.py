@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import random
+import time
+import common
+from sqlalchemy import text
+from main import app
+from utils.database import new_session
+
+SEED = '''
+INSERT INTO pharmaguide.product (product_id, name, code, description)
+SELECT p, 'Product ' || p, lpad(p::text, 12, '0'), '' FROM generate_series(1000000, 1000000 + :products - 1) p;
+INSERT INTO pharmaguide.user_type (id, user_type) VALUES (1000000, 'bench');
+INSERT INTO pharmaguide.user (user_id, name, type) VALUES (1000000, 'bench', 1000000);
+INSERT INTO pharmaguide.pharmacy (pharmacy_id, name, owner)
+SELECT f, 'Pharmacy ' || f, 1000000 FROM generate_series(1000000, 1000000 + :pharmacies - 1) f;
+INSERT INTO pharmaguide.inventory (product_id, pharmacy_id, price, stock)
+SELECT p, f, 1, 1 FROM generate_series(1000000, 1000000 + :products - 1) p, generate_series(1000000, 1000000 + :pharmacies - 1) f
+'''
+
+CLEANUP = '''
+DELETE FROM pharmaguide.inventory WHERE product_id >= 1000000;
+DELETE FROM pharmaguide.pharmacy WHERE pharmacy_id >= 1000000;
+DELETE FROM pharmaguide.user WHERE user_id = 1000000;
+DELETE FROM pharmaguide.user_type WHERE id = 1000000;
+DELETE FROM pharmaguide.product WHERE product_id >= 1000000
+'''
+
+async def execute(script, parameters = {}):
+    session = new_session()
+    try:
+        for statement in script.strip().split(';\n'):
+            await session.execute(text(statement), parameters)
+        await session.commit()
+    finally:
+        await session.close()
+
+def changes(count, products, pharmacies):
+    return [
+        { 'product_id' : 1000000 + random.randrange(products), 'pharmacy_id' : 1000000 + random.randrange(pharmacies), 'price' : random.randint(100, 9999) / 100, 'stock' : random.randint(0, 100) }
+        for _ in range(count)
+    ]
+
+async def per_row(client, items):
+    for item in items:
+        params = { 'current_pharmacy_id' : item['pharmacy_id'], 'price' : item['price'], 'stock' : item['stock'] }
+        (await client.put(f'/inventory/{item["product_id"]}', params=params)).raise_for_status()
+
+async def batched(client, items, size):
+    for start in range(0, len(items), size):
+        (await client.patch('/inventory/batch', json=items[start:start + size])).raise_for_status()
+
+async def run(rows, products, pharmacies, sizes):
+    random.seed(3)
+    await execute(SEED, { 'products' : products, 'pharmacies' : pharmacies })
+    results = []
+    try:
+        async with common.AppClient(app) as client:
+            items = changes(rows, products, pharmacies)
+            elapsed, _ = await timed(per_row(client, items))
+            results.append({ 'method' : 'put_per_row', 'batch' : 1, 'rows' : rows, 'seconds' : elapsed, 'rows_per_s' : rows / elapsed })
+            for size in sizes:
+                items = changes(max(rows, size), products, pharmacies)
+                elapsed, _ = await timed(batched(client, items, size))
+                results.append({ 'method' : 'patch_batch', 'batch' : size, 'rows' : len(items), 'seconds' : elapsed, 'rows_per_s' : len(items) / elapsed })
+    finally:
+        await execute(CLEANUP)
+    return results
+
+async def timed(awaitable):
+    start = time.perf_counter()
+    result = await awaitable
+    return time.perf_counter() - start, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PATCH /inventory/batch against one PUT /inventory/{id} per change.')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--pharmacies', type=int, default=100)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('inventory_batch', asyncio.run(run(args.rows, args.products, args.pharmacies, args.sizes)), args.output)
@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import random
+import time
+import common
+from sqlalchemy import text
+from main import app
+from utils.database import new_session
+
+SEED = '''
+INSERT INTO pharmaguide.product (product_id, name, code, description)
+SELECT p, 'Product ' || p, lpad(p::text, 12, '0'), '' FROM generate_series(1000000, 1000000 + :products - 1) p;
+INSERT INTO pharmaguide.user_type (id, user_type) VALUES (1000000, 'bench');
+INSERT INTO pharmaguide.user (user_id, name, type) VALUES (1000000, 'bench', 1000000);
+INSERT INTO pharmaguide.pharmacy (pharmacy_id, name, owner)
+SELECT f, 'Pharmacy ' || f, 1000000 FROM generate_series(1000000, 1000000 + :pharmacies - 1) f
+'''
+
+CLEANUP = '''
+DELETE FROM pharmaguide.inventory WHERE product_id >= 1000000;
+DELETE FROM pharmaguide.pharmacy WHERE pharmacy_id >= 1000000;
+DELETE FROM pharmaguide.user WHERE user_id = 1000000;
+DELETE FROM pharmaguide.user_type WHERE id = 1000000;
+DELETE FROM pharmaguide.product WHERE product_id >= 1000000
+'''
+
+async def execute(script, parameters = {}):
+    session = new_session()
+    try:
+        for statement in script.strip().split(';\n'):
+            await session.execute(text(statement), parameters)
+        await session.commit()
+    finally:
+        await session.close()
+
+def build_csv(rows, products, pharmacies, invalid):
+    lines = ['product_id,pharmacy_id,price,stock']
+    pairs = random.sample(range(products * pharmacies), rows)
+    for pair in pairs:
+        product, pharmacy = 1000000 + pair // pharmacies, 1000000 + pair % pharmacies
+        if random.random() < invalid:
+            product = 1 - product
+        lines.append(f'{product},{pharmacy},{random.randint(100, 99999) / 100},{random.randint(0, 500)}')
+    return ('\n'.join(lines) + '\n').encode(), pairs
+
+async def run(rows, products, pharmacies, invalid, single_rows):
+    random.seed(5)
+    await execute(SEED, { 'products' : products, 'pharmacies' : pharmacies })
+    results = []
+    try:
+        async with common.AppClient(app) as client:
+            for label in ('insert', 'update'):
+                data, pairs = build_csv(rows, products, pharmacies, invalid) if label == 'insert' else (data, pairs)
+                start = time.perf_counter()
+                response = await client.post('/inventory/import', files={ 'file' : ('inventory.csv', data, 'text/csv') })
+                elapsed = time.perf_counter() - start
+                response.raise_for_status()
+                report = response.json()
+                results.append({ 'method' : f'import_{label}', 'rows' : rows, 'inserted' : report['inserted'], 'updated' : report['updated'], 'rejected' : report['rejected'], 'seconds' : elapsed, 'rows_per_s' : rows / elapsed })
+            await execute('DELETE FROM pharmaguide.inventory WHERE product_id >= 1000000')
+            start = time.perf_counter()
+            for pair in pairs[:single_rows]:
+                params = { 'product_id' : 1000000 + pair // pharmacies, 'pharmacy_id' : 1000000 + pair % pharmacies, 'price' : 1, 'stock' : 1 }
+                (await client.post('/inventory/', params=params)).raise_for_status()
+            elapsed = time.perf_counter() - start
+            results.append({ 'method' : 'post_per_row', 'rows' : single_rows, 'inserted' : single_rows, 'updated' : 0, 'rejected' : 0, 'seconds' : elapsed, 'rows_per_s' : single_rows / elapsed })
+    finally:
+        await execute(CLEANUP)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput of POST /inventory/import against one POST /inventory/ per row.')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--pharmacies', type=int, default=500)
+    parser.add_argument('--invalid', type=float, default=0.01)
+    parser.add_argument('--single-rows', type=int, default=1000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('inventory_import', asyncio.run(run(args.rows, args.products, args.pharmacies, args.invalid, args.single_rows)), args.output)
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import time
+import common
+from collections import defaultdict
+from sqlalchemy import text
+from generate_data import CITIES, DRUGS, WORDS
+from utils.database import new_session
+from utils.settings import Settings
+
+settings = Settings()
+FIXTURES = 20
+PHARMACIES_PER_PRODUCT = 5
+
+async def sample(script, parameters = {}):
+    session = new_session()
+    try:
+        return (await session.execute(text(script), parameters)).all()
+    finally:
+        await session.close()
+
+async def load_data(client):
+    data = {}
+    for name, table, column in [('products', 'product', 'product_id'), ('pharmacies', 'pharmacy', 'pharmacy_id'), ('users', 'user', 'user_id'), ('advertisements', 'advertisement', 'advertisement_id')]:
+        data[name] = [row[0] for row in await sample(f'SELECT {column} FROM pharmaguide.{table} ORDER BY md5({column}::text) LIMIT 5000')]
+        if not data[name]:
+            raise SystemExit(f'pharmaguide.{table} is empty, run benchmarks/generate_data.py first')
+    data['inventory'] = [tuple(row) for row in await sample("SELECT product_id, pharmacy_id FROM pharmaguide.inventory ORDER BY md5(product_id || '-' || pharmacy_id) LIMIT 5000")]
+    data['terms'] = [drug.split()[0].lower() for drug in DRUGS] + [drug.split()[0].lower()[:-1] for drug in DRUGS]
+    data['user_type'] = (await sample('SELECT min(id) FROM pharmaguide.user_type'))[0][0]
+    return data
+
+def png():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (40, 120, 200)).save(buffer, 'PNG')
+    return ('load.png', buffer.getvalue(), 'image/png')
+
+async def create(client, created, path, delete, **request):
+    response = await client.post(path, **request)
+    response.raise_for_status()
+    body = response.json()
+    created.append(delete(body))
+    return body
+
+async def create_fixtures(client, data, created):
+    rng = random.Random()
+    fixtures = { 'users' : [], 'pharmacies' : [], 'products' : [], 'inventory' : [], 'advertisements' : [] }
+    image = png()
+    for number in range(FIXTURES):
+        user = await create(client, created, '/user/', lambda body: (f'/user/{body["user_id"]}', {}), params={
+            'name' : f'load test {number}', 'username' : f'lt{rng.randrange(10 ** 8)}', 'password' : 'loadtest', 'email' : 'loadtest@example.com', 'type' : data['user_type'],
+        })
+        fixtures['users'].append(user['user_id'])
+        _, lat, lng = rng.choice(CITIES)
+        pharmacy = await create(client, created, '/pharmacy/', lambda body: (f'/pharmacy/{body["pharmacy_id"]}', {}), params={
+            'name' : f'load test {number}', 'address' : 'load test', 'lat' : lat, 'lng' : lng, 'contact' : 'load test', 'owner' : user['user_id'],
+        })
+        fixtures['pharmacies'].append(pharmacy['pharmacy_id'])
+        product = await create(client, created, '/product/', lambda body: (f'/product/{body["product_id"]}', {}), params={
+            'name' : f'{rng.choice(DRUGS)} carga', 'code' : f'LF{rng.randrange(10 ** 10):010d}', 'description' : 'producto de prueba de carga',
+        })
+        fixtures['products'].append(product['product_id'])
+        advertisement = await create(client, created, '/advertisement/', lambda body: (f'/advertisement/{body["advertisement_id"]}', {}), params={
+            'advertisement_title' : 'load test', 'advertisement_description' : 'load test', 'owner' : user['user_id'],
+        }, files={ 'file' : image })
+        fixtures['advertisements'].append(advertisement['advertisement_id'])
+    for product_id in fixtures['products']:
+        for pharmacy_id in rng.sample(fixtures['pharmacies'], PHARMACIES_PER_PRODUCT):
+            await create(client, created, '/inventory/', lambda body: (f'/inventory/{body["product_id"]}', { 'pharmacy_id' : body['pharmacy_id'] }), params={
+                'product_id' : product_id, 'pharmacy_id' : pharmacy_id, 'stock' : 100, 'price' : 10,
+            })
+            fixtures['inventory'].append((product_id, pharmacy_id))
+    data['fixtures'] = fixtures
+    data['image'] = await create(client, created, '/product/image', lambda body: (f'/product/image/{body["name"]}', {}), params={ 'product_id' : fixtures['products'][0] }, files={ 'name' : image })
+
+async def delete_fixtures(client, created):
+    failed = []
+    for path, params in reversed(created):
+        response = await client.delete(path, params=params)
+        if response.status_code not in (204, 404):
+            failed.append(path)
+    if failed:
+        print('could not delete load test fixtures: ' + ', '.join(failed))
+
+async def get_products(client, rng, data, record):
+    await record('GET /product/', client.get('/product/', params={ 'limit' : 50, 'skip' : rng.randint(0, 1000) }))
+
+async def get_product(client, rng, data, record):
+    await record('GET /product/{id}', client.get(f'/product/{rng.choice(data["products"])}'))
+
+async def search_products(client, rng, data, record):
+    await record('GET /product/search', client.get('/product/search', params={ 'q' : rng.choice(data['terms']), 'limit' : 20 }))
+
+async def get_availability(client, rng, data, record):
+    _, lat, lng = rng.choice(CITIES)
+    await record('GET /product/{id}/availability', client.get(f'/product/{rng.choice(data["products"])}/availability', params={ 'lat' : lat, 'lng' : lng, 'sort' : 'distance' }))
+
+async def get_categories(client, rng, data, record):
+    await record('GET /product/category', client.get('/product/category'))
+
+async def update_product(client, rng, data, record):
+    await record('PUT /product/{id}', client.put(f'/product/{rng.choice(data["fixtures"]["products"])}', params={ 'description' : ' '.join(rng.choices(WORDS, k=8)) }))
+
+async def create_and_delete_product(client, rng, data, record):
+    params = { 'name' : f'{rng.choice(DRUGS)} prueba', 'code' : f'LT{rng.randrange(10 ** 10):010d}', 'description' : 'producto temporal' }
+    response = await record('POST /product/', client.post('/product/', params=params))
+    if response.status_code == 200:
+        await record('DELETE /product/{id}', client.delete(f'/product/{response.json()["product_id"]}'))
+
+async def get_pharmacies(client, rng, data, record):
+    await record('GET /pharmacy/', client.get('/pharmacy/', params={ 'limit' : 50 }))
+
+async def get_pharmacy(client, rng, data, record):
+    await record('GET /pharmacy/{id}', client.get(f'/pharmacy/{rng.choice(data["pharmacies"])}'))
+
+async def get_nearby(client, rng, data, record):
+    _, lat, lng = rng.choice(CITIES)
+    await record('GET /pharmacy/nearby', client.get('/pharmacy/nearby', params={ 'lat' : lat, 'lng' : lng, 'radius' : 10, 'k' : 10 }))
+
+async def update_pharmacy(client, rng, data, record):
+    await record('PUT /pharmacy/{id}', client.put(f'/pharmacy/{rng.choice(data["fixtures"]["pharmacies"])}', params={ 'contact' : f'7{rng.randrange(10 ** 7):07d}' }))
+
+async def get_users(client, rng, data, record):
+    await record('GET /user/', client.get('/user/', params={ 'limit' : 50 }))
+
+async def get_user(client, rng, data, record):
+    await record('GET /user/{id}', client.get(f'/user/{rng.choice(data["users"])}'))
+
+async def update_user(client, rng, data, record):
+    await record('PUT /user/{id}', client.put(f'/user/{rng.choice(data["fixtures"]["users"])}', params={ 'name' : ' '.join(rng.choices(WORDS, k=2)) }))
+
+async def get_inventories(client, rng, data, record):
+    await record('GET /inventory/', client.get('/inventory/', params={ 'limit' : 100 }))
+
+async def get_inventory(client, rng, data, record):
+    product_id, pharmacy_id = rng.choice(data['inventory'])
+    await record('GET /inventory/{product_id}', client.get(f'/inventory/{product_id}', params={ 'pharmacy_id' : pharmacy_id }))
+
+async def update_stock(client, rng, data, record):
+    product_id, pharmacy_id = rng.choice(data['fixtures']['inventory'])
+    await record('PATCH /inventory/{product_id}/stock', client.patch(f'/inventory/{product_id}/stock', params={ 'pharmacy_id' : pharmacy_id, 'delta' : rng.choice([-1, 1]) }))
+
+async def update_inventories(client, rng, data, record):
+    changes = [{ 'product_id' : product_id, 'pharmacy_id' : pharmacy_id, 'stock' : rng.randint(0, 200) } for product_id, pharmacy_id in rng.sample(data['fixtures']['inventory'], 10)]
+    await record('PATCH /inventory/batch', client.patch('/inventory/batch', json=changes))
+
+async def get_advertisements(client, rng, data, record):
+    await record('GET /advertisement/', client.get('/advertisement/', params={ 'limit' : 20 }))
+
+async def get_advertisement(client, rng, data, record):
+    await record('GET /advertisement/{id}', client.get(f'/advertisement/{rng.choice(data["advertisements"])}'))
+
+async def update_advertisement(client, rng, data, record):
+    await record('PUT /advertisement/{id}', client.put(f'/advertisement/{rng.choice(data["fixtures"]["advertisements"])}', params={ 'advertisement_description' : ' '.join(rng.choices(WORDS, k=3)) }))
+
+async def get_image(client, rng, data, record):
+    await record('GET /image/{digest}', client.get(f'/image/{data["image"]["digest"]}', params={ 'w' : rng.choice([160, 480, 800]) }))
+
+SCENARIOS = [
+    (get_products, 8),
+    (get_product, 14),
+    (search_products, 8),
+    (get_availability, 8),
+    (get_categories, 2),
+    (update_product, 2),
+    (create_and_delete_product, 1),
+    (get_pharmacies, 3),
+    (get_pharmacy, 6),
+    (get_nearby, 6),
+    (update_pharmacy, 1),
+    (get_users, 1),
+    (get_user, 3),
+    (update_user, 1),
+    (get_inventories, 2),
+    (get_inventory, 5),
+    (update_stock, 6),
+    (update_inventories, 2),
+    (get_advertisements, 2),
+    (get_advertisement, 2),
+    (update_advertisement, 1),
+    (get_image, 3),
+]
+
+async def worker(client, rng, data, deadline, warmup_until, samples, errors):
+    scenarios, weights = zip(*SCENARIOS)
+
+    async def record(name, request):
+        start = time.perf_counter()
+        try:
+            response = await request
+        except Exception:
+            if start >= warmup_until:
+                errors[name] += 1
+            raise
+        if start >= warmup_until:
+            samples[name].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors[name] += 1
+        return response
+
+    while time.perf_counter() < deadline:
+        try:
+            await rng.choices(scenarios, weights)[0](client, rng, data, record)
+        except Exception:
+            pass
+
+def summarize(samples, errors, elapsed):
+    rows = []
+    for name in sorted(set(samples) | set(errors)):
+        rows.append({ 'route' : name, 'requests' : len(samples[name]), 'errors' : errors[name], 'req_per_s' : len(samples[name]) / elapsed, **common.summarize(samples[name]) })
+    every = [latency for latencies in samples.values() for latency in latencies]
+    rows.append({ 'route' : 'TOTAL', 'requests' : len(every), 'errors' : sum(errors.values()), 'req_per_s' : len(every) / elapsed, **common.summarize(every) })
+    return rows
+
+async def load(client, concurrency, duration, warmup, seed):
+    data = await load_data(client)
+    samples, errors = defaultdict(list), defaultdict(int)
+    created = []
+    try:
+        await create_fixtures(client, data, created)
+        start = time.perf_counter()
+        warmup_until, deadline = start + warmup, start + warmup + duration
+        await asyncio.gather(*(worker(client, random.Random(seed * 1000 + number), data, deadline, warmup_until, samples, errors) for number in range(concurrency)))
+        elapsed = time.perf_counter() - warmup_until
+    finally:
+        await delete_fixtures(client, created)
+    return summarize(samples, errors, elapsed)
+
+async def run(url, port, concurrency, duration, warmup, seed):
+    if url:
+        import httpx
+        async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+            return await load(client, concurrency, duration, warmup, seed)
+    from main import app
+    async with common.LiveServer(app, port) as client:
+        return await load(client, concurrency, duration, warmup, seed)
+
+def compare(rows, baseline, max_regression):
+    previous = { row['route'] : row for row in baseline['results'] }
+    comparison, failed = [], False
+    for row in rows:
+        before = previous.get(row['route'])
+        if not before or not before['requests'] or not row['requests']:
+            continue
+        p99_change = row['p99_ms'] / before['p99_ms'] - 1 if before['p99_ms'] else 0.0
+        throughput_change = row['req_per_s'] / before['req_per_s'] - 1 if before['req_per_s'] else 0.0
+        regressed = p99_change > max_regression or (row['route'] == 'TOTAL' and throughput_change < -max_regression)
+        failed = failed or regressed
+        comparison.append({ 'route' : row['route'], 'p99_change' : p99_change, 'req_per_s_change' : throughput_change, 'regressed' : regressed })
+    return comparison, failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a weighted read/write mix against every router and report per-route throughput and latency.')
+    parser.add_argument('--url', help='target a running API instead of starting one in-process')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', help='results JSON of a previous run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25, help='allowed relative p99 increase or throughput drop')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    rows = asyncio.run(run(args.url, args.port, args.concurrency, args.duration, args.warmup, args.seed))
+    common.report('load_test', rows, args.output)
+    if args.baseline:
+        with open(os.path.join(common.CWD, args.baseline)) as file:
+            comparison, failed = compare(rows, json.load(file), args.max_regression)
+        common.report('load_test_comparison', comparison)
+        if failed:
+            sys.exit(1)
@@ -0,0 +1,83 @@
+import argparse
+import random
+import time
+import common
+from utils.geo import GridIndex, haversine
+
+def brute_force(points, lat, lng, k, radius):
+    distances = ((haversine(lat, lng, plat, plng), id) for id, (plat, plng) in points.items())
+    return sorted(hit for hit in distances if hit[0] <= radius)[:k]
+
+def run(pharmacies, queries, k, radius, cell, bounds):
+    random.seed(7)
+    south, north, west, east = bounds
+    points = { id : (random.uniform(south, north), random.uniform(west, east)) for id in range(pharmacies) }
+    start = time.perf_counter()
+    index = GridIndex(cell)
+    for id, (lat, lng) in points.items():
+        index.add(id, lat, lng)
+    build = time.perf_counter() - start
+    probes = [(random.uniform(south, north), random.uniform(west, east)) for _ in range(queries)]
+    indexed, scanned = [], []
+    for lat, lng in probes:
+        elapsed, hits = common.timed(index.nearest, lat, lng, k, radius)
+        indexed.append(elapsed)
+        if len(scanned) < 50:
+            elapsed, expected = common.timed(brute_force, points, lat, lng, k, radius)
+            scanned.append(elapsed)
+            assert [id for _, id in hits] == [id for _, id in expected]
+    return [
+        { 'method' : 'grid_index', 'pharmacies' : pharmacies, 'build_ms' : build * 1000, **common.summarize(indexed) },
+        { 'method' : 'brute_force', 'pharmacies' : pharmacies, 'build_ms' : 0.0, **common.summarize(scanned) },
+    ]
+
+def high_latitudes(pharmacies, k, radius, cell):
+    random.seed(11)
+    points = { id : (random.uniform(-90, 90), random.uniform(-180, 180)) for id in range(pharmacies) }
+    index = GridIndex(cell)
+    for id, (lat, lng) in points.items():
+        index.add(id, lat, lng)
+    results = []
+    for lat in (60.0, 70.0, 80.0, 85.0, 89.9, -89.9):
+        timings = []
+        for _ in range(20):
+            lng = random.uniform(-180, 180)
+            elapsed, hits = common.timed(index.nearest, lat, lng, k, radius)
+            timings.append(elapsed)
+            assert [id for _, id in hits] == [id for _, id in brute_force(points, lat, lng, k, radius)], (lat, lng)
+        results.append({ 'method' : f'grid_index_lat_{lat:g}', 'pharmacies' : pharmacies, 'build_ms' : 0.0, **common.summarize(timings) })
+    return results
+
+def dateline(pharmacies, queries, cell):
+    random.seed(13)
+    points = { id : (random.uniform(-60, 60), random.choice([-1, 1]) * random.uniform(179, 180)) for id in range(pharmacies) }
+    points[pharmacies] = (10.0, -179.99)
+    points[pharmacies + 1] = (-20.0, 180.0)
+    index = GridIndex(cell)
+    for id, (lat, lng) in points.items():
+        index.add(id, lat, lng)
+    probes = [(10.0, 179.99, 1, 5), (-20.0, -180.0, 1, 5), (-20.0, 179.999, 1, 5)]
+    probes += [(random.uniform(-60, 60), random.choice([-1, 1]) * random.uniform(179, 180), random.choice([1, 5]), random.choice([5, 50, 200])) for _ in range(queries)]
+    timings = []
+    for lat, lng, k, radius in probes:
+        elapsed, hits = common.timed(index.nearest, lat, lng, k, radius)
+        timings.append(elapsed)
+        assert [id for _, id in hits] == [id for _, id in brute_force(points, lat, lng, k, radius)], (lat, lng, k, radius)
+    return [{ 'method' : 'grid_index_dateline', 'pharmacies' : len(points), 'build_ms' : 0.0, **common.summarize(timings) }]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='k-nearest pharmacies: grid index against a brute-force haversine scan.')
+    parser.add_argument('--pharmacies', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--radius', type=float, default=10)
+    parser.add_argument('--cell', type=float, default=0.05)
+    parser.add_argument('--bounds', type=float, nargs=4, default=[13.0, 16.0, -89.3, -83.2], metavar=('SOUTH', 'NORTH', 'WEST', 'EAST'))
+    parser.add_argument('--polar-pharmacies', type=int, default=1000)
+    parser.add_argument('--polar-radius', type=float, default=500)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    results = run(args.pharmacies, args.queries, args.k, args.radius, args.cell, args.bounds)
+    results += high_latitudes(args.polar_pharmacies, args.k, args.polar_radius, args.cell)
+    results += dateline(args.polar_pharmacies, args.queries, args.cell)
+    common.report('nearby', results, args.output)
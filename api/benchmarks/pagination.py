@@ -0,0 +1,56 @@
+import argparse
+import asyncio
+import time
+import common
+from fastapi import Response
+from sqlalchemy import select, text
+from utils.database import new_session
+from utils.models import Inventory
+from utils.pagination import paginate
+
+SEED = '''
+INSERT INTO pharmaguide.product (product_id, name, code, description)
+SELECT p, 'Product ' || p, lpad(p::text, 12, '0'), '' FROM generate_series(1000000, 1000000 + :products - 1) p;
+INSERT INTO pharmaguide.user_type (id, user_type) VALUES (1000000, 'bench');
+INSERT INTO pharmaguide.user (user_id, name, type) VALUES (1000000, 'bench', 1000000);
+INSERT INTO pharmaguide.pharmacy (pharmacy_id, name, owner)
+SELECT f, 'Pharmacy ' || f, 1000000 FROM generate_series(1000000, 1000000 + :pharmacies - 1) f;
+INSERT INTO pharmaguide.inventory (product_id, pharmacy_id, price, stock)
+SELECT p, f, 1, 1 FROM generate_series(1000000, 1000000 + :products - 1) p, generate_series(1000000, 1000000 + :pharmacies - 1) f;
+ANALYZE pharmaguide.inventory;
+'''
+
+async def page(session, page_number, limit, cursor):
+    response = Response()
+    start = time.perf_counter()
+    await paginate(session, select(Inventory), [Inventory.product_id, Inventory.pharmacy_id], response, page_number * limit, limit, cursor)
+    return time.perf_counter() - start, response.headers.get('x-next-cursor')
+
+async def run(products, pharmacies, limit, pages):
+    session = new_session()
+    rows = []
+    try:
+        for statement in SEED.strip().split(';\n'):
+            await session.execute(text(statement), { 'products' : products, 'pharmacies' : pharmacies })
+        cursor = None
+        checkpoints = set(pages)
+        for number in range(max(pages) + 1):
+            elapsed, next_cursor = await page(session, number, limit, cursor)
+            if number in checkpoints:
+                offset_elapsed, _ = await page(session, number, limit, None)
+                rows.append({ 'page' : number, 'offset_ms' : offset_elapsed * 1000, 'keyset_ms' : elapsed * 1000 })
+            cursor = next_cursor
+    finally:
+        await session.rollback()
+        await session.close()
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Page-N latency of offset and keyset pagination over inventory.')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--pharmacies', type=int, default=250)
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--pages', type=int, nargs='+', default=[0, 10, 100, 1000, 4000])
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('pagination', asyncio.run(run(args.products, args.pharmacies, args.limit, args.pages)), args.output)
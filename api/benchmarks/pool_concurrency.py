@@ -0,0 +1,35 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import common
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from utils.database import build_engine, url
+
+def run(pool_size, workers, requests, query_ms):
+    engine = build_engine(url, pool_size=pool_size, max_overflow=0, asynchronous=False)
+    factory = sessionmaker(bind=engine)
+    statement = text('SELECT pg_sleep(:seconds)')
+
+    def handle(_):
+        with factory() as session:
+            session.execute(statement, { 'seconds' : query_ms / 1000 })
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(handle, range(workers)))
+        start = time.perf_counter()
+        list(executor.map(handle, range(requests)))
+        elapsed = time.perf_counter() - start
+    engine.dispose()
+    return { 'pool_size' : pool_size, 'requests' : requests, 'seconds' : elapsed, 'req_per_s' : requests / elapsed }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput of concurrent request-scoped sessions by pool size.')
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--query-ms', type=float, default=5)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    rows = [run(size, args.workers, args.requests, args.query_ms) for size in args.pool_sizes]
+    common.report('pool_concurrency', rows, args.output)
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+import common
+from sqlalchemy import text
+from utils.database import new_session
+from utils.search import product_search
+
+BASES = [
+    'Acetaminofen', 'Ibuprofeno', 'Naproxeno', 'Diclofenaco', 'Amoxicilina', 'Azitromicina', 'Ciprofloxacina', 'Loratadina',
+    'Cetirizina', 'Omeprazol', 'Ranitidina', 'Metformina', 'Losartan', 'Enalapril', 'Atorvastatina', 'Simvastatina',
+    'Salbutamol', 'Prednisona', 'Dexametasona', 'Clonazepam', 'Sertralina', 'Fluoxetina', 'Metronidazol', 'Albendazol',
+    'Ketorolaco', 'Tramadol', 'Levotiroxina', 'Amlodipino', 'Furosemida', 'Hidroclorotiazida', 'Clotrimazol', 'Fluconazol',
+    'Aciclovir', 'Ambroxol', 'Dextrometorfano', 'Loperamida', 'Domperidona', 'Meloxicam', 'Celecoxib', 'Insulina',
+]
+FORMS = ['tabletas', 'capsulas', 'jarabe', 'suspension', 'crema', 'gotas', 'inyectable', 'ampollas', 'gel', 'sobres', 'spray', 'ovulos']
+
+SEED = '''
+INSERT INTO pharmaguide.category_name (category_id, name)
+SELECT c, 'Category ' || c FROM generate_series(1000000, 1000000 + :categories - 1) c;
+INSERT INTO pharmaguide.product (product_id, name, code, description)
+SELECT p,
+  initcap(substr(md5(p::text), 1, 6)) || ' ' || (CAST(:bases AS text[]))[1 + p % :base_count] || ' ' || (10 * (1 + (p / 7) % 100)) || 'mg ' || (CAST(:forms AS text[]))[1 + (p / 13) % :form_count],
+  'B' || lpad(p::text, 11, '0'),
+  'Presentacion de ' || (CAST(:forms AS text[]))[1 + (p / 13) % :form_count] || ' para uso ' || (CASE WHEN p % 3 = 0 THEN 'pediatrico' ELSE 'adulto' END)
+FROM generate_series(1000000, 1000000 + :products - 1) p;
+INSERT INTO pharmaguide.product_category (product_id, category_id)
+SELECT p, 1000000 + p % :categories FROM generate_series(1000000, 1000000 + :products - 1) p;
+ANALYZE pharmaguide.product;
+ANALYZE pharmaguide.product_category
+'''
+
+def typo(word):
+    position = random.randrange(1, len(word) - 1)
+    return word[:position] + word[position + 1:]
+
+def workload(products, categories, queries):
+    kinds = {
+        'word' : lambda: random.choice(BASES).lower(),
+        'typo' : lambda: typo(random.choice(BASES).lower()),
+        'phrase' : lambda: f'{random.choice(BASES)} {random.choice(FORMS)}',
+        'code' : lambda: 'B' + str(1000000 + random.randrange(products)).zfill(11),
+        'description' : lambda: f'{random.choice(FORMS)} pediatrico',
+    }
+    work = []
+    for _ in range(queries):
+        kind = random.choice(list(kinds))
+        filtered = [1000000 + random.randrange(categories)] if random.random() < 0.3 else None
+        work.append((kind, kinds[kind](), filtered))
+    return work
+
+async def run(products, categories, queries, limit):
+    random.seed(11)
+    session = new_session()
+    timings = {}
+    try:
+        start = time.perf_counter()
+        parameters = { 'products' : products, 'categories' : categories, 'bases' : BASES, 'base_count' : len(BASES), 'forms' : FORMS, 'form_count' : len(FORMS) }
+        for statement in SEED.strip().split(';\n'):
+            await session.execute(text(statement), parameters)
+        seed = time.perf_counter() - start
+        for kind, q, filtered in workload(products, categories, queries):
+            start = time.perf_counter()
+            (await session.execute(product_search(q, filtered, limit))).all()
+            elapsed = time.perf_counter() - start
+            timings.setdefault(kind, []).append(elapsed)
+            timings.setdefault('all', []).append(elapsed)
+    finally:
+        await session.rollback()
+        await session.close()
+    print(f'seeded {products} products in {seed:.1f}s')
+    return [{ 'query' : kind, 'products' : products, **common.summarize(samples) } for kind, samples in timings.items()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latency of /product/search ranking over a synthetic catalog.')
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--categories', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--target-p99-ms', type=float, default=100)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    results = asyncio.run(run(args.products, args.categories, args.queries, args.limit))
+    for result in results:
+        result['ok'] = result['p99_ms'] <= args.target_p99_ms
+    common.report('product_search', results, args.output)
+    if not all(result['ok'] for result in results):
+        print(f'p99 above {args.target_p99_ms}ms')
+        sys.exit(1)
@@ -0,0 +1,96 @@
+import argparse
+import os
+import sys
+os.environ['ASYNC_DB'] = 'False'
+import common
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from main import app
+from utils.database import ThreadedSession, engine, get_session
+from utils.etag import VERSIONS
+
+BUDGETS = {
+    '/user/' : 2,
+    '/user/1000000' : 2,
+    '/user/type' : 1,
+    '/pharmacy/' : 2,
+    '/pharmacy/1000000' : 2,
+    '/pharmacy/image' : 1,
+    '/product/' : 2,
+    '/product/1000000' : 2,
+    '/product/image' : 1,
+    '/product/category' : 1,
+    '/product/product_category' : 1,
+    '/inventory/' : 1,
+    '/advertisement/' : 1,
+}
+
+SEED = '''
+INSERT INTO pharmaguide.user_type (id, user_type) SELECT t, 'type ' || t FROM generate_series(1000000, 1000004) t;
+INSERT INTO pharmaguide.user (user_id, name, username, password, email, type) SELECT u, 'user ' || u, 'user' || u, 'secret', 'u@example.com', 1000000 + u % 5 FROM generate_series(1000000, 1000000 + :rows - 1) u;
+INSERT INTO pharmaguide.pharmacy (pharmacy_id, name, address, lat, lng, contact, owner) SELECT f, 'pharmacy ' || f, 'address', 14, -87, 'contact', f FROM generate_series(1000000, 1000000 + :rows - 1) f;
+INSERT INTO pharmaguide.pharmacy_image (name, digest, pharmacy_id) SELECT 'f' || f || '-' || i, md5(f::text), f FROM generate_series(1000000, 1000000 + :rows - 1) f, generate_series(1, 3) i;
+INSERT INTO pharmaguide.product (product_id, name, code, description) SELECT p, 'product ' || p, p::text, '' FROM generate_series(1000000, 1000000 + :rows - 1) p;
+INSERT INTO pharmaguide.product_image (name, digest, product_id) SELECT 'p' || p || '-' || i, md5(p::text), p FROM generate_series(1000000, 1000000 + :rows - 1) p, generate_series(1, 3) i;
+INSERT INTO pharmaguide.category_name (category_id, name) SELECT c, 'category ' || c FROM generate_series(1000000, 1000009) c;
+INSERT INTO pharmaguide.product_category (product_id, category_id) SELECT p, 1000000 + p % 10 FROM generate_series(1000000, 1000000 + :rows - 1) p;
+INSERT INTO pharmaguide.inventory (product_id, pharmacy_id, price, stock) SELECT p, p, 1, 1 FROM generate_series(1000000, 1000000 + :rows - 1) p;
+INSERT INTO pharmaguide.advertisement (advertisement_title, advertisement_description, advertisement_image, owner) SELECT 'ad', 'ad', md5(u::text), u FROM generate_series(1000000, 1000000 + :rows - 1) u
+'''
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self.version_lookups = 0
+
+    def reset(self):
+        self.count = 0
+        self.version_lookups = 0
+
+    def __call__(self, connection, cursor, statement, *args):
+        if statement == VERSIONS:
+            self.version_lookups += 1
+        elif not statement.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+            self.count += 1
+
+
+def run(rows):
+    connection = engine.connect()
+    transaction = connection.begin()
+    for statement in SEED.strip().split(';\n'):
+        connection.execute(text(statement), { 'rows' : rows })
+
+    async def shared_session():
+        yield ThreadedSession(Session(bind=connection, join_transaction_mode='create_savepoint', expire_on_commit=False))
+
+    app.dependency_overrides[get_session] = shared_session
+    counter = StatementCounter()
+    event.listen(engine, 'before_cursor_execute', counter)
+    results = []
+    try:
+        with TestClient(app) as client:
+            for path, budget in BUDGETS.items():
+                counter.reset()
+                response = client.get(path, params={ 'limit' : rows } if path.endswith('/') or path.count('/') == 2 else {})
+                response.raise_for_status()
+                results.append({ 'path' : path, 'statements' : counter.count, 'budget' : budget, 'version_lookups' : counter.version_lookups, 'ok' : counter.count <= budget and counter.version_lookups <= 1 })
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+        app.dependency_overrides.clear()
+        transaction.rollback()
+        connection.close()
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fail when a read endpoint issues more SQL statements than its budget.')
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    results = run(args.rows)
+    common.report('query_budget', results, args.output)
+    failed = [result['path'] for result in results if not result['ok']]
+    if failed:
+        print('over budget: ' + ', '.join(failed))
+        sys.exit(1)
@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import time
+import common
+from collections import namedtuple
+from decimal import Decimal
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from utils.models import Inventory, Pharmacy, PharmacyImage, Product, ProductImage
+from utils.serialization import INVENTORY_COLUMNS, PHARMACY_COLUMNS, PRODUCT_COLUMNS, attach_images, image_records, records
+from schemas.inventory import InventoryResponse
+from schemas.pharmacy import PharmacyResponse
+from schemas.product import ProductResponse
+
+def digest(number):
+    return f'{number:032x}'
+
+def columns(selected):
+    return namedtuple('Row', [column.key for column in selected])
+
+def products(size, images):
+    Row = columns(PRODUCT_COLUMNS)
+    instances, rows, image_rows = [], [], []
+    for id in range(size):
+        values = { 'product_id' : id, 'name' : f'Product {id}', 'code' : f'{id:012d}', 'description' : 'description ' * 10 }
+        names = [(f'{id}-{number}.webp', digest(id * images + number)) for number in range(images)]
+        instances.append(Product(**values, images=[ProductImage(name=name, digest=image_digest, product_id=id) for name, image_digest in names]))
+        rows.append(Row(**values))
+        image_rows.extend((id, name, image_digest) for name, image_digest in names)
+    return instances, rows, image_rows
+
+def pharmacies(size, images):
+    Row = columns(PHARMACY_COLUMNS)
+    instances, rows, image_rows = [], [], []
+    for id in range(size):
+        values = { 'pharmacy_id' : id, 'name' : f'Pharmacy {id}', 'address' : 'Address', 'contact' : '2222-0000', 'owner' : 1 }
+        lat, lng = Decimal('13.7') + Decimal(id) / 10000, Decimal('-89.2')
+        names = [(f'{id}-{number}.webp', digest(id * images + number)) for number in range(images)]
+        instances.append(Pharmacy(**values, lat=lat, lng=lng, images=[PharmacyImage(name=name, digest=image_digest, pharmacy_id=id) for name, image_digest in names]))
+        rows.append(Row(**values, lat=float(lat), lng=float(lng)))
+        image_rows.extend((id, name, image_digest) for name, image_digest in names)
+    return instances, rows, image_rows
+
+def inventories(size, images):
+    Row = columns(INVENTORY_COLUMNS)
+    instances, rows = [], []
+    for id in range(size):
+        values = { 'product_id' : id, 'pharmacy_id' : 1, 'stock' : id % 100 }
+        price = Decimal('1.25') + id % 50
+        instances.append(Inventory(**values, price=price))
+        rows.append(Row(**values, price=float(price)))
+    return instances, rows, None
+
+MODELS = {
+    'product' : (products, ProductResponse, ProductImage.product_id),
+    'pharmacy' : (pharmacies, PharmacyResponse, PharmacyImage.pharmacy_id),
+    'inventory' : (inventories, InventoryResponse, None),
+}
+
+async def response_model(field, instances):
+    return JSONResponse(await serialize_response(field=field, response_content=instances)).body
+
+def fast(rows, image_rows, column):
+    entities = records(rows)
+    if column is not None:
+        attach_images(entities, column.key, image_records(column, image_rows))
+    return ORJSONResponse(entities).body
+
+async def measure(name, size, images, repeat):
+    build, schema, column = MODELS[name]
+    instances, rows, image_rows = build(size, images)
+    field = create_response_field(name='Response', type_=list[schema])
+    await response_model(field, instances)
+    fast(rows, image_rows, column)
+    results = []
+    for mode in ('response_model', 'fast'):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if mode == 'fast':
+                body = fast(rows, image_rows, column)
+            else:
+                body = await response_model(field, instances)
+            samples.append((time.perf_counter() - start) * 1000 / size)
+        results.append({
+            'model' : name,
+            'mode' : mode,
+            'rows' : size,
+            'bytes' : len(body),
+            **common.summarize(samples),
+        })
+    results[1]['speedup'] = results[0]['p50_ms'] / results[1]['p50_ms']
+    return results
+
+async def run(models, size, images, repeat):
+    results = []
+    for name in models:
+        results.extend(await measure(name, size, images, repeat))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serialization cost of list responses, reported in ms per 1k rows.')
+    parser.add_argument('--models', nargs='+', choices=list(MODELS), default=list(MODELS))
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--images', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('serialization', asyncio.run(run(args.models, args.rows, args.images, args.repeat)), args.output)
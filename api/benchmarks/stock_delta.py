@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import time
+import common
+from sqlalchemy import text
+from main import app
+from utils.database import new_session
+from utils.stock import StockBuffer, stock_buffer
+
+SEED = '''
+INSERT INTO pharmaguide.product (product_id, name, code, description)
+SELECT p, 'Product ' || p, lpad(p::text, 12, '0'), '' FROM generate_series(1000000, 1000000 + :products - 1) p;
+INSERT INTO pharmaguide.user_type (id, user_type) VALUES (1000000, 'bench');
+INSERT INTO pharmaguide.user (user_id, name, type) VALUES (1000000, 'bench', 1000000);
+INSERT INTO pharmaguide.pharmacy (pharmacy_id, name, owner) VALUES (1000000, 'Pharmacy', 1000000);
+INSERT INTO pharmaguide.inventory (product_id, pharmacy_id, price, stock)
+SELECT p, 1000000, 1, 0 FROM generate_series(1000000, 1000000 + :products - 1) p
+'''
+
+CLEANUP = '''
+DELETE FROM pharmaguide.inventory WHERE product_id >= 1000000;
+DELETE FROM pharmaguide.pharmacy WHERE pharmacy_id = 1000000;
+DELETE FROM pharmaguide.user WHERE user_id = 1000000;
+DELETE FROM pharmaguide.user_type WHERE id = 1000000;
+DELETE FROM pharmaguide.product WHERE product_id >= 1000000
+'''
+
+async def execute(script, parameters = {}):
+    session = new_session()
+    try:
+        for statement in script.strip().split(';\n'):
+            await session.execute(text(statement), parameters)
+        await session.commit()
+    finally:
+        await session.close()
+
+async def total_stock():
+    session = new_session()
+    try:
+        return await session.scalar(text('SELECT sum(stock) FROM pharmaguide.inventory WHERE product_id >= 1000000'))
+    finally:
+        await session.close()
+
+async def sell(client, products, requests, buffered, latencies):
+    for number in range(requests):
+        params = { 'pharmacy_id' : 1000000, 'delta' : -1, 'buffered' : buffered }
+        start = time.perf_counter()
+        response = await client.patch(f'/inventory/{1000000 + number % products}/stock', params=params)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+class SlowBuffer(StockBuffer):
+    def __init__(self, interval):
+        super().__init__(interval)
+        self.writing = asyncio.Event()
+
+    async def write(self, batch):
+        self.writing.set()
+        await asyncio.sleep(0.1)
+        return await super().write(batch)
+
+async def shutdown_check():
+    before = await total_stock()
+    buffer = SlowBuffer(0.01)
+    buffer.start()
+    buffer.add(1000000, 1000000, -1)
+    await buffer.writing.wait()
+    buffer.add(1000000, 1000000, -5)
+    await buffer.stop()
+    applied = before - await total_stock()
+    assert applied == 6, f'shutdown wrote {applied} of 6 buffered units'
+    return { 'mode' : 'shutdown', 'applied' : applied }
+
+async def run(products, clients, requests):
+    await execute(SEED, { 'products' : products })
+    results = []
+    try:
+        async with common.AppClient(app) as client:
+            for buffered in (False, True):
+                before = await total_stock()
+                latencies = []
+                start = time.perf_counter()
+                await asyncio.gather(*(sell(client, products, requests, buffered, latencies) for _ in range(clients)))
+                elapsed = time.perf_counter() - start
+                await stock_buffer.flush()
+                applied = before - await total_stock()
+                results.append({
+                    'mode' : 'buffered' if buffered else 'direct',
+                    'hot_rows' : products,
+                    'clients' : clients,
+                    'requests_per_s' : len(latencies) / elapsed,
+                    'applied' : applied,
+                    **common.summarize(latencies),
+                })
+        results.append(await shutdown_check())
+    finally:
+        await execute(CLEANUP)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent stock decrements on a few hot inventory rows, applied directly or buffered.')
+    parser.add_argument('--products', type=int, default=1)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('stock_delta', asyncio.run(run(args.products, args.clients, args.requests)), args.output)
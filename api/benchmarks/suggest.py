@@ -0,0 +1,79 @@
+import argparse
+import gc
+import random
+import tracemalloc
+import common
+from generate_data import BRANDS, DRUGS, FORMS, STRENGTHS
+from utils.suggest import PrefixIndex, normalize
+
+def catalog(products, seed):
+    rng = random.Random(seed)
+    return [(id, f'{rng.choice(DRUGS)} {rng.choice(STRENGTHS)} {rng.choice(FORMS)} {rng.choice(BRANDS)}'[:60], f'{id:012d}') for id in range(1, products + 1)]
+
+def brute_force(rows, prefix, k):
+    prefix = normalize(prefix)
+    ranked = {}
+    for id, name, code in rows:
+        for key in (normalize(name), normalize(code)):
+            if key.startswith(prefix):
+                ranked[id] = min(ranked.get(id, (len(key), key, id)), (len(key), key, id))
+    return [id for _, _, id in sorted(ranked.values())[:k]]
+
+def probes(rows, queries, seed):
+    rng = random.Random(seed)
+    work = []
+    for _ in range(queries):
+        id, name, code = rng.choice(rows)
+        if rng.random() < 0.2:
+            work.append(('code', code[:rng.randint(4, 12)]))
+        else:
+            work.append((f'name_{min(rng.randint(1, 8), len(name))}', name[:rng.randint(1, 8)]))
+    return work
+
+def footprint(products, seed):
+    gc.collect()
+    tracemalloc.start()
+    rows = catalog(products, seed)
+    index = PrefixIndex()
+    index.build(rows)
+    del rows
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+def run(products, queries, k, updates, seed):
+    rows = catalog(products, seed)
+    index = PrefixIndex()
+    build, _ = common.timed(index.build, rows)
+    size = footprint(products, seed)
+    latencies = {}
+    work = probes(rows, queries, seed)
+    for number, (kind, prefix) in enumerate(work):
+        elapsed, hits = common.timed(index.suggest, prefix, k)
+        latencies.setdefault(kind, []).append(elapsed)
+        if number < 10:
+            assert [hit['product_id'] for hit in hits] == brute_force(rows, prefix, k), prefix
+    added, removed = [], []
+    for id, name, code in catalog(updates, seed + 1):
+        elapsed, _ = common.timed(index.add, products + id, name, f'N{id:011d}')
+        added.append(elapsed)
+    for id in range(products + 1, products + updates + 1):
+        elapsed, _ = common.timed(index.remove, id)
+        removed.append(elapsed)
+    summary = { 'products' : products, 'build_s' : build, 'memory_mb' : size / 2 ** 20, 'bytes_per_product' : size / products }
+    return [summary] + [{ 'operation' : f'suggest_{kind}', **common.summarize(samples) } for kind, samples in sorted(latencies.items())] + [
+        { 'operation' : 'add', **common.summarize(added) },
+        { 'operation' : 'remove', **common.summarize(removed) },
+    ]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build time, memory and latency of the in-memory product prefix index.')
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    common.report('suggest', run(args.products, args.queries, args.k, args.updates, args.seed), args.output)